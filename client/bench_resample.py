@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""Playback resampling benchmark: cached polyphase resampler vs. librosa kaiser_best
+
+Resamples a few seconds of synthetic audio from the usual TTS output rates to the
+client's PLAYBACK_RATE and prints, per method,
+  1. the cost of the first call (filter design / numba compilation included),
+  2. the steady state cost per second of audio,
+  3. for the polyphase presets, the cost when fed in 20 ms streaming chunks and the
+     SNR against an ideally resampled test tone.
+librosa is only measured when it is installed.
+
+Usage: python bench_resample.py [seconds]
+"""
+import sys
+import time
+import numpy as np
+from utils.resample import QUALITY_PRESETS, PolyphaseResampler, polyphase_filter, resample
+
+PLAYBACK_RATE = 32000
+SOURCE_RATES = (16000, 22050, 24000, 44100)
+
+def _tone(seconds, sample_rate, frequency=1000.0):
+    return np.sin(2 * np.pi * frequency * np.arange(int(seconds * sample_rate)) / sample_rate).astype(np.float32)
+
+def _timed(function):
+    start = time.perf_counter()
+    result = function()
+    return time.perf_counter() - start, result
+
+def _best_of(function, repeat=5):
+    return min(_timed(function)[0] for _ in range(repeat))
+
+def _snr(output, reference, margin=500):
+    error = output[margin:-margin] - reference[margin:-margin]
+    return 10 * np.log10(np.mean(reference[margin:-margin] ** 2) / np.mean(error ** 2))
+
+def bench_resample(seconds=3.0):
+    """Prints first-call and steady state costs of every resampling method"""
+    try:
+        import librosa
+    except ImportError:
+        librosa = None
+        print("ℹ️ librosa is not installed, only the polyphase resampler is measured")
+    for src_rate in SOURCE_RATES:
+        audio = _tone(seconds, src_rate)
+        reference = _tone(seconds, PLAYBACK_RATE)
+        print(f"🔁 {src_rate} Hz -> {PLAYBACK_RATE} Hz, {seconds:.1f}s of audio")
+        if librosa is not None:
+            first, output = _timed(lambda: librosa.resample(audio, orig_sr=src_rate, target_sr=PLAYBACK_RATE,
+                                                            res_type="kaiser_best"))
+            steady = _best_of(lambda: librosa.resample(audio, orig_sr=src_rate, target_sr=PLAYBACK_RATE,
+                                                       res_type="kaiser_best"))
+            print(f"   librosa kaiser_best  first call {first * 1000:8.1f} ms, "
+                  f"{steady / seconds * 1000:7.2f} ms/s, SNR {_snr(output[:len(reference)], reference):6.1f} dB")
+        chunk = src_rate // 50
+        for quality in QUALITY_PRESETS:
+            polyphase_filter.cache_clear()
+            first, output = _timed(lambda: resample(audio, src_rate, PLAYBACK_RATE, quality))
+            steady = _best_of(lambda: resample(audio, src_rate, PLAYBACK_RATE, quality))
+            resampler = PolyphaseResampler(src_rate, PLAYBACK_RATE, quality)
+
+            def stream():
+                resampler.reset()
+                for start in range(0, len(audio), chunk):
+                    resampler.process(audio[start:start + chunk])
+                resampler.flush()
+            streaming = _best_of(stream)
+            print(f"   polyphase {quality:9s} first call {first * 1000:8.1f} ms, "
+                  f"{steady / seconds * 1000:7.2f} ms/s, 20 ms chunks {streaming / seconds * 1000:7.2f} ms/s, "
+                  f"SNR {_snr(output, reference):6.1f} dB, latency {resampler.latency * 1000:.2f} ms")
+
+if __name__ == "__main__":
+    bench_resample(float(sys.argv[1]) if len(sys.argv) > 1 else 3.0)
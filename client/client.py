@@ -7,14 +7,21 @@ from datetime import datetime, timezone
 import speech_recognition as sr
 import numpy as np
 import sounddevice as sd
-import struct # <-- 添加导入
-import wave  # <-- 添加导入
-import io    # <-- 添加导入
-import librosa # <--- 添加librosa导入
+import json
+import os
+import sys
+# 客户端和服务端共用的模块 (仓库根目录下的 shared/)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from utils.print_audio import print_sound, get_volume_norm, convert_and_normalize
-import os # 导入os模块
+from utils.playback import PlaybackEngine
+from utils.resample import QUALITY_PRESETS
+from utils.buffer_pool import BufferPool
+from utils.capture import SilenceGate, StreamCapture
+from shared.codecs import available_codecs, pack_audio, pcm16_to_wav, unpack_audio, wav_info
+from shared.protocol import (MessageType, ProtocolError, LEGACY_HEADER, HEADER as FRAME_HEADER,
+                             VERSION as PROTOCOL_VERSION, decode_header, encode_frame, encode_json)
 
-HEADER_LENGTH = 8 # 定义头部长度为常量
+HEADER_LENGTH = LEGACY_HEADER.size # 旧协议的长度头部 (8字节 !Q)
 
 class AudioSocketClient:
     """ Client for recording audio, streaming it to the server via sockets, receiving
@@ -22,6 +29,8 @@ class AudioSocketClient:
     CHANNELS = 1
     RECORDER_RATE = 16000 # 采样率给ASR模型
     PLAYBACK_RATE = 32000 # 采样率用于播放接收到的TTS音频 (基于假设)
+    # 播放重采样质量 (utils/resample.py: fast/balanced/best)
+    RESAMPLE_QUALITY = "balanced"
     CHUNK = 4096
     # Used for Speech Recognition library - set this higher for non-English languages
     PHRASE_TIME_LIMIT = 3  # 增加到3秒，给更多时间说话
@@ -29,7 +38,11 @@ class AudioSocketClient:
     PAUSE_THRESHOLD = 1.0  # 增加停顿检测时间，更容易检测到停顿
     # Volume for the microphone (降低阈值以提高敏感度)
     RECORDER_ENERGY_THRESHOLD = 800
-    def __init__(self) -> None:
+    # 连续采集模式 (capture_mode="stream") 每帧的时长，20-100 ms
+    CAPTURE_FRAME_MS = 40
+    def __init__(self, protocol="v2", upstream_codec="pcm16", downstream_codec="pcm16",
+                 resample_quality=RESAMPLE_QUALITY, capture_mode="phrase", frame_ms=CAPTURE_FRAME_MS,
+                 suppress_silence=True) -> None:
         # Prompt the user to select their devices
         self.input_device_index, self.output_device_index = sd.default.device
         print(sd.query_devices())
@@ -39,14 +52,27 @@ class AudioSocketClient:
             self.output_device_index = int(input("Type the index of the output microphone: "))
 
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        self.recorder = sr.Recognizer()
-        self.recorder.energy_threshold = self.RECORDER_ENERGY_THRESHOLD
-        """Definitely do this, dynamic energy compensation lowers the energy threshold dramatically 
-            to a point where the SpeechRecognizer never stops recording."""
-        self.recorder.dynamic_energy_threshold = False
-        self.recorder.pause_threshold = self.PAUSE_THRESHOLD
-        # 使用RECORDER_RATE进行录音
-        self.source = sr.Microphone(device_index=self.input_device_index, sample_rate=self.RECORDER_RATE)
+        # "phrase": speech_recognition按短语录音 (说完一句或满PHRASE_TIME_LIMIT才发送)；
+        # "stream": sd.InputStream连续采集，每 frame_ms 毫秒发送一帧，服务端边说边识别
+        self.capture_mode = capture_mode
+        self.capture = None
+        if capture_mode == "stream":
+            # 默认不发送静音帧: 服务端在 phrase_timeout 内没有收到音频才结束一句话，
+            # 连续发送静音时流式识别永远不会结束这句话
+            gate = SilenceGate(frame_ms, self.RECORDER_ENERGY_THRESHOLD) if suppress_silence else None
+            self.capture = StreamCapture(self.__send_captured__, self.RECORDER_RATE, frame_ms,
+                                         device=self.input_device_index, gate=gate)
+        elif capture_mode == "phrase":
+            self.recorder = sr.Recognizer()
+            self.recorder.energy_threshold = self.RECORDER_ENERGY_THRESHOLD
+            """Definitely do this, dynamic energy compensation lowers the energy threshold dramatically 
+                to a point where the SpeechRecognizer never stops recording."""
+            self.recorder.dynamic_energy_threshold = False
+            self.recorder.pause_threshold = self.PAUSE_THRESHOLD
+            # 使用RECORDER_RATE进行录音
+            self.source = sr.Microphone(device_index=self.input_device_index, sample_rate=self.RECORDER_RATE)
+        else:
+            raise ValueError(f"未知的采集模式: {capture_mode} (可选: phrase, stream)")
         self.transcription = [""]
         ### Debugging variables
         self.time_last_sent = None
@@ -57,6 +83,21 @@ class AudioSocketClient:
         # How much time since the last received packet to refresh the flush
         self.time_flush_received = 2
         self.time_phrase_sent = None # 用于记录短语发送时间以计算延迟
+        self.frames_received = 0
+        # "v2": 分帧协议 (shared/protocol.py)；"legacy": 旧格式 (上行裸PCM，下行 !Q 长度头 + WAV)
+        self.protocol = protocol
+        self.session_id = 0
+        # 每个方向的首选音频编码 (shared/codecs.py: pcm16/mulaw/adpcm/opus)，握手后为协商结果
+        self.upstream_codec = upstream_codec
+        self.downstream_codec = downstream_codec
+        if resample_quality not in QUALITY_PRESETS:
+            raise ValueError(f"未知的重采样质量: {resample_quality} (可选: {', '.join(QUALITY_PRESETS)})")
+        self.resample_quality = resample_quality
+        self.send_seq = 0
+        # 接收缓冲区: 帧头/长度头用固定缓冲区，负载从缓冲池取，播放完成后归还
+        self._header_buffer = bytearray(max(FRAME_HEADER.size, HEADER_LENGTH))
+        self.buffer_pool = BufferPool()
+        self._send_lock = threading.Lock()
         threading.Thread(target=self.__debug_worker__, daemon=True).start()
     def __del__(self):
         # Destroy Audio resources
@@ -68,31 +109,140 @@ class AudioSocketClient:
         data = audio.get_raw_data()
         self.time_last_sent = time.time()
         logging.debug("send audio data %f", self.time_last_sent)
-        self.socket.send(data)
+        self.send_audio(data)
         self.time_phrase_sent = time.time() # 记录短语发送时间
         # convert to np array for volume
         self.volume_input = get_volume_norm(
             convert_and_normalize(np.frombuffer(data, dtype=np.int16))
         )
 
-    def _recv_all_data(self, sock, n_bytes):
-        """辅助函数：确保从socket接收指定数量的字节，或者在连接关闭时返回None。"""
-        buffer = b''
-        while len(buffer) < n_bytes:
+    def __send_captured__(self, data: bytes, pcm: np.ndarray):
+        """ 连续采集模式下每一帧的发送回调 (在采集的发送线程中运行)"""
+        self.time_last_sent = time.time()
+        self.send_audio(data)
+        # 开启静音抑制时这是最后一帧语音的发送时间，否则是最近一帧的发送时间
+        self.time_phrase_sent = time.time()
+        self.volume_input = get_volume_norm(convert_and_normalize(pcm))
+
+    def _recv_all_data(self, sock, n_bytes, out=None):
+        """辅助函数：用recv_into把指定数量的字节直接收进缓冲区 (out，默认从缓冲池取)，
+            返回该缓冲区的memoryview，连接关闭时返回None。
+            缓冲池中的缓冲区用完后需要 self.buffer_pool.release() 归还。"""
+        view = self.buffer_pool.acquire(n_bytes) if out is None else memoryview(out)[:n_bytes]
+        received = 0
+        while received < n_bytes:
             try:
-                packet = sock.recv(min(n_bytes - len(buffer), self.CHUNK))
+                count = sock.recv_into(view[received:])
             except ConnectionResetError:
                 print("❌ 在 _recv_all_data 中连接被重置")
+                self.buffer_pool.release(view)
                 return None
             except socket.error as e:
                 print(f"❌ 在 _recv_all_data 中发生socket错误: {e}")
+                self.buffer_pool.release(view)
                 return None
-            
-            if not packet: # 套接字已关闭
+
+            if not count: # 套接字已关闭
                 print("ℹ️ 在 _recv_all_data 中检测到socket已关闭 (recv返回空)")
-                return None 
-            buffer += packet
-        return buffer
+                self.buffer_pool.release(view)
+                return None
+            received += count
+        return view
+
+    def send_audio(self, data: bytes):
+        """ 发送麦克风PCM: v2协议封装为AUDIO帧 (按协商的上行编码压缩)，旧协议直接发送裸PCM"""
+        if self.protocol == "v2":
+            if self.upstream_codec != "pcm16":
+                data = pack_audio(self.upstream_codec, np.frombuffer(data, dtype=np.int16), self.RECORDER_RATE)
+            with self._send_lock:
+                self.send_seq += 1
+                self.socket.sendall(encode_frame(MessageType.AUDIO, data, self.session_id, self.send_seq))
+        else:
+            self.socket.send(data)
+
+    def __read_frame__(self):
+        """ 读取一个v2帧，返回 (类型, 序号, 时间戳, 负载)，连接关闭或出错时返回None。
+            负载是缓冲池中缓冲区的memoryview"""
+        header_bytes = self._recv_all_data(self.socket, FRAME_HEADER.size, out=self._header_buffer)
+        if header_bytes is None:
+            return None
+        try:
+            msg_type, _, seq, timestamp, length = decode_header(header_bytes)
+        except ProtocolError as e_header:
+            print(f"❌ 解析帧头失败: {e_header}。接收到的头部: {bytes(header_bytes)!r}")
+            return None
+        payload = self._recv_all_data(self.socket, length) if length else memoryview(b"")
+        if payload is None:
+            print(f"🚫 接收 {length} bytes 的数据失败或连接中途关闭。")
+            return None
+        return msg_type, seq, timestamp, payload
+
+    def __handshake__(self, timeout=10.0):
+        """ v2握手: 发送HELLO (含每个方向的编码偏好)，等待WELCOME确定会话ID和编码"""
+        offer = {direction: [codec for codec in (preferred, "pcm16") if codec in available_codecs()]
+                 for direction, preferred in (("upstream", self.upstream_codec),
+                                              ("downstream", self.downstream_codec))}
+        self.socket.sendall(encode_json(MessageType.HELLO, {"version": PROTOCOL_VERSION,
+                                                            "sample_rate": self.RECORDER_RATE,
+                                                            "channels": self.CHANNELS,
+                                                            "codecs": offer}))
+        self.socket.settimeout(timeout)
+        try:
+            frame = self.__read_frame__()
+        finally:
+            self.socket.settimeout(None)
+        if frame is None or frame[0] != MessageType.WELCOME:
+            raise ConnectionError("服务器没有回复WELCOME，可能是不支持v2协议的旧版服务器 (请使用 --legacy)")
+        welcome = json.loads(bytes(frame[3]).decode("utf-8"))
+        self.buffer_pool.release(frame[3])
+        self.session_id = welcome.get("session_id", 0)
+        codecs = welcome.get("codecs", {})
+        self.upstream_codec = codecs.get("upstream", "pcm16")
+        self.downstream_codec = codecs.get("downstream", "pcm16")
+        print(f"🤝 服务器已确认v2协议，会话 {self.session_id}，上行编码 {self.upstream_codec}，下行编码 {self.downstream_codec}")
+
+    def __receive_audio__(self):
+        """ 接收下一段音频 (WAV字节，通常是缓冲池缓冲区的memoryview)，连接关闭或出错时返回None。
+            v2协议下途中收到的识别/翻译文本等消息直接打印"""
+        while True:
+            if self.protocol != "v2":
+                print("🎧 等待接收服务端音频头部...")
+                # 1. 接收数据长度头部
+                header_bytes = self._recv_all_data(self.socket, HEADER_LENGTH, out=self._header_buffer)
+                if header_bytes is None:
+                    return None
+                audio_data_length = LEGACY_HEADER.unpack(header_bytes)[0]
+                print(f"📨 收到头部，预期音频数据长度: {audio_data_length} bytes")
+                if audio_data_length == 0:
+                    print("ℹ️  收到长度为0的音频数据，视为空消息，继续等待。")
+                    continue
+                # 2. 接收实际的音频数据
+                print(f"⬇️ 开始接收 {audio_data_length} bytes 的音频数据...")
+                return self._recv_all_data(self.socket, audio_data_length)
+
+            frame = self.__read_frame__()
+            if frame is None:
+                return None
+            msg_type, seq, timestamp, payload = frame
+            if msg_type == MessageType.AUDIO:
+                print(f"📨 收到音频帧 #{seq} ({len(payload)} bytes, 传输+排队 {time.time() - timestamp:.3f}s)")
+                if self.downstream_codec != "pcm16":
+                    # 解码为PCM后封装成WAV，后面的保存/播放流程不变
+                    wav_bytes = pcm16_to_wav(*unpack_audio(payload))
+                    self.buffer_pool.release(payload)
+                    return wav_bytes
+                return payload
+            message = json.loads(bytes(payload).decode("utf-8")) if payload else {}
+            self.buffer_pool.release(payload)
+            if msg_type == MessageType.PARTIAL:
+                print(f"📝 识别中: {message.get('text', '')}")
+            elif msg_type == MessageType.TRANSCRIPT:
+                print(f"📝 识别结果: {message.get('text', '')}  →  {message.get('translation', '')}")
+            elif msg_type == MessageType.BYE:
+                print("ℹ️ 服务器结束了会话")
+                return None
+            else:
+                print(f"ℹ️ 收到 {msg_type.name}: {message}")
 
     def start(self, ip, port):
         """ Starts the client service """
@@ -100,68 +250,51 @@ class AudioSocketClient:
         print(f"Attempting to connect to IP {ip}, port {port}")
         self.socket.connect((ip, port))
         print(f"Successfully connected to IP {ip}, port {port}.")
+        if self.protocol == "v2":
+            # 握手完成后才开始录音，保证所有音频帧都使用协商好的编码
+            self.__handshake__()
 
-        with self.source:
-            self.recorder.adjust_for_ambient_noise(self.source)
-        self.recorder.listen_in_background(self.source,
-                                           self.record_callback,
-                                           phrase_time_limit=self.PHRASE_TIME_LIMIT)
-        print('''Listening now...\nNote: The input microphone records
+        if self.capture:
+            self.capture.start()
+            print(f"Listening now (continuous capture, {self.capture.frame_samples} samples per frame"
+                  f"{', silence suppressed' if self.capture.gate else ''})...")
+        else:
+            with self.source:
+                self.recorder.adjust_for_ambient_noise(self.source)
+            self.recorder.listen_in_background(self.source,
+                                               self.record_callback,
+                                               phrase_time_limit=self.PHRASE_TIME_LIMIT)
+            print('''Listening now...\nNote: The input microphone records
               in very large packets, so the volume meter won't move as much.''')
         self.volume_print_worker = threading.Thread(target=self.__volume_print_worker__,
                                                     daemon=True)
         self.volume_print_worker.start()
 
-        # OutputStream应该在最外层，因为它管理音频输出设备
+        # 播放由音频回调从抖动缓冲区取数据，接收循环只负责入队，播放期间继续接收下一段
         # 使用PLAYBACK_RATE进行播放
-        with sd.OutputStream(samplerate=self.PLAYBACK_RATE, 
-                    channels=self.CHANNELS, 
-                    dtype=np.float32, 
-                    device=self.output_device_index,
-                    ) as audio_output: 
+        self.player = PlaybackEngine(self.PLAYBACK_RATE, self.CHANNELS, device=self.output_device_index,
+                                     resample_quality=self.resample_quality)
+        with self.player:
             try:
                 while True: 
-                    print("🎧 等待接收服务端音频头部...")
-                    
-                    # 1. 接收数据长度头部
-                    header_bytes = self._recv_all_data(self.socket, HEADER_LENGTH)
-                    if header_bytes is None:
-                        print("🚫 接收头部失败或连接已关闭。客户端将退出。")
-                        break # 跳出主循环
-                    
-                    try:
-                        audio_data_length = struct.unpack("!Q", header_bytes)[0]
-                        print(f"📨 收到头部，预期音频数据长度: {audio_data_length} bytes")
-                    except struct.error as e_unpack:
-                        print(f"❌ 解包头部失败: {e_unpack}。接收到的头部: {header_bytes!r}")
-                        break # 跳出主循环
-
-                    if audio_data_length == 0:
-                        print("ℹ️  收到长度为0的音频数据，视为空消息，继续等待。")
-                        continue # 继续外层循环，等待下一个头部
-
-                    # 2. 接收实际的音频数据
-                    print(f"⬇️ 开始接收 {audio_data_length} bytes 的音频数据...")
-                    full_received_data = self._recv_all_data(self.socket, audio_data_length)
-                    
+                    full_received_data = self.__receive_audio__()
                     if full_received_data is None:
-                        print(f"🚫 接收 {audio_data_length} bytes 的音频数据失败或连接中途关闭。客户端将退出。")
+                        print("🚫 接收失败或连接已关闭。客户端将退出。")
+                        # 播完缓冲区里剩下的音频再退出
+                        self.player.drain()
                         break # 跳出主循环
                     
-                    if len(full_received_data) < audio_data_length:
-                        print(f"⚠️ 接收到的音频数据不完整。预期 {audio_data_length}, 收到 {len(full_received_data)}. 将尝试处理已接收部分。")
-                        # 这种情况理论上不应由_recv_all_data返回，除非_recv_all_data逻辑有误或中途发生非致命错误
-                        # 但为保险起见，保留一个检查和日志
-                    
                     # time_audio_received = time.time() # 记录音频接收时间 # 旧的逻辑，确保它不干扰新的计时
                     # if self.time_phrase_sent: # 旧的逻辑
                     #     latency = time_audio_received - self.time_phrase_sent
                     #     print(f"⏱️ 音频处理延迟: {latency:.3f} 秒 (从发送到接收)")
                     #     self.time_phrase_sent = None # 旧的重置位置
                     
+                    # 流式TTS时每个片段是一帧独立的WAV，收到即播放，不等待整句合成完成
                     timestamp = int(time.time())
-                    print(f"🟢 完整音频数据接收完毕 (批次 {timestamp})，总大小: {len(full_received_data)} bytes")
-                    output_filename = f"client_received_audio_{timestamp}.wav"
+                    self.frames_received += 1
+                    print(f"🟢 完整音频数据接收完毕 (批次 {timestamp}, 第 {self.frames_received} 帧)，总大小: {len(full_received_data)} bytes")
+                    output_filename = f"client_received_audio_{timestamp}_{self.frames_received}.wav"
                     try:
                         with open(output_filename, 'wb') as f_out:
                             f_out.write(full_received_data)
@@ -172,67 +305,50 @@ class AudioSocketClient:
                     # 开始播放接收到的音频
                     print(f"▶️ 尝试播放接收到的音频: {output_filename}")
                     try:
-                        with io.BytesIO(full_received_data) as wav_bytes_io:
-                            with wave.open(wav_bytes_io, 'rb') as wf:
-                                wav_framerate = wf.getframerate()
-                                wav_channels = wf.getnchannels()
-                                wav_sampwidth = wf.getsampwidth()
-                                num_frames = wf.getnframes()
-                                pcm_data_bytes = wf.readframes(num_frames)
+                        # 直接从接收缓冲区解析WAV头，PCM数据以numpy视图读取，不经过BytesIO/wave复制
+                        wav_framerate, wav_channels, wav_sampwidth, data_offset, data_length = wav_info(full_received_data)
+                        num_frames = data_length // (wav_channels * wav_sampwidth)
 
-                                print(f"   [WAV Info] 文件采样率: {wav_framerate}, 声道数: {wav_channels}, 位深: {wav_sampwidth*8}-bit, 帧数: {num_frames}")
+                        print(f"   [WAV Info] 文件采样率: {wav_framerate}, 声道数: {wav_channels}, 位深: {wav_sampwidth*8}-bit, 帧数: {num_frames}")
 
-                                if wav_channels != self.CHANNELS:
-                                    print(f"❌ 错误: WAV文件声道数 ({wav_channels}) 与播放器预设声道数 ({self.CHANNELS}) 不匹配! 无法正确播放.")
-                                elif wav_sampwidth != 2: # 2 bytes = 16-bit PCM
-                                    print(f"❌ 错误: WAV文件样本宽度 ({wav_sampwidth} bytes) 不是预期的2 bytes (16-bit PCM)! 无法正确播放.")
-                                else:
-                                    # 将16-bit PCM字节数据转换为 int16 NumPy 数组
-                                    audio_pcm_int16 = np.frombuffer(pcm_data_bytes, dtype=np.int16)
-                                    
-                                    # 首先将原始PCM转换为目标播放器期望的float32格式，此时仍是原始采样率
-                                    audio_float32_original_sr = audio_pcm_int16.astype(np.float32) / 32768.0
-                                    
-                                    # 默认情况下，要播放的音频就是这个原始采样率的音频
-                                    audio_to_play_float32 = audio_float32_original_sr 
+                        if wav_channels != self.CHANNELS:
+                            print(f"❌ 错误: WAV文件声道数 ({wav_channels}) 与播放器预设声道数 ({self.CHANNELS}) 不匹配! 无法正确播放.")
+                        elif wav_sampwidth != 2: # 2 bytes = 16-bit PCM
+                            print(f"❌ 错误: WAV文件样本宽度 ({wav_sampwidth} bytes) 不是预期的2 bytes (16-bit PCM)! 无法正确播放.")
+                        else:
+                            # 将16-bit PCM数据以 int16 NumPy 视图读取，直接指向接收缓冲区
+                            audio_pcm_int16 = np.frombuffer(full_received_data, dtype="<i2",
+                                                            count=data_length // 2, offset=data_offset)
+                            
+                            # 首先将原始PCM转换为目标播放器期望的float32格式，此时仍是原始采样率
+                            audio_float32_original_sr = audio_pcm_int16.astype(np.float32) / 32768.0
 
-                                    if wav_framerate != self.PLAYBACK_RATE:
-                                        print(f"   ⚠️ [重采样] WAV文件采样率 ({wav_framerate}Hz) 与播放器预设采样率 ({self.PLAYBACK_RATE}Hz) 不同。正在尝试重采样...")
-                                        try:
-                                            # librosa.resample 的参数是 (y, orig_sr, target_sr)
-                                            # y 是一个numpy数组，浮点型
-                                            audio_to_play_float32 = librosa.resample(audio_float32_original_sr, 
-                                                                                     orig_sr=wav_framerate, 
-                                                                                     target_sr=self.PLAYBACK_RATE,
-                                                                                     res_type='kaiser_best') # 明确指定重采样算法
-                                            print(f"      ✅ [重采样] 音频已从 {wav_framerate}Hz 重采样到 {self.PLAYBACK_RATE}Hz.")
-                                        except Exception as e_resample:
-                                            print(f"      ❌ [重采样] 失败: {e_resample}.")
-                                            print(f"         将尝试以原始采样率数据播放（可能导致播放速度不正确）。")
-                                            # 如果重采样失败, audio_to_play_float32 保持为 audio_float32_original_sr
-                                    
-                                    # 如果WAV是立体声但我们只期望单声道，这里可以简单取一个声道，但这已由上面的channels检查阻止
-                                    # if wav_channels == 2 and self.CHANNELS == 1:
-                                    #    audio_to_play_float32 = audio_to_play_float32[::2] # 取左声道
 
-                                    print(f"   [播放] 准备播放 {len(audio_to_play_float32)} 个采样点 (float32) 至设备 (配置为 {self.PLAYBACK_RATE}Hz)")
-                                    
-                                    time_playback_starts = time.time() # 记录播放开始时间
-                                    if self.time_phrase_sent:
-                                        latency_to_playback = time_playback_starts - self.time_phrase_sent
-                                        print(f"⏱️⏱️ 端到端延迟 (发送 -> 开始播放): {latency_to_playback:.3f} 秒")
-                                        self.time_phrase_sent = None # 重置，为下一段语音计时做准备
+                            if wav_framerate != self.PLAYBACK_RATE:
+                                # 多相滤波器按 (原采样率, 目标采样率, 质量) 缓存，只在第一次遇到该采样率时设计
+                                print(f"   ⚠️ [重采样] WAV文件采样率 ({wav_framerate}Hz) 与播放器预设采样率 ({self.PLAYBACK_RATE}Hz) 不同，入队时重采样到 {self.PLAYBACK_RATE}Hz")
 
-                                    audio_output.write(audio_to_play_float32)
-                                    print(f"   [播放] 音频已发送到播放设备。")
+                            # 放入抖动缓冲区后立即返回 (与前一段无缝衔接并做短交叉淡化)，音频回调负责实际播放
+                            queued_ahead = self.player.play(audio_float32_original_sr, wav_framerate)
+                            print(f"   [播放] {num_frames} 个采样点已放入播放缓冲区，前面还有 {queued_ahead:.3f}s 待播放")
+                            logging.debug("playback stats %s", self.player.stats())
 
-                    except wave.Error as e_wave:
+                            time_playback_starts = time.time() + queued_ahead # 预计开始播放的时间
+                            if self.time_phrase_sent:
+                                latency_to_playback = time_playback_starts - self.time_phrase_sent
+                                print(f"⏱️⏱️ 端到端延迟 (发送 -> 开始播放，含缓冲区排队): {latency_to_playback:.3f} 秒")
+                                self.time_phrase_sent = None # 重置，为下一段语音计时做准备
+
+                    except ValueError as e_wave:
                         print(f"❌ 读取WAV数据失败: {e_wave}. 文件可能不是有效的WAV格式或者已损坏.")
                     except Exception as e_play:
                         print(f"❌ 播放音频时发生未知错误: {e_play}")
                         import traceback
                         traceback.print_exc()
-                    
+                    finally:
+                        # 抖动缓冲区保存的是副本，接收缓冲区可以归还缓冲池
+                        self.buffer_pool.release(full_received_data)
+
                     # print("⚠️  当前版本仅保存接收到的音频，未进行播放。") # 此行可以移除了
 
             except KeyboardInterrupt:
@@ -247,6 +363,10 @@ class AudioSocketClient:
                 import traceback
                 traceback.print_exc()
             finally:
+                if self.capture:
+                    self.capture.stop()
+                    print(f"📊 采集统计: {self.capture.stats()}")
+                print(f"📊 播放统计: {self.player.stats()}")
                 print("🔌 关闭socket连接...")
                 try:
                     self.socket.shutdown(socket.SHUT_RDWR)
@@ -314,7 +434,20 @@ if __name__ == "__main__":
     # Hide cursor in terminal:
     print('\033[?25l', end="")
     # Start server
-    client = AudioSocketClient()
+    import sys
+    # --legacy: 连接旧版服务器 (不支持v2分帧协议)
+    # --upstream-codec=adpcm / --downstream-codec=mulaw: 每个方向的音频编码 (默认不压缩)
+    # --resample-quality=fast|balanced|best: 播放重采样的质量/延迟档位
+    # --capture=stream: 连续采集 (默认phrase按短语录音)；--frame-ms=40: 每帧时长；
+    #   --no-suppress-silence: 连续采集时也发送静音帧 (默认不发送，服务端靠停顿结束一句话)
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    client = AudioSocketClient(protocol="legacy" if "--legacy" in sys.argv else "v2",
+                               upstream_codec=options.get("upstream-codec", "pcm16"),
+                               downstream_codec=options.get("downstream-codec", "pcm16"),
+                               resample_quality=options.get("resample-quality", AudioSocketClient.RESAMPLE_QUALITY),
+                               capture_mode=options.get("capture", "phrase"),
+                               frame_ms=int(options.get("frame-ms", AudioSocketClient.CAPTURE_FRAME_MS)),
+                               suppress_silence="--no-suppress-silence" not in sys.argv)
     client.start('localhost', 4444)
     # Show cursor again:
     print('\033[?25h', end="")
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""测试连续采集 (utils/capture.py): 说话之后的静音不发送，服务端能结束这句话
+
+不需要麦克风和服务器: 把合成的音频帧交给 StreamCapture 的发送线程，按帧的时间记录
+哪些帧发送到了服务端，再按服务端识别器的规则判断一句话什么时候结束:
+超过 PHRASE_TIMEOUT 秒没有收到音频 (models/speech_recognition.py __flush_last_phrase__)。
+用法: python test_capture.py  (或 python -m pytest test_capture.py)
+"""
+import numpy as np
+from utils.capture import SilenceGate, StreamCapture
+
+SAMPLE_RATE = 16000
+FRAME_MS = 40
+ENERGY_THRESHOLD = 800
+PHRASE_TIMEOUT = 1.0  # 服务端识别器的 phrase_timeout
+
+def _frames(speech_seconds, silence_seconds):
+    """ (时间, int16帧): 先说话 (RMS约2100)，再静音 (只有很小的噪声)"""
+    rng = np.random.default_rng(0)
+    frame_samples = SAMPLE_RATE * FRAME_MS // 1000
+    speech_frames = int(speech_seconds * 1000) // FRAME_MS
+    frames = []
+    for i in range(speech_frames + int(silence_seconds * 1000) // FRAME_MS):
+        t = np.arange(i * frame_samples, (i + 1) * frame_samples) / SAMPLE_RATE
+        amplitude = 3000 if i < speech_frames else 0
+        pcm = amplitude * np.sin(2 * np.pi * 220 * t) + rng.normal(0, 30, frame_samples)
+        frames.append((i * FRAME_MS / 1000, pcm.astype(np.int16)))
+    return frames
+
+def _capture(frames, gate):
+    """ 每帧经过 StreamCapture 的发送线程，返回发送到服务端的帧的时间"""
+    sent_at = []
+    clock = [0.0]
+    capture = StreamCapture(lambda data, pcm: sent_at.append(clock[0]), SAMPLE_RATE, FRAME_MS, gate=gate)
+    for clock[0], pcm in frames:
+        capture._queue.put(pcm)
+        capture._queue.put(None)
+        capture.__sender__()
+    return sent_at, capture
+
+def _phrase_end(sent_at, until):
+    """ 服务端结束这句话的时间: 最后一帧之后 PHRASE_TIMEOUT 秒，在 until 之前没结束时为 None"""
+    for previous, current in zip(sent_at, sent_at[1:] + [until]):
+        if current - previous > PHRASE_TIMEOUT:
+            return previous + PHRASE_TIMEOUT
+    return None
+
+def test_phrase_finalized_after_silence():
+    """说话1.5秒后静音3秒: 静音只发送 hangover 部分，服务端在停顿后结束这句话"""
+    frames = _frames(1.5, 3.0)
+    sent_at, capture = _capture(frames, SilenceGate(FRAME_MS, ENERGY_THRESHOLD))
+    end = _phrase_end(sent_at, until=4.5)
+    assert end is not None, "phrase was never finalized"
+    # 停顿后 hangover (300 ms) + phrase_timeout 内结束
+    assert 1.5 + PHRASE_TIMEOUT <= end <= 1.5 + 0.3 + PHRASE_TIMEOUT + FRAME_MS / 1000, end
+    assert capture.stats()["suppressed"] > 0, capture.stats()
+    print(f"✅ 静音抑制: 这句话在 {end:.2f}s 结束 (说话到 1.50s)，{capture.stats()}")
+
+def test_continuous_silence_never_ends_phrase():
+    """不抑制静音时每帧都发送，服务端永远等不到停顿 (这就是连续采集默认开启 SilenceGate 的原因)"""
+    frames = _frames(1.5, 3.0)
+    sent_at, capture = _capture(frames, gate=None)
+    assert len(sent_at) == len(frames)
+    assert _phrase_end(sent_at, until=4.5) is None
+    print(f"✅ 不抑制静音: 发送了全部 {len(sent_at)} 帧，这句话没有结束")
+
+def test_speech_after_silence_keeps_preroll():
+    """静音之后再说话时，说话前 preroll 的帧和第一帧一起发送"""
+    frames = _frames(0.5, 1.5)
+    frames += [(t + 2.0, pcm) for t, pcm in _frames(0.5, 0.0)]
+    gate = SilenceGate(FRAME_MS, ENERGY_THRESHOLD, preroll_ms=100)
+    sent_at, _ = _capture(frames, gate)
+    resumed = [t for t in sent_at if t >= 2.0]
+    assert sent_at.count(2.0) == 1 + 100 // FRAME_MS, sent_at
+    assert len(resumed) == 0.5 * 1000 // FRAME_MS + 100 // FRAME_MS
+    print(f"✅ 预录: 恢复说话时多发送 {100 // FRAME_MS} 帧")
+
+if __name__ == "__main__":
+    print("🧪 测试连续采集的静音抑制")
+    test_phrase_finalized_after_silence()
+    test_continuous_silence_never_ends_phrase()
+    test_speech_after_silence_keeps_preroll()
+    print("🎉 全部通过")
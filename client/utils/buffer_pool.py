@@ -0,0 +1,48 @@
+""" Reusable receive buffers, so every received utterance does not allocate (and
+    grow) a new buffer"""
+import threading
+
+class BufferPool:
+    """ Free lists of bytearrays in power of two size classes. acquire(n) returns a
+        memoryview of exactly n bytes over a pooled buffer, release() hands the buffer
+        back once nothing reads the view any more (numpy arrays created with
+        np.frombuffer on the view share its memory)."""
+    MIN_SIZE = 4096
+
+    def __init__(self, max_per_size=4, max_size=16 << 20):
+        self.max_per_size = max_per_size
+        # Larger buffers are allocated per request and not kept
+        self.max_size = max_size
+        self._free = {}
+        self._lock = threading.Lock()
+        self.allocated = 0
+        self.reused = 0
+
+    def _size_class(self, n_bytes) -> int:
+        return max(self.MIN_SIZE, 1 << (n_bytes - 1).bit_length())
+
+    def acquire(self, n_bytes) -> memoryview:
+        size = self._size_class(n_bytes)
+        with self._lock:
+            free = self._free.get(size)
+            if free:
+                self.reused += 1
+                return memoryview(free.pop())[:n_bytes]
+            self.allocated += 1
+        return memoryview(bytearray(size if size <= self.max_size else n_bytes))[:n_bytes]
+
+    def release(self, view):
+        """ Returns the buffer behind a view from acquire(), other objects are ignored"""
+        buffer = view.obj if isinstance(view, memoryview) else view
+        if not isinstance(buffer, bytearray) or len(buffer) > self.max_size \
+                or len(buffer) != self._size_class(len(buffer)):
+            return
+        with self._lock:
+            free = self._free.setdefault(len(buffer), [])
+            if len(free) < self.max_per_size and all(b is not buffer for b in free):
+                free.append(buffer)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"allocated": self.allocated, "reused": self.reused,
+                    "pooled_bytes": sum(size * len(free) for size, free in self._free.items())}
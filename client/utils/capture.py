@@ -0,0 +1,99 @@
+""" Continuous microphone capture in short frames, as an alternative to the phrase
+    based recording of speech_recognition's listen_in_background"""
+import queue
+import threading
+from collections import deque
+import numpy as np
+
+class SilenceGate:
+    """ Client-side silence suppression on frame RMS (int16 units, the same scale as
+        speech_recognition's energy_threshold). Frames are passed while speech is
+        detected and for hangover_ms after it, preroll_ms of the frames before speech
+        are sent along with its first frame. Like the server's VAD stage it sends no
+        silence at all, the recognizers detect the end of a phrase by the pause."""
+    def __init__(self, frame_ms, energy_threshold=800, hangover_ms=300, preroll_ms=100):
+        self.energy_threshold = energy_threshold
+        self.hangover_frames = max(1, hangover_ms // frame_ms)
+        self.preroll = deque(maxlen=max(0, preroll_ms // frame_ms))
+        self.silent_frames = self.hangover_frames + 1
+        self.suppressed = 0
+
+    def process(self, pcm: np.ndarray) -> list:
+        """ int16 frame in, list of frames to send out (empty while silent)"""
+        rms = np.sqrt(np.mean(np.square(pcm, dtype=np.float32)))
+        if rms >= self.energy_threshold:
+            frames = list(self.preroll) + [pcm] if self.silent_frames > self.hangover_frames else [pcm]
+            self.preroll.clear()
+            self.silent_frames = 0
+            return frames
+        self.silent_frames += 1
+        if self.silent_frames <= self.hangover_frames:
+            return [pcm]
+        if self.preroll.maxlen:
+            self.preroll.append(pcm)
+        self.suppressed += 1
+        return []
+
+class StreamCapture:
+    """ sounddevice InputStream delivering int16 frames of frame_ms milliseconds.
+        The audio callback only queues the frame, a sender thread runs the optional
+        SilenceGate and calls send(bytes, pcm), so a slow socket never blocks the
+        audio device. Frames are dropped (and counted) when the queue is full."""
+    def __init__(self, send, sample_rate=16000, frame_ms=40, device=None, gate=None, max_queued=50):
+        if not 20 <= frame_ms <= 100:
+            raise ValueError(f"frame_ms must be between 20 and 100, got {frame_ms}")
+        self.send = send
+        self.sample_rate = sample_rate
+        self.frame_samples = sample_rate * frame_ms // 1000
+        self.device = device
+        self.gate = gate
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._stream = None
+        self._sender = None
+        self.frames_captured = 0
+        self.frames_sent = 0
+        self.frames_dropped = 0
+        self.overflows = 0
+
+    def __callback__(self, indata, frames, time_info, status):
+        if status.input_overflow:
+            self.overflows += 1
+        self.frames_captured += 1
+        try:
+            self._queue.put_nowait(indata[:, 0].copy())
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def __sender__(self):
+        while True:
+            pcm = self._queue.get()
+            if pcm is None:
+                return
+            for frame in (self.gate.process(pcm) if self.gate else [pcm]):
+                self.send(frame.tobytes(), frame)
+                self.frames_sent += 1
+
+    def start(self):
+        import sounddevice as sd
+        self._sender = threading.Thread(target=self.__sender__, daemon=True)
+        self._sender.start()
+        self._stream = sd.InputStream(samplerate=self.sample_rate, channels=1, dtype="int16",
+                                      blocksize=self.frame_samples, device=self.device,
+                                      latency="low", callback=self.__callback__)
+        self._stream.start()
+        return self
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+        if self._sender is not None:
+            self._queue.put(None)
+            self._sender.join(timeout=1.0)
+            self._sender = None
+
+    def stats(self) -> dict:
+        return {"captured": self.frames_captured, "sent": self.frames_sent,
+                "suppressed": self.gate.suppressed if self.gate else 0,
+                "dropped": self.frames_dropped, "overflows": self.overflows}
@@ -0,0 +1,203 @@
+""" Callback driven playback of received audio through a jitter buffer"""
+import threading
+import time
+from collections import deque
+import numpy as np
+from utils.resample import resample
+
+class JitterBuffer:
+    """ Thread-safe FIFO of float32 samples between the receive loop (push) and the
+        audio callback (read).
+
+        - Chunks pushed while earlier audio is still queued are joined gaplessly, the
+          seam is crossfaded over `crossfade` samples (raised cosine) to avoid clicks.
+          A chunk arriving after the buffer ran dry is faded in instead.
+        - After running dry, output resumes once `prebuffer` samples are queued or
+          the oldest queued sample has waited prebuffer / sample_rate seconds.
+        - Pushing beyond `capacity` samples drops the oldest audio (overrun).
+        - Running dry and receiving more audio within `underrun_window` seconds
+          counts as an underrun: an audible gap inside what should have been
+          continuous speech. Longer pauses are just silence between utterances.
+    """
+    def __init__(self, sample_rate, prebuffer=0.06, crossfade=0.005, capacity=30.0, underrun_window=1.0):
+        self.sample_rate = sample_rate
+        self.prebuffer = int(prebuffer * sample_rate)
+        self.capacity = int(capacity * sample_rate)
+        self.underrun_window = underrun_window
+        fade = int(crossfade * sample_rate)
+        self._fade_in = (np.sin(0.5 * np.pi * (np.arange(fade) + 0.5) / fade) ** 2).astype(np.float32) \
+            if fade else np.zeros(0, dtype=np.float32)
+        self._fade_out = self._fade_in[::-1].copy()
+        self._chunks = deque()
+        self._offset = 0  # samples of _chunks[0] already read
+        self._buffered = 0
+        self._lock = threading.Lock()
+        self._playing = False
+        self._waiting_since = None
+        self._starved_at = None
+        self.underruns = 0
+        self.underrun_seconds = 0.0
+        self.overruns = 0
+        self.dropped_samples = 0
+        self.played_samples = 0
+
+    @property
+    def buffered(self) -> float:
+        """ Seconds of audio queued"""
+        return self._buffered / self.sample_rate
+
+    def push(self, samples):
+        """ Queues float32 samples at sample_rate (copied, the caller keeps its array)"""
+        samples = np.array(samples, dtype=np.float32).reshape(-1)
+        if not len(samples):
+            return
+        fade = len(self._fade_in)
+        with self._lock:
+            if self._starved_at is not None:
+                gap = time.time() - self._starved_at
+                if gap < self.underrun_window:
+                    self.underruns += 1
+                    self.underrun_seconds += gap
+                self._starved_at = None
+            tail_available = len(self._chunks[-1]) - (self._offset if len(self._chunks) == 1 else 0) \
+                if self._chunks else 0
+            if fade and tail_available >= fade and len(samples) >= fade:
+                tail = self._chunks[-1][-fade:]
+                tail *= self._fade_out
+                tail += samples[:fade] * self._fade_in
+                samples = samples[fade:]
+            elif fade and not self._chunks:
+                head = min(fade, len(samples))
+                samples[:head] *= self._fade_in[:head]
+            if len(samples):
+                self._chunks.append(samples)
+                self._buffered += len(samples)
+            if not self._playing and self._waiting_since is None:
+                self._waiting_since = time.time()
+            overflow = self._buffered - self.capacity
+            if overflow > 0:
+                self.overruns += 1
+                self.dropped_samples += overflow
+                self.__discard__(overflow)
+
+    def __discard__(self, n):
+        while n > 0 and self._chunks:
+            available = len(self._chunks[0]) - self._offset
+            take = min(n, available)
+            self._offset += take
+            self._buffered -= take
+            n -= take
+            if take == available:
+                self._chunks.popleft()
+                self._offset = 0
+
+    def read(self, out) -> int:
+        """ Fills the 1-D float32 array `out` with queued samples and silence after them,
+            returns the number of queued samples written"""
+        with self._lock:
+            if not self._playing:
+                waited = self._waiting_since is not None and \
+                    time.time() - self._waiting_since >= self.prebuffer / self.sample_rate
+                if self._buffered and (self._buffered >= self.prebuffer or waited):
+                    self._playing = True
+                    self._waiting_since = None
+                else:
+                    out[:] = 0
+                    return 0
+            written = 0
+            while written < len(out) and self._chunks:
+                chunk = self._chunks[0]
+                take = min(len(out) - written, len(chunk) - self._offset)
+                out[written:written + take] = chunk[self._offset:self._offset + take]
+                written += take
+                self._offset += take
+                if self._offset == len(chunk):
+                    self._chunks.popleft()
+                    self._offset = 0
+            self._buffered -= written
+            self.played_samples += written
+            out[written:] = 0
+            if not self._chunks:
+                self._playing = False
+                self._starved_at = time.time()
+            return written
+
+    def clear(self):
+        with self._lock:
+            self._chunks.clear()
+            self._offset = 0
+            self._buffered = 0
+            self._playing = False
+            self._waiting_since = None
+            self._starved_at = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"buffered_s": round(self._buffered / self.sample_rate, 3),
+                    "played_s": round(self.played_samples / self.sample_rate, 3),
+                    "underruns": self.underruns,
+                    "underrun_gap_s": round(self.underrun_seconds, 3),
+                    "overruns": self.overruns,
+                    "dropped_s": round(self.dropped_samples / self.sample_rate, 3)}
+
+class PlaybackEngine:
+    """ sounddevice OutputStream whose callback pulls from a JitterBuffer, so play()
+        returns immediately and the receive loop keeps reading while audio plays.
+        Use as a context manager or call start() / stop()."""
+    def __init__(self, sample_rate, channels=1, device=None, blocksize=0, latency="low",
+                 resample_quality="balanced", **buffer_options):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.device = device
+        self.blocksize = blocksize
+        self.latency = latency
+        self.resample_quality = resample_quality
+        self.buffer = JitterBuffer(sample_rate, **buffer_options)
+        self.device_underflows = 0
+        self._stream = None
+
+    def __callback__(self, outdata, frames, time_info, status):
+        if status.output_underflow:
+            self.device_underflows += 1
+        mono = outdata[:, 0]
+        self.buffer.read(mono)
+        if self.channels > 1:
+            outdata[:, 1:] = mono[:, None]
+
+    def start(self):
+        import sounddevice as sd
+        self._stream = sd.OutputStream(samplerate=self.sample_rate, channels=self.channels, dtype=np.float32,
+                                       device=self.device, blocksize=self.blocksize, latency=self.latency,
+                                       callback=self.__callback__)
+        self._stream.start()
+        return self
+
+    def stop(self):
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def play(self, samples, sample_rate=None):
+        """ Queues float32 mono samples, resampled to the stream rate when needed.
+            Returns the seconds of audio queued ahead of them."""
+        if sample_rate and sample_rate != self.sample_rate:
+            samples = resample(samples, sample_rate, self.sample_rate, self.resample_quality)
+        ahead = self.buffer.buffered
+        self.buffer.push(samples)
+        return ahead
+
+    def drain(self, timeout=30.0):
+        """ Waits until the queued audio has played (or timeout seconds passed)"""
+        deadline = time.time() + timeout
+        while self.buffer.buffered > 0 and self._stream is not None and time.time() < deadline:
+            time.sleep(0.05)
+
+    def stats(self) -> dict:
+        return dict(self.buffer.stats(), device_underflows=self.device_underflows)
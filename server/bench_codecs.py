@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""Transport codec benchmark: encode/decode cost, bytes on the wire and quality
+
+Encodes a synthetic speech-like signal (harmonics with a moving pitch, syllable
+envelope and a little noise) at the upstream (16 kHz) and downstream (32 kHz) rates
+with every available codec and prints
+  1. encode and decode time per second of audio,
+  2. payload bytes per second of audio (kbit/s) and the ratio to 16-bit PCM,
+  3. SNR of the decoded signal against the input.
+
+Usage: python bench_codecs.py [seconds]
+"""
+import os
+import sys
+import time
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared/
+from shared.codecs import available_codecs, pack_audio, unpack_audio
+
+def _speech_like(seconds, sample_rate, seed=0):
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pitch = 140 + 30 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(pitch) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 12))
+    envelope = np.clip(np.sin(2 * np.pi * 3 * t), 0, None) ** 0.5
+    signal = 0.25 * voice * envelope + 0.01 * rng.standard_normal(len(t))
+    return (np.clip(signal, -1, 1) * 32767).astype(np.int16)
+
+def _best_of(function, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def bench_codecs(seconds=3.0):
+    """Prints the cost and size of every available codec at both transport rates"""
+    for direction, sample_rate in (("upstream", 16000), ("downstream", 32000)):
+        audio = _speech_like(seconds, sample_rate)
+        pcm_bytes = audio.nbytes
+        print(f"📦 {direction}, {sample_rate} Hz, {seconds:.1f}s ({pcm_bytes} bytes as PCM)")
+        for name in available_codecs():
+            encode_time, payload = _best_of(lambda: pack_audio(name, audio, sample_rate))
+            decode_time, (decoded, _) = _best_of(lambda: unpack_audio(payload))
+            error = audio.astype(np.float64) - decoded.astype(np.float64)
+            snr = 10 * np.log10(np.mean(audio.astype(np.float64) ** 2) / max(np.mean(error ** 2), 1e-12))
+            print(f"   {name:6s} encode {encode_time / seconds * 1000:6.2f} ms/s, "
+                  f"decode {decode_time / seconds * 1000:6.2f} ms/s, "
+                  f"{len(payload) * 8 / seconds / 1000:6.1f} kbit/s "
+                  f"({len(payload) / pcm_bytes:.0%} of PCM), SNR {snr:5.1f} dB")
+
+if __name__ == "__main__":
+    bench_codecs(float(sys.argv[1]) if len(sys.argv) > 1 else 3.0)
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""GPT-SoVITS request path benchmark: gradio_client.predict vs. GPTSoVITSGradioClient
+
+Needs a running GPT-SoVITS WebUI. Synthesizes the same short sentence N times with
+  1. gradio_client.Client.predict(ref_audio_path=file(...)) plus reading the returned
+     temp file, which is what the server used to do per call,
+  2. models/gpt_sovits_client.py (reference uploaded once, result kept in memory),
+and prints the mean wall time per call for both and, for the in-memory client, the
+overhead around synthesis (reference handling, submit, download).
+
+Usage: python bench_gpt_sovits_client.py [api_url] [calls]
+"""
+import os
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared/
+from gpt_sovits_config import GPTSoVITSConfig
+from models.gpt_sovits_client import GPTSoVITSGradioClient
+
+TEXT = "Hello, nice to meet you."
+
+def _params(config, prompt_text):
+    return {"text": TEXT, "text_lang": config.get_language("en"), "aux_ref_audio_paths": [],
+            "prompt_text": prompt_text, "prompt_lang": config.get_language("zh"),
+            "top_k": config.top_k, "top_p": config.top_p, "temperature": config.temperature,
+            "text_split_method": "不切", "batch_size": config.batch_size, "speed_factor": config.speed_factor,
+            "ref_text_free": config.ref_text_free, "split_bucket": config.split_bucket,
+            "fragment_interval": config.fragment_interval, "seed": 1.0, "keep_random": False,
+            "parallel_infer": config.parallel_infer, "repetition_penalty": config.repetition_penalty,
+            "sample_steps": config.sample_steps, "super_sampling": config.super_sampling}
+
+def bench_gpt_sovits_client(api_url, calls=5):
+    """Prints the mean per-call time of both request paths"""
+    config = GPTSoVITSConfig()
+    ref_wav_path = os.path.abspath(config.ref_wav_path)
+    ref_text_path = os.path.abspath(config.ref_text_path)
+
+    client = GPTSoVITSGradioClient(api_url)
+    params = _params(config, client.reference_text(ref_text_path))
+    # Warm up the model and the upload
+    client.synthesize(ref_audio_path=ref_wav_path, **params)
+    start = time.perf_counter()
+    for _ in range(calls):
+        client.synthesize(ref_audio_path=ref_wav_path, **params)
+    in_memory = (time.perf_counter() - start) / calls
+    stats = client.stats()
+
+    try:
+        from gradio_client import Client, file
+    except ImportError:
+        Client = None
+        print("ℹ️ gradio_client is not installed, only the in-memory client is measured")
+    if Client is not None:
+        gradio = Client(api_url, ssl_verify=False)
+        start = time.perf_counter()
+        for _ in range(calls):
+            with open(ref_text_path, "r", encoding="utf-8") as f:
+                prompt_text = f.read().strip()
+            output_path, _ = gradio.predict(**{**params, "prompt_text": prompt_text},
+                                            ref_audio_path=file(ref_wav_path), api_name="/inference")
+            with open(output_path, "rb") as f:
+                f.read()
+        print(f"🐢 gradio_client.predict     {(time.perf_counter() - start) / calls * 1000:8.1f} ms/call")
+    print(f"🚀 GPTSoVITSGradioClient     {in_memory * 1000:8.1f} ms/call, "
+          f"{stats['uploads']} reference upload(s) for {stats['calls']} calls")
+    print(f"   synthesis {stats['mean_generate'] * 1000:.1f} ms, overhead {stats['mean_overhead'] * 1000:.1f} ms "
+          f"(reference {stats['mean_prepare'] * 1000:.1f} ms, submit {stats['mean_submit'] * 1000:.1f} ms, "
+          f"download {stats['mean_download'] * 1000:.1f} ms)")
+
+if __name__ == "__main__":
+    bench_gpt_sovits_client(sys.argv[1] if len(sys.argv) > 1 else "http://localhost:9872",
+                            int(sys.argv[2]) if len(sys.argv) > 2 else 5)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""SpeechT5 throughput benchmark on CPU: serial synthesise_blocking vs. batched synthesise_batch
+
+Usage: python bench_tts_batching.py [batch_size] [rounds]
+"""
+import os
+# Benchmark on CPU, hide GPUs before torch is imported
+os.environ.setdefault("CUDA_VISIBLE_DEVICES", "")
+import sys
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared/
+from models.text_to_speech import TextToSpeechModel
+
+SAMPLE_RATE = 16000
+PHRASES = [
+    "Hello everyone, thanks for joining.",
+    "Can you hear me?",
+    "Let's go over the agenda for today.",
+    "I think we should ship it next week.",
+    "Could you share your screen please?",
+    "That sounds good to me.",
+    "We are running a little late.",
+    "Let's take a five minute break.",
+]
+
+def bench_tts_batching(batch_size=4, rounds=2):
+    """Synthesizes the same phrases serially and in batches and prints the throughput"""
+    tts = TextToSpeechModel(callback_function=lambda *args: None, audio_cache=False)
+    tts.load_speaker_embeddings()
+    texts = (PHRASES * rounds)[:max(batch_size, len(PHRASES)) * rounds]
+
+    # Warm up both paths so one-time initialization is not measured
+    tts.synthesise_blocking(texts[0])
+    tts.synthesise_batch(texts[:2])
+
+    start = time.time()
+    serial_samples = sum(len(tts.synthesise_blocking(text)) for text in texts)
+    serial_time = time.time() - start
+
+    start = time.time()
+    batched_samples = 0
+    for i in range(0, len(texts), batch_size):
+        batched_samples += sum(len(audio) for audio in tts.synthesise_batch(texts[i:i + batch_size]))
+    batched_time = time.time() - start
+
+    for name, elapsed, samples in (("serial", serial_time, serial_samples),
+                                   (f"batch={batch_size}", batched_time, batched_samples)):
+        print(f"📊 [{name:>8}] {len(texts)} phrases in {elapsed:.2f}s | "
+              f"{len(texts) / elapsed:.2f} phrases/s | "
+              f"{samples / SAMPLE_RATE / elapsed:.2f} s of audio per second")
+    print(f"🚀 Speedup: {serial_time / batched_time:.2f}x")
+    tts.stop()
+
+if __name__ == "__main__":
+    bench_tts_batching(int(sys.argv[1]) if len(sys.argv) > 1 else 4,
+                       int(sys.argv[2]) if len(sys.argv) > 2 else 2)
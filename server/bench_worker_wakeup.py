@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Wake-up latency benchmark: 50 ms polling worker loop vs. blocking queue worker loop
+
+Reproduces the two loop shapes of the recognizer/TTS workers without loading any model:
+  - polling: `if not queue.empty(): ...` followed by `time.sleep(0.05)` (old loops)
+  - blocking: `queue.get(timeout=<next phrase deadline>)` (current loops)
+and measures
+  1. the delay between putting a packet into the queue and the worker picking it up,
+  2. how late a phrase flush fires after its phrase_timeout deadline,
+  3. the CPU time the worker burns, including an idle period.
+
+Usage: python bench_worker_wakeup.py [packets]
+"""
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+from queue import Queue, Empty
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared/
+from models.session_manager import SessionManager
+
+POLL_INTERVAL = 0.05
+PHRASE_TIMEOUT = 0.3
+
+class _Worker:
+    """ Minimal stand-in for a recognizer worker thread"""
+    def __init__(self, blocking):
+        self.blocking = blocking
+        self.data_queue = Queue()
+        self.sessions = SessionManager()
+        self.session = self.sessions.open("client")
+        self.pickup_delays = []
+        self.flush_delays = []
+        self.cpu_time = 0.0
+        self._kill = False
+        self.thread = threading.Thread(target=self.run, daemon=True)
+
+    def run(self):
+        cpu_start = time.thread_time()
+        while not self._kill:
+            if self.blocking:
+                timeout = self.sessions.seconds_until_timeout(PHRASE_TIMEOUT, datetime.utcnow())
+                try:
+                    packets = [self.data_queue.get(timeout=timeout)]
+                except Empty:
+                    packets = []
+            else:
+                packets = []
+            self.flush(datetime.utcnow())
+            if not self.blocking and not self.data_queue.empty():
+                packets.append(self.data_queue.get())
+            for packet in packets:
+                if packet is None:
+                    continue
+                self.pickup_delays.append(time.perf_counter() - packet)
+                self.session.phrase_time = datetime.utcnow()
+                self.session.recent_transcription = "text"
+            if not self.blocking:
+                time.sleep(POLL_INTERVAL)
+        self.cpu_time = time.thread_time() - cpu_start
+
+    def flush(self, now):
+        deadline = self.session.phrase_time + timedelta(seconds=PHRASE_TIMEOUT)
+        if self.session.recent_transcription and now > deadline:
+            self.flush_delays.append((now - deadline).total_seconds())
+            self.session.recent_transcription = ""
+
+    def stop(self):
+        self._kill = True
+        self.data_queue.put(None)
+        self.thread.join()
+
+def _summary(values):
+    values = sorted(values)
+    if not values:
+        return "n/a"
+    p99 = values[min(len(values) - 1, int(len(values) * 0.99))]
+    return (f"mean {statistics.mean(values) * 1000:6.2f} ms | p50 {statistics.median(values) * 1000:6.2f} ms"
+            f" | p99 {p99 * 1000:6.2f} ms")
+
+def bench_worker_wakeup(packets=40, idle_seconds=2.0):
+    """Runs both loop shapes with the same packet schedule and prints the results"""
+    # Short gaps within a phrase, every 8th gap is long enough to end the phrase
+    schedule = [PHRASE_TIMEOUT + 0.1 if i % 8 == 7 else random.uniform(0.01, 0.12)
+                for i in range(packets)]
+    for blocking in (False, True):
+        worker = _Worker(blocking)
+        worker.thread.start()
+        for gap in schedule:
+            time.sleep(gap)
+            worker.data_queue.put(time.perf_counter())
+        # Let the last phrase time out and flush, then stay idle for a while
+        time.sleep(PHRASE_TIMEOUT + idle_seconds)
+        worker.stop()
+        name = "blocking get " if blocking else "50 ms polling"
+        print(f"⏱️ [{name}] packet pickup: {_summary(worker.pickup_delays)}")
+        print(f"⏱️ [{name}] phrase flush lateness: {_summary(worker.flush_delays)}")
+        print(f"🔥 [{name}] worker CPU time incl. {idle_seconds:.0f}s idle: {worker.cpu_time * 1000:.1f} ms")
+
+if __name__ == "__main__":
+    bench_worker_wakeup(int(sys.argv[1]) if len(sys.argv) > 1 else 40)
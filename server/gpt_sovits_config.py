@@ -9,6 +9,7 @@ class GPTSoVITSConfig:
     def __init__(self):
         # 基础配置
         self.api_url = "http://localhost:9872"
+        self.api_urls = [self.api_url]   # 多个GPT-SoVITS副本 (不同GPU机器) 时由 TTSBackendPool 分配请求
         self.ref_wav_path = "server/tts_wav/1.wav"  # 主参考音频路径
         self.ref_text_path = "server/tts_wav/1.txt" # 主参考音频的文本路径
         
@@ -47,6 +48,19 @@ class GPTSoVITSConfig:
             "ko": "韩文"
         }
     
+    # 影响合成结果的参数，作为TTS音频缓存键的一部分
+    CACHE_KEY_FIELDS = ("top_k", "top_p", "temperature", "sample_steps", "text_split_method",
+                        "fragment_interval", "speed_factor", "seed", "ref_text_free", "super_sampling",
+                        "batch_size", "split_bucket", "parallel_infer", "repetition_penalty")
+
+    def cache_params(self) -> dict:
+        """返回影响合成结果的参数 (用于缓存键)"""
+        return {key: getattr(self, key) for key in self.CACHE_KEY_FIELDS}
+
+    def is_deterministic(self) -> bool:
+        """固定种子且 keep_random=False 时，相同输入得到相同音频，才可以缓存"""
+        return not self.keep_random and self.seed != -1
+
     def get_language(self, lang_code: str) -> str:
         """获取语言名称"""
         return self.language_mapping.get(lang_code, "中文")
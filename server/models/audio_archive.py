@@ -0,0 +1,166 @@
+""" Background writer for debug audio archives (synthesized and sent audio)"""
+import os
+import queue
+import random
+import threading
+import time
+import numpy as np
+from shared.codecs import pcm16_to_wav, wav_info
+
+DEFAULT_ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "server_outputs")
+ARCHIVE_FORMATS = ("flac", "int16", "wav")
+
+def _to_int16(wav_bytes):
+    """ (int16 samples of shape (frames, channels), sample rate) of a PCM WAV file"""
+    sample_rate, channels, sample_width, offset, length = wav_info(wav_bytes)
+    if sample_width == 2:
+        pcm = np.frombuffer(wav_bytes, dtype="<i2", count=length // 2, offset=offset)
+    elif sample_width == 4:
+        pcm = (np.frombuffer(wav_bytes, dtype="<i4", count=length // 4, offset=offset) >> 16).astype(np.int16)
+    else:
+        raise ValueError(f"Unsupported sample width {sample_width}")
+    return pcm.reshape(-1, channels), sample_rate
+
+class AudioArchive:
+    """ Archives debug audio without touching the request path: submit() only puts
+        the item on a bounded queue (and drops it, counted, when the queue is full),
+        a single writer thread encodes and writes it to root/<category>/.
+
+        - sampling: fraction of items archived, a float for every category or a dict
+          {category: fraction}; 0 disables a category.
+        - storage: "flac" (lossless, about half the size, needs the soundfile package,
+          falls back to "int16" without it), "int16" (16-bit WAV, 32-bit PCM is
+          reduced) or "wav" (the bytes as received).
+        - retention: files older than max_age seconds are deleted, then the oldest
+          files until the archived categories use at most max_bytes. Checked by the
+          writer thread every retention_interval seconds.
+    """
+    def __init__(self, root=DEFAULT_ARCHIVE_DIR, storage="flac", sampling=1.0, max_queue=64,
+                 max_bytes=512 << 20, max_age=7 * 24 * 3600, retention_interval=60.0):
+        if storage not in ARCHIVE_FORMATS:
+            raise ValueError(f"Unknown archive storage {storage}, expected one of {ARCHIVE_FORMATS}")
+        if storage == "flac":
+            try:
+                import soundfile
+                self._soundfile = soundfile
+            except ImportError:
+                print("ℹ️ soundfile is not installed, archiving as 16-bit WAV instead of FLAC")
+                storage = "int16"
+        self.root = root
+        self.storage = storage
+        self.sampling = sampling
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.retention_interval = retention_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._categories = set()
+        self._last_retention = 0.0
+        self._sequence = 0
+        # Statistics
+        self.submitted = 0
+        self.sampled_out = 0
+        self.dropped = 0
+        self.written = 0
+        self.bytes_in = 0
+        self.bytes_written = 0
+        self.deleted = 0
+        self.errors = 0
+        self._writer = threading.Thread(target=self.__writer__, daemon=True)
+        self._writer.start()
+
+    def __fraction__(self, category) -> float:
+        if isinstance(self.sampling, dict):
+            return self.sampling.get(category, 1.0)
+        return self.sampling
+
+    def submit(self, category: str, name: str, wav_bytes: bytes) -> bool:
+        """ Queues a WAV file for root/<category>/<time>_<name>.<ext>, returns False when
+            it is sampled out or dropped. Never blocks."""
+        self.submitted += 1
+        fraction = self.__fraction__(category)
+        if fraction <= 0 or (fraction < 1 and random.random() >= fraction):
+            self.sampled_out += 1
+            return False
+        try:
+            self._queue.put_nowait((category, name, time.time(), wav_bytes))
+            return True
+        except queue.Full:
+            self.dropped += 1
+            return False
+
+    def __writer__(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            try:
+                self.__write__(*item)
+            except Exception as e:
+                self.errors += 1
+                print(f"⚠️ [Archive] Failed to archive {item[0]}/{item[1]}: {e}")
+            if time.time() - self._last_retention >= self.retention_interval:
+                self.enforce_retention()
+
+    def __write__(self, category, name, created, wav_bytes):
+        directory = os.path.join(self.root, category)
+        if category not in self._categories:
+            os.makedirs(directory, exist_ok=True)
+            self._categories.add(category)
+        self._sequence += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(created)) + f"-{self._sequence:06d}"
+        safe_name = "".join(c for c in name if c.isalnum() or c in "_-")[:40] or "audio"
+        path_base = os.path.join(directory, f"{stamp}_{safe_name}")
+        self.bytes_in += len(wav_bytes)
+        data, extension = wav_bytes, ".wav"
+        if self.storage != "wav":
+            try:
+                pcm, sample_rate = _to_int16(wav_bytes)
+            except ValueError:
+                # Not PCM WAV (e.g. float), keep it as received
+                pcm = None
+            if pcm is not None and self.storage == "flac":
+                self._soundfile.write(path_base + ".flac", pcm, sample_rate, format="FLAC", subtype="PCM_16")
+                self.written += 1
+                self.bytes_written += os.path.getsize(path_base + ".flac")
+                return
+            if pcm is not None and pcm.shape[1] == 1:
+                data = pcm16_to_wav(pcm[:, 0], sample_rate)
+        with open(path_base + extension, "wb") as f:
+            f.write(data)
+        self.written += 1
+        self.bytes_written += len(data)
+
+    def enforce_retention(self):
+        """ Applies the age and size limits to the categories written so far"""
+        self._last_retention = time.time()
+        files = []
+        for category in list(self._categories):
+            try:
+                with os.scandir(os.path.join(self.root, category)) as entries:
+                    files.extend((entry.stat().st_mtime, entry.stat().st_size, entry.path)
+                                 for entry in entries if entry.is_file())
+            except OSError:
+                continue
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        oldest_allowed = time.time() - self.max_age
+        for mtime, size, path in files:
+            if mtime >= oldest_allowed and total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                self.deleted += 1
+                total -= size
+            except OSError:
+                pass
+
+    def close(self, timeout=5.0):
+        """ Writes what is queued and stops the writer thread"""
+        if self._writer.is_alive():
+            self._queue.put(None)
+            self._writer.join(timeout)
+
+    def stats(self) -> dict:
+        return {"submitted": self.submitted, "sampled_out": self.sampled_out, "dropped": self.dropped,
+                "written": self.written, "queued": self._queue.qsize(), "errors": self.errors,
+                "bytes_in": self.bytes_in, "bytes_written": self.bytes_written, "deleted": self.deleted}
@@ -0,0 +1,106 @@
+""" Generic dynamic micro-batching of model calls submitted from several threads"""
+import time
+import threading
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+class _BatchRequest:
+    def __init__(self, item):
+        self.item = item
+        self.future = Future()
+        self.submitted = time.time()
+
+class MicroBatchScheduler:
+    """ Collects items submitted from any thread and runs them through run_batch in
+        batches. The first item of a batch waits at most max_wait seconds for others,
+        a batch holds at most max_batch_size items.
+
+        Subclasses implement run_batch(items) -> list of results (same order).
+        submit() returns a concurrent.futures.Future per item.
+    """
+    name = "batch"
+
+    def __init__(self, max_batch_size=8, max_wait=0.02):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.request_queue : Queue = Queue()
+        self.thread = None
+        self._kill_thread = False
+        # Statistics
+        self.batch_count = 0
+        self.request_count = 0
+        self.last_batch_time = 0.0
+        self.total_batch_time = 0.0
+
+    def start(self):
+        """ Starts the scheduler thread """
+        self._kill_thread = False
+        self.thread = threading.Thread(target=self.__worker__, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """ Stops the scheduler thread """
+        self._kill_thread = True
+        if self.thread:
+            self.request_queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def submit(self, item) -> Future:
+        """ Queues an item for the next batch"""
+        request = _BatchRequest(item)
+        self.request_queue.put(request)
+        return request.future
+
+    def run_batch(self, items):
+        raise NotImplementedError
+
+    @property
+    def mean_batch_size(self):
+        return self.request_count / self.batch_count if self.batch_count else 0.0
+
+    def stats(self) -> dict:
+        return {"batches": self.batch_count, "requests": self.request_count,
+                "mean_batch_size": self.mean_batch_size,
+                "last_batch_time": self.last_batch_time,
+                "mean_batch_time": self.total_batch_time / self.batch_count if self.batch_count else 0.0}
+
+    def __worker__(self):
+        """ Scheduler thread event loop"""
+        while not self._kill_thread:
+            request = self.request_queue.get()
+            if request is None:
+                continue
+            batch = [request]
+            deadline = time.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                try:
+                    request = self.request_queue.get(timeout=remaining)
+                except Empty:
+                    break
+                if request is None:
+                    break
+                batch.append(request)
+            self.__run__(batch)
+
+    def __run__(self, batch):
+        start_time = time.time()
+        try:
+            results = self.run_batch([request.item for request in batch])
+        except Exception as e:
+            print(f"Error during {self.name} batch: {e}")
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        end_time = time.time()
+        self.batch_count += 1
+        self.request_count += len(batch)
+        self.last_batch_time = end_time - start_time
+        self.total_batch_time += self.last_batch_time
+        print(f"{self.name} batch of {len(batch)}: {self.last_batch_time:.3f}s "
+              f"(mean batch size {self.mean_batch_size:.2f})")
+        for request, result in zip(batch, results):
+            request.future.set_result(result)
@@ -0,0 +1,169 @@
+""" Latency-aware circuit breaker for remote model calls (e.g. the GPT-SoVITS backends)"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+class CircuitOpenError(RuntimeError):
+    """ Raised by CircuitBreaker.call() while the circuit is open"""
+
+class CircuitBreaker:
+    """ Stops sending calls to a backend that keeps failing or stalling, so callers can
+        switch to a fallback right away instead of waiting for every call to time out.
+
+        - closed: calls pass. Every call outcome goes into a window of the last
+          `window` calls; a call slower than slow_call_threshold counts as failed.
+          consecutive_failures failures in a row, or a failure rate of at least
+          failure_rate over at least min_calls calls, opens the circuit.
+        - open: allow() returns 0 for open_duration seconds.
+        - half-open: afterwards up to half_open_probes calls are let through as probes.
+          A successful probe closes the circuit, a failed one opens it again for twice
+          as long (at most max_open_duration).
+
+        allow() hands out a ticket for every admitted call, to be passed to record()
+        or release(). Tickets belong to the breaker state they were issued in: the
+        result of a call admitted before the circuit opened is ignored, so a late
+        answer can neither close a half-open circuit nor re-open it.
+
+        call() wraps a function with all of this and, with a timeout, runs it on a
+        worker thread and gives up waiting after timeout seconds (the call itself is
+        not interrupted, its result is dropped).
+    """
+    CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+    def __init__(self, name="backend", window=20, min_calls=5, failure_rate=0.5, consecutive_failures=3,
+                 slow_call_threshold=None, open_duration=10.0, max_open_duration=120.0, half_open_probes=1,
+                 max_workers=8):
+        self.name = name
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.consecutive_failures = consecutive_failures
+        self.slow_call_threshold = slow_call_threshold
+        self.base_open_duration = open_duration
+        self.max_open_duration = max_open_duration
+        self.half_open_probes = half_open_probes
+        self.state = self.CLOSED
+        self._outcomes = deque(maxlen=window)
+        self._failures_in_row = 0
+        self._open_duration = open_duration
+        self._open_until = 0.0
+        self._probes = 0
+        # Bumped on every state change, tickets of older generations are stale
+        self._generation = 1
+        self._lock = threading.Lock()
+        self._executor = None
+        self._max_workers = max_workers
+        # Statistics
+        self.calls = 0
+        self.failures = 0
+        self.slow_calls = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.stale = 0
+        self.trips = 0
+
+    def allow(self) -> int:
+        """ Whether a call may go to the backend now: a ticket (a positive int) for
+            record() or release() when it may, 0 when not. In half-open state a ticket
+            reserves a probe, which must be followed by record() or release()"""
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.time() < self._open_until:
+                    self.rejected += 1
+                    return 0
+                self.state = self.HALF_OPEN
+                self._generation += 1
+                self._probes = 0
+                print(f"🔌 [Circuit {self.name}] half-open, probing the backend")
+            if self.state == self.HALF_OPEN:
+                if self._probes >= self.half_open_probes:
+                    self.rejected += 1
+                    return 0
+                self._probes += 1
+            return self._generation
+
+    def release(self, ticket):
+        """ Gives back a call that ended without telling anything about the backend
+            (e.g. the caller went away), frees its half-open probe"""
+        with self._lock:
+            if ticket == self._generation and self.state == self.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+
+    def record(self, success: bool, latency=None, timed_out=False, ticket=None):
+        """ Outcome of a call that allow() let through. Results of calls admitted
+            before the last state change are ignored (ticket None: current state)"""
+        with self._lock:
+            if ticket is not None and ticket != self._generation:
+                self.stale += 1
+                return
+            self.calls += 1
+            if success and self.slow_call_threshold is not None and latency is not None \
+                    and latency > self.slow_call_threshold:
+                self.slow_calls += 1
+                success = False
+            if timed_out:
+                self.timeouts += 1
+            if not success:
+                self.failures += 1
+            if self.state == self.HALF_OPEN:
+                self._probes = max(0, self._probes - 1)
+                if success:
+                    self.__close__()
+                else:
+                    self.__open__(min(self._open_duration * 2, self.max_open_duration))
+                return
+            self._outcomes.append(success)
+            self._failures_in_row = 0 if success else self._failures_in_row + 1
+            if self.state == self.CLOSED and not success:
+                failed = self._outcomes.count(False)
+                if self._failures_in_row >= self.consecutive_failures or \
+                        (len(self._outcomes) >= self.min_calls and failed / len(self._outcomes) >= self.failure_rate):
+                    self.__open__(self.base_open_duration)
+
+    def __open__(self, duration):
+        self.state = self.OPEN
+        self._generation += 1
+        self._open_duration = duration
+        self._open_until = time.time() + duration
+        self.trips += 1
+        print(f"⚠️ [Circuit {self.name}] open for {duration:.1f}s "
+              f"({self._failures_in_row} failures in a row, {self._outcomes.count(False)}/{len(self._outcomes)} recent calls failed)")
+
+    def __close__(self):
+        self.state = self.CLOSED
+        self._generation += 1
+        self._open_duration = self.base_open_duration
+        self._outcomes.clear()
+        self._failures_in_row = 0
+        print(f"✅ [Circuit {self.name}] closed, the backend answers again")
+
+    def call(self, fn, *args, timeout=None, **kwargs):
+        """ fn(*args, **kwargs) through the breaker. Raises CircuitOpenError while open,
+            TimeoutError when fn takes longer than timeout seconds"""
+        ticket = self.allow()
+        if not ticket:
+            raise CircuitOpenError(f"Circuit {self.name} is open")
+        start = time.perf_counter()
+        try:
+            if timeout is None:
+                result = fn(*args, **kwargs)
+            else:
+                with self._lock:
+                    if self._executor is None:
+                        self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                            thread_name_prefix=f"circuit-{self.name}")
+                result = self._executor.submit(fn, *args, **kwargs).result(timeout=timeout)
+        except FutureTimeout:
+            self.record(False, timeout, timed_out=True, ticket=ticket)
+            raise TimeoutError(f"{self.name} did not answer within {timeout}s")
+        except Exception:
+            self.record(False, time.perf_counter() - start, ticket=ticket)
+            raise
+        self.record(True, time.perf_counter() - start, ticket=ticket)
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "calls": self.calls, "failures": self.failures,
+                    "slow_calls": self.slow_calls, "timeouts": self.timeouts,
+                    "rejected": self.rejected, "stale": self.stale, "trips": self.trips}
@@ -0,0 +1,251 @@
+""" In-memory GPT-SoVITS clients: the WebUI's gradio /inference endpoint, or the
+    plain HTTP API (api_v2.py) with streaming responses"""
+import json
+import os
+import threading
+import time
+import numpy as np
+import requests
+from requests.adapters import HTTPAdapter
+from models.tts_cache import file_fingerprint
+from shared.codecs import pcm16_to_wav
+from utils.wav_stream import WavStreamParser
+
+class GPTSoVITSBackend:
+    """ What both clients share: reference text caching and per-call timings"""
+    TIMINGS = ()
+    PING_PATH = "/"
+
+    def __init__(self):
+        # path -> (fingerprint, text)
+        self._reference_text = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        # Statistics
+        self.calls = 0
+        self._timing_totals = dict.fromkeys(self.TIMINGS, 0.0)
+
+    def reference_text(self, path) -> str:
+        """ Stripped content of a reference text file, re-read only when it changes"""
+        fingerprint = file_fingerprint(path)
+        cached = self._reference_text.get(path)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read().strip()
+        self._reference_text[path] = (fingerprint, text)
+        return text
+
+    def ping(self, timeout=2.0) -> bool:
+        """ True when the server answers at all (used for health checks)"""
+        try:
+            return self.session.get(self.api_url + self.PING_PATH, timeout=timeout).status_code < 500
+        except requests.RequestException:
+            return False
+
+    def __record__(self, timings: dict):
+        self._local.timings = timings
+        with self._lock:
+            self.calls += 1
+            for name, value in timings.items():
+                self._timing_totals[name] += value
+
+    @property
+    def last_timings(self) -> dict:
+        """ Timings in seconds of the calling thread's last request"""
+        return getattr(self._local, "timings", {})
+
+    def stats(self) -> dict:
+        """ Call count and the mean of every timing in seconds"""
+        with self._lock:
+            calls = max(self.calls, 1)
+            return {"calls": self.calls, **{f"mean_{name}": total / calls for name, total in self._timing_totals.items()}}
+
+class GPTSoVITSGradioClient(GPTSoVITSBackend):
+    """ Calls the endpoint through gradio's HTTP API (POST {prefix}/call/<api> and the
+        SSE result stream) instead of gradio_client.Client.predict, which uploads every
+        file argument again on each call and downloads the result to a temp file:
+
+        - the reference audio is uploaded once, its server-side handle is reused until
+          the file changes (size / mtime) or a call fails,
+        - reference texts are read once per change of their file,
+        - the result is downloaded straight into memory,
+        - every request goes through one keep-alive requests.Session.
+
+        last_timings and stats() break each call down into prepare (reference upload or
+        lookup), submit, generate (waiting for the result event, i.e. synthesis on the
+        server), download, total, and overhead = total - generate.
+    """
+    TIMINGS = ("prepare", "submit", "generate", "download", "total", "overhead")
+    PING_PATH = "/config"
+
+    def __init__(self, api_url, api_name="/inference", timeout=120, verify=False):
+        super().__init__()
+        self.api_url = api_url.rstrip("/")
+        self.api_name = api_name.strip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.verify = verify
+        # path -> (fingerprint, server side FileData)
+        self._reference_audio = {}
+        self.uploads = 0
+        self.__discover__()
+
+    def __discover__(self):
+        """ API prefix ("/gradio_api" since gradio 5, "" before) and the endpoint's
+            parameter names and defaults in positional order"""
+        config = self.session.get(f"{self.api_url}/config", timeout=10)
+        config.raise_for_status()
+        self.base_url = self.api_url + config.json().get("api_prefix", "").rstrip("/")
+        info = self.session.get(f"{self.base_url}/info", timeout=10)
+        info.raise_for_status()
+        endpoint = info.json().get("named_endpoints", {}).get("/" + self.api_name)
+        if endpoint is None:
+            raise ConnectionError(f"{self.api_url} has no /{self.api_name} endpoint")
+        self.parameters = [(parameter.get("parameter_name") or parameter.get("label"),
+                            parameter.get("parameter_default"))
+                           for parameter in endpoint.get("parameters", [])]
+
+    def reference_audio(self, path) -> dict:
+        """ Server-side FileData of a reference audio file, uploaded on first use and
+            again only when the file changes"""
+        fingerprint = file_fingerprint(path)
+        with self._lock:
+            cached = self._reference_audio.get(path)
+            if cached and cached[0] == fingerprint:
+                return cached[1]
+            with open(path, "rb") as f:
+                response = self.session.post(f"{self.base_url}/upload",
+                                             files=[("files", (os.path.basename(path), f))],
+                                             timeout=self.timeout)
+            response.raise_for_status()
+            handle = {"path": response.json()[0], "orig_name": os.path.basename(path),
+                      "meta": {"_type": "gradio.FileData"}}
+            self._reference_audio[path] = (fingerprint, handle)
+            self.uploads += 1
+            return handle
+
+    def synthesize(self, ref_audio_path, **params) -> tuple:
+        """ (WAV bytes, returned seed) for the endpoint's keyword parameters, with
+            ref_audio_path given as a local file path"""
+        start = time.perf_counter()
+        try:
+            params["ref_audio_path"] = self.reference_audio(ref_audio_path)
+            data = [params.get(name, default) for name, default in self.parameters]
+            prepared = time.perf_counter()
+            response = self.session.post(f"{self.base_url}/call/{self.api_name}", json={"data": data},
+                                         timeout=self.timeout)
+            response.raise_for_status()
+            event_id = response.json()["event_id"]
+            submitted = time.perf_counter()
+            result = self.__wait_result__(event_id)
+            generated = time.perf_counter()
+            output = result[0]
+            url = output.get("url") or f"{self.base_url}/file={output['path']}"
+            audio = self.session.get(url, timeout=self.timeout)
+            audio.raise_for_status()
+        except Exception:
+            # The server may have restarted and lost the uploaded reference
+            with self._lock:
+                self._reference_audio.clear()
+            raise
+        end = time.perf_counter()
+        timings = {"prepare": prepared - start, "submit": submitted - prepared, "generate": generated - submitted,
+                   "download": end - generated, "total": end - start}
+        timings["overhead"] = timings["total"] - timings["generate"]
+        self.__record__(timings)
+        return audio.content, result[1] if len(result) > 1 else None
+
+    def __wait_result__(self, event_id) -> list:
+        """ Reads the SSE stream of a call until its complete (or error) event"""
+        event = None
+        with self.session.get(f"{self.base_url}/call/{self.api_name}/{event_id}",
+                              stream=True, timeout=self.timeout) as stream:
+            stream.raise_for_status()
+            for line in stream.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:") and event == "error":
+                    raise RuntimeError(f"GPT-SoVITS /{self.api_name} failed: {line[5:].strip()}")
+                elif line.startswith("data:") and event == "complete":
+                    return json.loads(line[5:])
+        raise RuntimeError(f"GPT-SoVITS /{self.api_name} stream ended without a result")
+
+    def stats(self) -> dict:
+        return {**super().stats(), "uploads": self.uploads}
+
+class GPTSoVITSHTTPClient(GPTSoVITSBackend):
+    """ Client for GPT-SoVITS's plain HTTP API (api_v2.py, POST /tts), without gradio's
+        queue, SSE polling and result download.
+
+        Takes the same keyword parameters as the gradio client (gradio language and
+        split method names are translated to the API's codes). ref_audio_path is read
+        by the API process itself, so it must be valid on the machine running it.
+        Requests share a pooled keep-alive session. stream() sends streaming_mode
+        requests and yields audio while the body is still arriving, parsed
+        incrementally (streamed WAV headers have no valid size, the samples run to
+        the end of the body).
+
+        Timings: first_audio (request -> first samples), generate (request -> end of
+        body), total.
+    """
+    TIMINGS = ("first_audio", "generate", "total")
+    LANGUAGE_CODES = {"中文": "zh", "英文": "en", "日文": "ja", "粤语": "yue", "韩文": "ko"}
+    SPLIT_METHODS = {"不切": "cut0", "凑四句一切": "cut1", "凑50字一切": "cut2",
+                     "按中文句号。切": "cut3", "按英文句号.切": "cut4", "按标点符号切": "cut5"}
+
+    def __init__(self, api_url="http://localhost:9880", pool_size=4, timeout=120):
+        super().__init__()
+        self.api_url = api_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def __request_body__(self, ref_audio_path, streaming, **params) -> dict:
+        body = dict(params, ref_audio_path=ref_audio_path, streaming_mode=streaming, media_type="wav")
+        for key in ("text_lang", "prompt_lang"):
+            if key in body:
+                body[key] = self.LANGUAGE_CODES.get(body[key], body[key])
+        if "text_split_method" in body:
+            body["text_split_method"] = self.SPLIT_METHODS.get(body["text_split_method"], body["text_split_method"])
+        # The gradio-only switches map onto the seed and the prompt
+        if body.pop("keep_random", False):
+            body["seed"] = -1
+        if body.pop("ref_text_free", False):
+            body["prompt_text"] = ""
+        for key in ("seed", "batch_size", "top_k", "sample_steps"):
+            if key in body:
+                body[key] = int(float(body[key]))
+        return body
+
+    def stream(self, ref_audio_path, streaming=True, **params):
+        """ Yields (int16 mono samples, sample rate) as the response body arrives"""
+        start = time.perf_counter()
+        first_audio = None
+        parser = WavStreamParser()
+        with self.session.post(f"{self.api_url}/tts", json=self.__request_body__(ref_audio_path, streaming, **params),
+                               stream=True, timeout=self.timeout) as response:
+            if response.status_code != 200:
+                raise RuntimeError(f"GPT-SoVITS /tts returned {response.status_code}: {response.text[:500]}")
+            for piece in response.iter_content(chunk_size=None):
+                pcm = parser.feed(piece)
+                if parser.channels > 1:
+                    pcm = pcm[::parser.channels]
+                if len(pcm):
+                    if first_audio is None:
+                        first_audio = time.perf_counter() - start
+                    yield pcm, parser.sample_rate
+        generate = time.perf_counter() - start
+        self.__record__({"first_audio": generate if first_audio is None else first_audio,
+                         "generate": generate, "total": time.perf_counter() - start})
+
+    def synthesize(self, ref_audio_path, **params) -> tuple:
+        """ (WAV bytes, seed) of the whole utterance"""
+        pieces, sample_rate = [], None
+        for pcm, sample_rate in self.stream(ref_audio_path, streaming=False, **params):
+            pieces.append(pcm)
+        if not pieces:
+            return None, params.get("seed")
+        return pcm16_to_wav(np.concatenate(pieces), sample_rate), params.get("seed")
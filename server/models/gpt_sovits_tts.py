@@ -7,24 +7,63 @@ import torch
 import numpy as np
 from typing import Optional
 import urllib.parse
+import threading
+from models.session_manager import FairQueue
+from models.circuit_breaker import CircuitOpenError
+from utils.wav_stream import WavStreamParser
 
 class GPTSoVITSTTSModel:
-    """GPT-SoVITS TTS模型类，通过API调用进行语音合成"""
-    
-    def __init__(self, api_url="http://localhost:9872", callback_function=None):
+    """GPT-SoVITS TTS模型类，通过API调用进行语音合成
+
+    与 TextToSpeechModel 接口相同: synthesise() 把文本放入队列，工作线程合成后调用
+    callback_function(audio, client_socket, sample_rate)。
+    circuit_breaker: 可选的 CircuitBreaker，连续失败/过慢时打开，打开期间不再请求API。
+        有熔断器时每次合成最多等待 timeout 秒 (整个请求，不只是单次读取)，超时按失败处理
+    fallback_model: 可选的降级模型 (如 TextToSpeechModel)，API失败或熔断时用它合成
+        (FALLBACK_SAMPLE_RATE)。没有降级模型时这句话不发送音频
+    """
+    FALLBACK_SAMPLE_RATE = 16000  # SpeechT5输出采样率
+
+    def __init__(self, api_url="http://localhost:9872", callback_function=None,
+                 circuit_breaker=None, fallback_model=None, timeout=30):
         self.api_url = api_url.rstrip('/')
         self.callback_function = callback_function
+        self.circuit_breaker = circuit_breaker
+        self.fallback_model = fallback_model
+        self.timeout = timeout
         self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
+        # 复用keep-alive连接
+        self.session = requests.Session()
         
         # 默认参考音频设置
         self.default_refer_wav_path = None
         self.default_prompt_text = None
         self.default_prompt_language = "zh"
         
-        # 测试API连接
-        self._test_connection()
-        
-        print(f"🚀 GPT-SoVITS TTS API connected: {self.api_url}")
+        # 测试API连接 (有降级模型时API暂时不可用也可以启动)
+        try:
+            self._test_connection()
+            print(f"🚀 GPT-SoVITS TTS API connected: {self.api_url}")
+        except Exception:
+            if self.fallback_model is None:
+                raise
+            print("🛟 GPT-SoVITS暂时不可用，先使用降级模型合成")
+
+        # (client_socket, text, 合成参数) 的队列，各客户端轮流处理
+        self.task_queue = FairQueue()
+        self.__kill_thread = False
+        self.thread = threading.Thread(target=self.worker, daemon=True)
+        self.thread.start()
+
+    def __del__(self):
+        if hasattr(self, "thread"):
+            self.stop()
+
+    def stop(self):
+        """停止工作线程 (当前任务完成后)"""
+        self.__kill_thread = True
+        self.task_queue.put(None)
+        self.thread.join()
         
     def _test_connection(self):
         """测试API连接"""
@@ -43,7 +82,7 @@ class GPTSoVITSTTSModel:
                    prompt_language: str = "zh",
                    text_language: str = "zh"):
         """
-        非阻塞语音合成
+        非阻塞语音合成，结果通过 callback_function 返回
         
         Args:
             text: 要合成的文本
@@ -53,19 +92,29 @@ class GPTSoVITSTTSModel:
             prompt_language: 参考音频语言
             text_language: 目标文本语言
         """
-        if self.callback_function:
-            # 异步处理
-            audio = self.synthesise_blocking(
-                text, refer_wav_path, prompt_text, 
-                prompt_language, text_language
-            )
-            self.callback_function(audio, client_socket)
+        self.task_queue.put((client_socket, (text, refer_wav_path, prompt_text, prompt_language, text_language)))
+
+    def worker(self):
+        """工作线程事件循环"""
+        while not self.__kill_thread:
+            task = self.task_queue.get()
+            if task is None:
+                continue
+            client_socket, args = task
+            try:
+                audio, sample_rate = self.synthesise_blocking(*args)
+                if audio is not None and self.callback_function:
+                    self.callback_function(audio, client_socket, sample_rate)
+            except Exception as e:
+                print(f"❌ GPT-SoVITS合成任务失败 '{args[0]}': {e}")
+            finally:
+                self.task_queue.task_done(client_socket)
     
     def synthesise_blocking(self, text: str,
                            refer_wav_path: Optional[str] = None,
                            prompt_text: Optional[str] = None,
                            prompt_language: str = "zh",
-                           text_language: str = "zh") -> torch.Tensor:
+                           text_language: str = "zh") -> tuple:
         """
         阻塞式语音合成
         
@@ -77,8 +126,41 @@ class GPTSoVITSTTSModel:
             text_language: 目标文本语言
             
         Returns:
-            torch.Tensor: 合成的音频数据
+            (torch.Tensor, int): 合成的音频数据和采样率，降级时为降级模型的采样率，
+            合成失败且没有降级模型时为 (None, None)
         """
+        args = (text, refer_wav_path, prompt_text, prompt_language, text_language)
+        if self.circuit_breaker is None:
+            audio_tensor, sample_rate = self.__request_audio__(*args)
+            if audio_tensor is None:
+                return self.__degraded__(text, "API调用失败")
+            return audio_tensor, sample_rate
+        try:
+            return self.circuit_breaker.call(self.__request_or_raise__, *args, timeout=self.timeout)
+        except CircuitOpenError:
+            return self.__degraded__(text, "熔断器打开")
+        except TimeoutError:
+            return self.__degraded__(text, f"超过{self.timeout}秒未返回")
+        except Exception:
+            return self.__degraded__(text, "API调用失败")
+
+    def __request_or_raise__(self, *args):
+        """__request_audio__，失败时抛出异常，让熔断器记为失败"""
+        audio_tensor, sample_rate = self.__request_audio__(*args)
+        if audio_tensor is None:
+            raise RuntimeError("GPT-SoVITS未返回音频")
+        return audio_tensor, sample_rate
+
+    def __degraded__(self, text: str, reason: str) -> tuple:
+        """降级模型的合成结果，没有降级模型时为 (None, None)，这句话不发送音频"""
+        if self.fallback_model is None:
+            print(f"⚠️ GPT-SoVITS不可用 ({reason})，没有降级模型，跳过: '{text}'")
+            return None, None
+        print(f"🛟 GPT-SoVITS不可用 ({reason})，使用降级模型合成")
+        return self.fallback_model.synthesise_blocking(text), self.FALLBACK_SAMPLE_RATE
+
+    def __request_audio__(self, text, refer_wav_path, prompt_text, prompt_language, text_language):
+        """调用API，返回 (音频, 采样率)，失败时返回 (None, None)"""
         start_time = time.time()
         
         try:
@@ -99,10 +181,11 @@ class GPTSoVITSTTSModel:
                     "text_language": text_language
                 }
                 
-                response = requests.post(
+                response = self.session.post(
                     f"{self.api_url}/",
                     json=data,
-                    timeout=30
+                    timeout=self.timeout,
+                    stream=True
                 )
             else:
                 # 使用GET方式，不包含参考音频
@@ -115,58 +198,48 @@ class GPTSoVITSTTSModel:
                 query_string = urllib.parse.urlencode(params)
                 url = f"{self.api_url}/?{query_string}"
                 
-                response = requests.get(url, timeout=30)
+                response = self.session.get(url, timeout=self.timeout, stream=True)
             
             if response.status_code == 200:
-                # 获取音频数据
-                audio_data = response.content
-                
-                if len(audio_data) == 0:
-                    print("⚠️  收到空音频数据")
-                    return torch.zeros(16000)
-                
-                # 将音频数据转换为torch tensor
-                # GPT-SoVITS返回的是WAV格式音频
+                # GPT-SoVITS返回的是WAV格式音频 (流式时为分块传输，头中的数据长度无效)
+                # 边接收边解析头部和样本，而不是假设固定44字节的头
                 try:
-                    # 跳过WAV文件头（通常是44字节）
-                    if len(audio_data) > 44:
-                        audio_bytes = audio_data[44:]  # 跳过WAV头
-                    else:
-                        audio_bytes = audio_data
-                    
-                    # 转换为numpy数组
-                    audio_array = np.frombuffer(audio_bytes, dtype=np.int16)
+                    parser = WavStreamParser()
+                    pieces = [parser.feed(piece) for piece in response.iter_content(chunk_size=None)]
+                    if not parser.header_done:
+                        print("⚠️  收到空音频数据")
+                        return None, None
+                    audio_array = np.concatenate(pieces)
+                    if parser.channels > 1:
+                        audio_array = audio_array.reshape(-1, parser.channels)[:, 0]
                     
                     if len(audio_array) == 0:
                         print("⚠️  音频数组为空")
-                        return torch.zeros(16000)
+                        return None, None
                     
                     # 转换为float32并归一化
                     audio_tensor = torch.from_numpy(audio_array.astype(np.float32) / 32768.0)
                     
                     end_time = time.time()
                     print(f"🔊 GPT-SoVITS合成完成: '{text}' 耗时: {end_time - start_time:.2f}秒")
-                    print(f"   音频长度: {len(audio_tensor)} 样本")
+                    print(f"   音频长度: {len(audio_tensor)} 样本 ({parser.sample_rate}Hz)")
                     
-                    return audio_tensor
+                    return audio_tensor, parser.sample_rate
                     
                 except Exception as e:
                     print(f"❌ 音频数据处理失败: {e}")
-                    # 直接返回原始数据作为tensor
-                    audio_array = np.frombuffer(audio_data, dtype=np.uint8)
-                    audio_tensor = torch.from_numpy(audio_array.astype(np.float32))
-                    return audio_tensor
+                    return None, None
+                finally:
+                    response.close()
                 
             else:
                 print(f"❌ GPT-SoVITS API错误: {response.status_code}")
                 print(f"错误内容: {response.text}")
-                # 返回空音频
-                return torch.zeros(16000)  # 1秒的静音
+                return None, None
                 
         except Exception as e:
             print(f"❌ GPT-SoVITS合成失败: {e}")
-            # 返回空音频
-            return torch.zeros(16000)  # 1秒的静音
+            return None, None
     
     def set_reference_audio(self, wav_path: str, text: str, language: str = "zh"):
         """
@@ -0,0 +1,54 @@
+""" Offline machine translation with a local transformers seq2seq model"""
+import torch
+from transformers import AutoTokenizer, AutoModelForSeq2SeqLM
+from models.batch_scheduler import MicroBatchScheduler
+
+class LocalTranslationModel(MicroBatchScheduler):
+    """ 本地翻译模型 (MarianMT / NLLB 等 seq2seq 模型)，不需要网络。
+
+        translate() 可以从多个线程 (多个会话) 同时调用，同一时间窗口 (max_wait) 内的
+        句子会合并成一个批次推理，每个批次的延迟会打印出来并记录在 stats() 中。
+        quantize=True 时在CPU上对 Linear 层做动态 int8 量化。
+        NLLB 类模型需要 src_lang / tgt_lang (例如 "zho_Hans" / "eng_Latn")。
+    """
+    name = "MT"
+
+    def __init__(self, model_name="Helsinki-NLP/opus-mt-zh-en", device=None, quantize=False,
+                 src_lang=None, tgt_lang=None, max_batch_size=16, max_wait=0.02, max_new_tokens=256):
+        super().__init__(max_batch_size, max_wait)
+        if device is None:
+            device = "cuda:0" if torch.cuda.is_available() and not quantize else "cpu"
+        self.device = device
+        print(f"Loading local translation model {model_name} on {self.device}"
+              f"{' (int8 dynamic quantization)' if quantize else ''}")
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.model = AutoModelForSeq2SeqLM.from_pretrained(model_name)
+        self.model.eval()
+        if quantize:
+            if self.device != "cpu":
+                raise ValueError("int8 dynamic quantization is only supported on CPU")
+            self.model = torch.quantization.quantize_dynamic(self.model, {torch.nn.Linear},
+                                                             dtype=torch.qint8)
+        self.model.to(self.device)
+        self.generate_options = {"max_new_tokens": max_new_tokens}
+        if src_lang:
+            self.tokenizer.src_lang = src_lang
+        if tgt_lang:
+            self.generate_options["forced_bos_token_id"] = self.tokenizer.convert_tokens_to_ids(tgt_lang)
+        self.start()
+
+    def translate(self, text: str) -> str:
+        """ 翻译一句话 (阻塞)，与其他线程的请求合并批处理"""
+        return self.submit(text).result()
+
+    def translate_batch(self, texts):
+        """ 直接翻译一批句子 (阻塞，不经过调度线程)"""
+        return self.run_batch(texts)
+
+    def run_batch(self, items):
+        inputs = self.tokenizer(list(items), return_tensors="pt", padding=True, truncation=True)
+        inputs = {key: value.to(self.device) for key, value in inputs.items()}
+        with torch.inference_mode():
+            outputs = self.model.generate(**inputs, **self.generate_options)
+        translations = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+        return [translation.strip() for translation in translations]
@@ -0,0 +1,146 @@
+""" Staged processing pipeline (MT -> TTS -> send) with bounded queues and per-stage worker pools"""
+import time
+import threading
+from queue import Full
+from types import GeneratorType
+from models.session_manager import FairQueue
+
+class PipelineStage:
+    """ One stage of a StagePipeline: a bounded FairQueue served by `workers` threads.
+
+        handler(payload, client) runs on a worker thread; a non-None return value is
+        submitted to the next stage, None ends the chain for that item. A generator
+        handler hands each yielded value on as soon as it is produced (e.g. one
+        synthesized fragment at a time). Items of the same client are processed one at
+        a time and in order (the queue is exclusive per key), items of different
+        clients run in parallel on the pool.
+
+        When the queue stays full for put_timeout seconds the item is dropped rather
+        than stalling the stage that produced it, counted and logged. For generator
+        handlers this only applies to the first output: once part of an utterance has
+        been handed on, the following fragments wait for room instead, so a sentence
+        never loses a piece in the middle. If the first output is dropped the
+        generator is closed and the whole utterance is skipped.
+    """
+    def __init__(self, name, handler, workers=1, max_queue=16, put_timeout=5.0):
+        self.name = name
+        self.handler = handler
+        self.workers = workers
+        self.put_timeout = put_timeout
+        self.queue : FairQueue = FairQueue(maxsize=max_queue, exclusive=True)
+        self.next_stage = None
+        self.threads = []
+        self._kill_thread = False
+        # Statistics
+        self.processed = 0
+        self.dropped = 0
+        self.waited = 0
+        self.failed = 0
+        self.total_time = 0.0
+        self._stats_lock = threading.Lock()
+
+    def start(self):
+        """ Starts the worker threads """
+        self._kill_thread = False
+        self.threads = [threading.Thread(target=self.__worker__, name=f"{self.name}-{i}", daemon=True)
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self):
+        """ Stops the worker threads """
+        self._kill_thread = True
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def submit(self, client, payload, wait=False, block=True) -> bool:
+        """ Queues an item, returns False when it was dropped because the stage is saturated.
+            wait=True keeps waiting for room (logged every put_timeout) until the stage stops,
+            block=False drops the item right away when the queue is full"""
+        while True:
+            try:
+                self.queue.put((client, payload), block=block or wait, timeout=self.put_timeout)
+                return True
+            except Full:
+                if wait and not self._kill_thread:
+                    with self._stats_lock:
+                        self.waited += 1
+                    print(f"⏳ [{self.name}] 队列已满 ({self.queue.maxsize})，等待空位以免丢弃句子中间的片段")
+                    continue
+                with self._stats_lock:
+                    self.dropped += 1
+                print(f"⚠️ [{self.name}] 队列已满 ({self.queue.maxsize})，丢弃一项任务")
+                return False
+
+    def stats(self) -> dict:
+        return {"queued": self.queue.qsize(), "processed": self.processed, "dropped": self.dropped,
+                "waited": self.waited, "failed": self.failed,
+                "mean_time": self.total_time / self.processed if self.processed else 0.0}
+
+    def __worker__(self):
+        """ Worker thread event loop"""
+        while not self._kill_thread:
+            task = self.queue.get()
+            if task is None:
+                continue
+            client, payload = task
+            start_time = time.time()
+            try:
+                result = self.handler(payload, client)
+                forwarded = 0
+                for output in result if isinstance(result, GeneratorType) else (result,):
+                    if output is not None and self.next_stage is not None:
+                        # Handed over before the key is released, so the client's order is kept.
+                        # Fragments after the first wait for room rather than leaving a gap
+                        if not self.next_stage.submit(client, output, wait=forwarded > 0):
+                            if isinstance(result, GeneratorType):
+                                if not forwarded:
+                                    print(f"⚠️ [{self.name}] 下一阶段饱和，跳过整句 (未发送任何片段)")
+                                result.close()
+                            break
+                        forwarded += 1
+                with self._stats_lock:
+                    self.processed += 1
+                    self.total_time += time.time() - start_time
+            except Exception as e:
+                with self._stats_lock:
+                    self.failed += 1
+                print(f"❌ [{self.name}] 处理失败: {e}")
+            finally:
+                self.queue.task_done(client)
+
+class StagePipeline:
+    """ Chains PipelineStages so each stage works on a different phrase at the same time:
+        while phrase N is synthesized, phrase N+1 can already be translated and the
+        recognizer thread is free to decode phrase N+2.
+
+        stages: list of (name, handler, workers). submit() never blocks the caller for
+        longer than the first stage's put_timeout, with block=False not at all.
+    """
+    def __init__(self, stages, max_queue=16, put_timeout=5.0):
+        self.stages = [PipelineStage(name, handler, workers, max_queue, put_timeout)
+                       for name, handler, workers in stages]
+        for stage, next_stage in zip(self.stages, self.stages[1:]):
+            stage.next_stage = next_stage
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+
+    def stop(self):
+        for stage in self.stages:
+            stage.stop()
+
+    def submit(self, client, payload, block=True) -> bool:
+        """ Feeds an item into the first stage"""
+        return self.stages[0].submit(client, payload, block=block)
+
+    def discard(self, client) -> int:
+        """ Drops every pending item of a client in all stages, returns how many were dropped"""
+        return sum(stage.queue.discard(client) for stage in self.stages)
+
+    def stats(self) -> dict:
+        return {stage.name: stage.stats() for stage in self.stages}
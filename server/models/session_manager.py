@@ -0,0 +1,311 @@
+""" Per-connection session state and fair scheduling across concurrent clients"""
+import itertools
+import struct
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+from queue import Empty, Full
+from utils.audio_buffer import PCMRingBuffer
+from shared.protocol import Frame, FrameDecoder, MessageType, ProtocolError, encode_frame, is_v2_preamble
+from shared.codecs import negotiate, pack_audio, pcm16_to_wav, unpack_audio
+
+# Returned by FairQueue.__ready_key__ when no key can be served
+_NO_KEY = object()
+
+_session_ids = itertools.count(1)
+
+class ClientSession:
+    """ Holds everything that belongs to one client socket: the audio buffer of the
+        phrase being recognized, its phrase timing, the latest transcription and the
+        output path back to the client.
+
+        send_lock serializes writes to the socket so that audio produced by several
+        worker threads for the same client is never interleaved on the wire.
+
+        protocol is detected from the first received bytes: PROTOCOL_V2 for clients that
+        speak the framed protocol (shared/protocol.py), PROTOCOL_LEGACY for raw PCM.
+        Framed clients negotiate an audio codec per direction in their HELLO.
+    """
+    PROTOCOL_LEGACY = "legacy"
+    PROTOCOL_V2 = 2
+
+    def __init__(self, client_socket, address=None, sample_rate=16000, max_phrase_seconds=30.0):
+        self.session_id = next(_session_ids)
+        self.client_socket = client_socket
+        self.address = address
+        # The last time audio of the active phrase arrived (its start before any audio).
+        self.phrase_time = datetime.utcnow()
+        # Raw int16 audio of the active phrase, bounded to max_phrase_seconds.
+        self.audio = PCMRingBuffer(sample_rate, max_phrase_seconds)
+        # Latest (not yet finalized) transcription of the active phrase.
+        self.recent_transcription = ""
+        # Recognizer specific state of the active phrase (e.g. streaming hypotheses)
+        self.asr_state = None
+        # Voice activity detection state carried across chunks, see models/vad.py
+        self.vad_state = None
+        self.in_speech = False
+        # Monotonic counter of how often this session got ASR time, used for fairness.
+        self.last_served = 0
+        self.send_lock = threading.Lock()
+        self.closed = False
+        # Wire protocol, None until the first data arrives
+        self.protocol = None
+        self._decoder = FrameDecoder()
+        self._send_seq = 0
+        # Negotiated audio codecs (shared/codecs.py), pcm16 sends audio uncompressed
+        self.upstream_codec = "pcm16"
+        self.downstream_codec = "pcm16"
+
+    def reset_phrase(self, current_time=None):
+        """ Starts a new phrase, dropping the buffered audio"""
+        self.phrase_time = current_time or datetime.utcnow()
+        self.audio.clear()
+        self.asr_state = None
+
+    def sendall(self, *payloads) -> None:
+        """ Sends all payloads back to back while holding the session's send lock"""
+        with self.send_lock:
+            for payload in payloads:
+                self.client_socket.sendall(payload)
+
+    def receive(self, data) -> list:
+        """ Decodes received bytes into Frames. Legacy clients only send PCM, their data
+            comes back as a single AUDIO frame. Raises shared.protocol.ProtocolError"""
+        if self.protocol is None:
+            self.protocol = self.PROTOCOL_V2 if is_v2_preamble(data) else self.PROTOCOL_LEGACY
+        if self.protocol == self.PROTOCOL_LEGACY:
+            return [Frame(MessageType.AUDIO, self.session_id, 0, time.time(), data)]
+        return self._decoder.feed(data)
+
+    def send_frame(self, msg_type, payload=b"") -> None:
+        """ Sends one v2 frame, numbered in send order"""
+        with self.send_lock:
+            self._send_seq += 1
+            self.client_socket.sendall(encode_frame(msg_type, payload, self.session_id, self._send_seq))
+
+    def negotiate_codecs(self, offer: dict) -> dict:
+        """ Picks the first codec of the client's preference lists (HELLO "codecs")
+            that is available here, returns the choice for the WELCOME"""
+        self.upstream_codec = negotiate(offer.get("upstream", ()))
+        self.downstream_codec = negotiate(offer.get("downstream", ()))
+        return {"upstream": self.upstream_codec, "downstream": self.downstream_codec}
+
+    def decode_audio(self, payload) -> bytes:
+        """ int16 PCM bytes of a received AUDIO payload. Raises ProtocolError"""
+        if self.upstream_codec == "pcm16":
+            return payload
+        try:
+            return unpack_audio(payload)[0].tobytes()
+        except (ValueError, struct.error) as e:
+            raise ProtocolError(f"Undecodable {self.upstream_codec} audio: {e}") from e
+
+    def encode_audio(self, pcm, sample_rate) -> bytes:
+        """ AUDIO payload of int16 samples: WAV when uncompressed, else the codec container"""
+        if self.downstream_codec == "pcm16":
+            return pcm16_to_wav(pcm, sample_rate)
+        return pack_audio(self.downstream_codec, pcm, sample_rate)
+
+    @property
+    def framed(self) -> bool:
+        """ True when the client speaks the framed protocol"""
+        return self.protocol == self.PROTOCOL_V2
+
+    def __repr__(self):
+        return f"ClientSession(id={self.session_id}, address={self.address})"
+
+
+class SessionManager:
+    """ Thread safe registry of ClientSession objects keyed by client socket.
+
+        The socket read loop opens and closes sessions, the worker threads look
+        them up by the socket that came with each queued packet.
+
+        auto_open: when True, packets from an unknown socket open a session on the fly.
+            Servers that open/close sessions themselves pass False so that audio still
+            queued for a disconnected client does not resurrect its session.
+
+        sample_rate / max_phrase_seconds: size of each session's pre-allocated phrase
+            buffer. Memory per session is bounded to 2 * sample_rate * max_phrase_seconds
+            int16 samples, older audio of longer phrases is dropped.
+    """
+    DEADLINE_MARGIN = 0.002
+
+    def __init__(self, auto_open=True, sample_rate=16000, max_phrase_seconds=30.0):
+        self.auto_open = auto_open
+        self.sample_rate = sample_rate
+        self.max_phrase_seconds = max_phrase_seconds
+        self._sessions : OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._serve_counter = itertools.count(1)
+
+    def open(self, client_socket, address=None) -> ClientSession:
+        """ Registers a new client socket and returns its session"""
+        with self._lock:
+            session = self._sessions.get(client_socket)
+            if session is None:
+                session = ClientSession(client_socket, address,
+                                        self.sample_rate, self.max_phrase_seconds)
+                self._sessions[client_socket] = session
+            return session
+
+    def get(self, client_socket):
+        """ Returns the session of a socket or None if it is unknown or closed"""
+        with self._lock:
+            return self._sessions.get(client_socket)
+
+    def session_for(self, client_socket):
+        """ Returns the session of a socket, opening one if auto_open is set"""
+        session = self.get(client_socket)
+        if session is None and self.auto_open:
+            session = self.open(client_socket)
+        return session
+
+    def close(self, client_socket):
+        """ Removes a socket's session and marks it closed so in-flight work is dropped"""
+        with self._lock:
+            session = self._sessions.pop(client_socket, None)
+        if session:
+            session.closed = True
+        return session
+
+    def by_id(self, session_id):
+        """ Returns the open session with this id or None"""
+        with self._lock:
+            return next((session for session in self._sessions.values()
+                         if session.session_id == session_id), None)
+
+    def sessions(self):
+        """ Snapshot of the currently open sessions"""
+        with self._lock:
+            return list(self._sessions.values())
+
+    def seconds_until_timeout(self, phrase_timeout, current_time,
+                              pending=lambda session: session.recent_transcription):
+        """ Seconds until the first session with pending work has been quiet for longer
+            than phrase_timeout, or None if no session has anything to flush.
+            Workers use it as the timeout of their blocking queue get.
+        """
+        deadlines = [session.phrase_time for session in self.sessions() if pending(session)]
+        if not deadlines:
+            return None
+        deadline = min(deadlines) + timedelta(seconds=phrase_timeout) - current_time
+        # Flushing checks for strictly more than phrase_timeout, wake up just after
+        return max(deadline.total_seconds(), 0.0) + self.DEADLINE_MARGIN
+
+    def fair_order(self, sessions):
+        """ Orders sessions so the one that was served least recently goes first,
+            and records that they are being served now.
+        """
+        ordered = sorted(sessions, key=lambda session: session.last_served)
+        for session in ordered:
+            session.last_served = next(self._serve_counter)
+        return ordered
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def __contains__(self, client_socket):
+        with self._lock:
+            return client_socket in self._sessions
+
+
+class FairQueue:
+    """ Drop-in replacement for queue.Queue that keeps one FIFO per key and hands items
+        out round-robin across keys. A client that finalizes many phrases in a burst
+        cannot make the others wait behind its whole backlog.
+
+        put((client, payload)) uses the first tuple element as the key, put(None) queues
+        a wake-up sentinel for consumers blocked in get().
+
+        maxsize > 0 bounds the number of queued items, put() then blocks (or raises
+        queue.Full after timeout) like Queue.put. Sentinels are never refused.
+        exclusive=True hands out at most one item per key at a time: a key stays busy
+        until task_done(key), so several consumers keep each key's items in order.
+    """
+    def __init__(self, maxsize=0, exclusive=False):
+        self._queues : OrderedDict = OrderedDict()
+        self._not_empty = threading.Condition()
+        self._not_full = threading.Condition(self._not_empty)
+        self._size = 0
+        self.maxsize = maxsize
+        self.exclusive = exclusive
+        self._busy = set()
+
+    def put(self, item, key=None, block=True, timeout=None) -> None:
+        """ Adds an item to the FIFO of its key"""
+        if key is None and item is not None:
+            key = item[0]
+        with self._not_empty:
+            if self.maxsize > 0 and item is not None:
+                if not block:
+                    if self._size >= self.maxsize:
+                        raise Full
+                elif not self._not_full.wait_for(lambda: self._size < self.maxsize, timeout=timeout):
+                    raise Full
+            self._queues.setdefault(key, deque()).append(item)
+            self._size += 1
+            self._not_empty.notify_all() if self.exclusive else self._not_empty.notify()
+
+    def get(self, block=True, timeout=None):
+        """ Removes the next item, rotating over keys. Raises queue.Empty like Queue.get"""
+        with self._not_empty:
+            key = self.__ready_key__()
+            if key is _NO_KEY and block:
+                deadline = None if timeout is None else time.monotonic() + timeout
+                while key is _NO_KEY:
+                    remaining = None if deadline is None else deadline - time.monotonic()
+                    if remaining is not None and remaining <= 0:
+                        break
+                    self._not_empty.wait(remaining)
+                    key = self.__ready_key__()
+            if key is _NO_KEY:
+                raise Empty
+            items = self._queues[key]
+            item = items.popleft()
+            # Move the key to the back so the other keys are served first next time
+            del self._queues[key]
+            if items:
+                self._queues[key] = items
+            self._size -= 1
+            if self.exclusive and item is not None:
+                self._busy.add(key)
+            self._not_full.notify()
+            return item
+
+    def get_nowait(self):
+        """ Equivalent to get(block=False)"""
+        return self.get(block=False)
+
+    def discard(self, key) -> int:
+        """ Drops every pending item of a key, returns how many were dropped"""
+        with self._not_empty:
+            items = self._queues.pop(key, ())
+            self._size -= len(items)
+            self._not_full.notify_all()
+            return len(items)
+
+    def task_done(self, key=None) -> None:
+        """ Releases a key taken by get() in exclusive mode. Without exclusive mode it is
+            kept for queue.Queue compatibility, FairQueue does not track unfinished tasks"""
+        if not self.exclusive:
+            return
+        with self._not_empty:
+            self._busy.discard(key)
+            self._not_empty.notify_all()
+
+    def __ready_key__(self):
+        """ First key in rotation order that has items and is not busy"""
+        for key in self._queues:
+            if key not in self._busy:
+                return key
+        return _NO_KEY
+
+    def empty(self) -> bool:
+        with self._not_empty:
+            return not self._size
+
+    def qsize(self) -> int:
+        with self._not_empty:
+            return self._size
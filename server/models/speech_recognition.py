@@ -1,13 +1,75 @@
 """ Speech Recognition using OpenAI's Whisper model with real-time processing"""
-import io
 import time
 import threading
-from queue import Queue
+from queue import Queue, Empty
 from datetime import datetime, timedelta
 import torch
 import whisper
-import soundfile as sf
-import speech_recognition as sr
+from models.session_manager import SessionManager
+from models.whisper_batcher import WhisperBatchScheduler
+
+class HypothesisBuffer:
+    """ Committed-prefix agreement (LocalAgreement-2) over consecutive Whisper hypotheses.
+
+        Every decode of the sliding window yields timestamped words. Words that two
+        consecutive hypotheses agree on are committed and never change again, the rest
+        stays as the unstable tail. Times are seconds since the start of the phrase.
+    """
+    # Words re-decoded from audio before this margin of the last commit are ignored
+    COMMIT_MARGIN = 0.1
+    # Longest n-gram of already committed words Whisper may repeat at the window start
+    MAX_OVERLAP = 5
+
+    def __init__(self):
+        # Lists of (start, end, word)
+        self.committed = []
+        self.hypothesis = []
+        self.last_committed_time = 0.0
+        # Phrase time up to which audio has been decoded
+        self.decoded_until = 0.0
+        # Whether a line was already emitted for this phrase
+        self.emitted = False
+
+    @staticmethod
+    def __normalize__(word):
+        return word.strip().lower().strip(".,!?;:\"'")
+
+    def insert(self, words):
+        """ Adds a new hypothesis, returns the words committed by it"""
+        new = [w for w in words if w[0] > self.last_committed_time - self.COMMIT_MARGIN]
+        if new and self.committed and abs(new[0][0] - self.last_committed_time) < 1:
+            for n in range(min(len(self.committed), len(new), self.MAX_OVERLAP), 0, -1):
+                tail = [self.__normalize__(w[2]) for w in self.committed[-n:]]
+                head = [self.__normalize__(w[2]) for w in new[:n]]
+                if tail == head:
+                    new = new[n:]
+                    break
+        commit = []
+        while new and self.hypothesis and \
+                self.__normalize__(new[0][2]) == self.__normalize__(self.hypothesis[0][2]):
+            commit.append(new.pop(0))
+            self.hypothesis.pop(0)
+        if commit:
+            self.committed.extend(commit)
+            self.last_committed_time = commit[-1][1]
+        self.hypothesis = new
+        return commit
+
+    def commit_all(self):
+        """ Commits the unstable tail, used once no further audio will arrive for the phrase"""
+        if self.hypothesis:
+            self.committed.extend(self.hypothesis)
+            self.last_committed_time = self.hypothesis[-1][1]
+            self.hypothesis = []
+
+    def committed_text(self):
+        return "".join(w[2] for w in self.committed).strip()
+
+    def partial_text(self):
+        return "".join(w[2] for w in self.hypothesis).strip()
+
+    def text(self):
+        return "".join(w[2] for w in self.committed + self.hypothesis).strip()
 
 class SpeechRecognitionModel:
     """ Initalize this class with a data_queue. For all the audio you want to process, 
@@ -23,13 +85,27 @@ class SpeechRecognitionModel:
             This is useful in cases where you need the final result for each phrase 
             and cannot rewrite the last line.
 
+        session_manager: optional SessionManager shared with the server. Every client
+            socket gets its own audio buffer and phrase state, so concurrent speakers
+            do not flush each other's phrases.
+
+        streaming: instead of re-transcribing the whole phrase on every tick, decode a
+            sliding window at most every min_chunk_seconds, commit the words two
+            consecutive hypotheses agree on and trim committed audio out of the window
+            once it grows past window_seconds. Packets sent to generation_callback also
+            carry "committed" and "partial" text. A phrase ends after phrase_timeout
+            seconds without audio.
+
+        batching: run the windows of all sessions that received audio through a
+            WhisperBatchScheduler, one batched encoder/decoder pass instead of one
+            transcribe call per session. Pass batch_scheduler to share one scheduler
+            (and model) between several recognizers. Not used in streaming mode, which
+            needs the word timestamps of transcribe.
+
     """
     def __init__(self, data_queue,
-                 generation_callback=lambda *args: None, final_callback=lambda *args: None, model_name="base"):
-        # The last time a recording was retrieved from the queue.
-        self.phrase_time = datetime.utcnow()
-        # Current raw audio bytes.
-        self.last_sample = bytes()
+                 generation_callback=lambda *args: None, final_callback=lambda *args: None, model_name="base",
+                 session_manager=None, streaming=False, batching=False, batch_scheduler=None):
         # Thread safe Queue for passing data from the threaded recording callback.
         self.data_queue : Queue = data_queue
         # Callback to get real-time transcription results
@@ -38,6 +114,13 @@ class SpeechRecognitionModel:
         self.final_callback = final_callback
         # How much empty space between recordings before new lines in transcriptions
         self.phrase_timeout = 1
+        # Streaming mode: minimum new audio between decodes, and window size before
+        #   committed audio is trimmed (Whisper sees at most 30 seconds)
+        self.streaming = streaming
+        self.min_chunk_seconds = 1.0
+        self.window_seconds = 15.0
+        # Characters of committed text passed as prompt to keep context after trimming
+        self.prompt_chars = 200
 
         self.device = "cuda:0" if torch.cuda.is_available() else "cpu"
         print(f"Loading model whisper-{model_name} on {self.device}")
@@ -45,15 +128,21 @@ class SpeechRecognitionModel:
         self.audio_model = whisper.load_model(model_name, device=self.device)
         self.decoding_options : dict = {"task": "translate"}
         print(f"Whisper DecodingOptions: {self.decoding_options}")
+        # A scheduler created here is started and stopped with this recognizer
+        self._owns_batch_scheduler = batching and batch_scheduler is None
+        if self._owns_batch_scheduler:
+            batch_scheduler = WhisperBatchScheduler(self.audio_model, self.decoding_options)
+        self.batch_scheduler = batch_scheduler
         self.thread = None
         self._kill_thread = False
 
-        self.recent_transcription = ""
-
-        self.current_client = None
+        # Per-client phrase state, one ClientSession for every connected socket
+        self.sessions = session_manager if session_manager is not None else SessionManager()
 
     def start(self, sample_rate, sample_width):
         """ Starts the worker thread """
+        if self._owns_batch_scheduler:
+            self.batch_scheduler.start()
         self.thread = threading.Thread(target=self.__worker__, args=(sample_rate, sample_width))
         self._kill_thread = False
         self.thread.start()
@@ -62,83 +151,219 @@ class SpeechRecognitionModel:
         """ Stops the worker thread """
         self._kill_thread = True
         if self.thread:
+            # Wake the worker up from its blocking get
+            self.data_queue.put(None)
             self.thread.join()
             self.thread = None
+        if self._owns_batch_scheduler:
+            self.batch_scheduler.stop()
 
     def __worker__(self, sample_rate, sample_width):
         """ Worker thread event loop"""
         while not self._kill_thread:
+            # Sleep until audio arrives or the next phrase is due to be flushed
+            timeout = self.sessions.seconds_until_timeout(self.phrase_timeout, datetime.utcnow(),
+                                                          pending=self.__pending__)
+            try:
+                packet = self.data_queue.get(timeout=timeout)
+            except Empty:
+                packet = None
             now = datetime.utcnow()
             self.__flush_last_phrase__(now)
-            if not self.data_queue.empty():
-                phrase_complete = self.__update_phrase_time__(now)
-                self.__concatenate_new_audio__()
-                self.__transcribe_audio__(sample_rate, sample_width, phrase_complete)
-            time.sleep(0.05)
+            if packet is not None:
+                updated = self.__concatenate_new_audio__(now, packet)
+                # Sessions that waited longest for the model go first
+                sessions = self.sessions.fair_order(list(updated))
+                if self.batch_scheduler and not self.streaming:
+                    self.__transcribe_batch__(sessions, updated)
+                    continue
+                for session in sessions:
+                    self.__transcribe_audio__(session, sample_rate, sample_width, updated[session])
 
-    def __update_phrase_time__(self, current_time):
+    def __pending__(self, session) -> bool:
+        """ Whether the session has a phrase to flush. A streaming phrase shorter than
+            min_chunk_seconds has audio but no transcription yet"""
+        if self.streaming:
+            return bool(session.recent_transcription or session.asr_state is not None or session.audio.duration)
+        return bool(session.recent_transcription)
+
+    def __update_phrase_time__(self, session, current_time):
         phrase_complete = False
-        # If enough time has passed between recordings, consider the phrase complete.
+        # If no audio arrived for a while (phrase_time is the time of the last audio),
+        #   consider the phrase complete.
         #   Clear the current working audio buffer to start over with the new data.
-        if self.phrase_time and current_time - self.phrase_time > timedelta(seconds=
-                                                                            self.phrase_timeout):
-            self.phrase_time = current_time
-            self.last_sample = bytes()
+        if session.phrase_time and current_time - session.phrase_time > timedelta(seconds=
+                                                                                  self.phrase_timeout):
+            if self.streaming:
+                # Decode what is left of the phrase before its audio is dropped
+                self.__finish_streaming_phrase__(session)
+            session.reset_phrase(current_time)
             phrase_complete = True
         return phrase_complete
 
     def __flush_last_phrase__(self, current_time) -> None:
         """ 
-        Flush the last phrase if no audio has been sent in a while.
+        Flush the last phrase of every client that has not sent audio in a while.
         If there is anything to flush, we'll update the phrase time.
         """
-        if self.phrase_time and current_time - self.phrase_time > timedelta(seconds=
-                                                                            self.phrase_timeout):
-            if self.recent_transcription and self.current_client:
-                print(f"Flush {self.recent_transcription}")
-                self.final_callback(self.recent_transcription, self.current_client)
-                self.recent_transcription = ""
-
-                self.phrase_time = current_time
-                self.last_sample = bytes()
-
-    def __concatenate_new_audio__(self):
-        while not self.data_queue.empty():
-            client, data = self.data_queue.get()
-            if client != self.current_client:
-                print(f"Flush {self.recent_transcription}")
-                self.final_callback(self.recent_transcription, self.current_client)
-                self.recent_transcription = ""
-                self.phrase_time = datetime.utcnow()
-                self.last_sample = bytes()
-            self.last_sample += data
-            self.current_client = client
-
-
-    def __transcribe_audio__(self, sample_rate, sample_width, phrase_complete):
+        for session in self.sessions.sessions():
+            if session.phrase_time and current_time - session.phrase_time > timedelta(seconds=
+                                                                                      self.phrase_timeout):
+                if self.streaming and self.__pending__(session):
+                    self.__finish_streaming_phrase__(session)
+                    if not session.recent_transcription:
+                        # Nothing recognized (e.g. a noise burst), start over
+                        session.reset_phrase(current_time)
+                if session.recent_transcription:
+                    print(f"Flush {session.recent_transcription}")
+                    self.final_callback(session.recent_transcription, session.client_socket)
+                    session.recent_transcription = ""
+                    session.reset_phrase(current_time)
+
+    def __concatenate_new_audio__(self, current_time, packet):
+        """ Drains the data queue into the buffer of each client's session.
+            Returns {session: phrase_complete} for every session that received audio.
+        """
+        updated = {}
+        while packet is not None:
+            client, data = packet
+            packet = self.__next_packet__()
+            session = self.sessions.session_for(client)
+            if session is None or session.closed:
+                continue
+            if session not in updated:
+                updated[session] = self.__update_phrase_time__(session, current_time)
+                # A phrase ends after phrase_timeout without audio, not phrase_timeout after
+                #   it started: continuously captured frames must not cut a sentence in the middle
+                session.phrase_time = current_time
+            session.audio.append(data)
+        return updated
+
+
+    def __next_packet__(self):
+        """ Next queued (client, data) without blocking, None when drained"""
+        try:
+            return self.data_queue.get_nowait()
+        except Empty:
+            return None
+
+    def __transcribe_audio__(self, session, sample_rate, sample_width, phrase_complete):
+        if self.streaming:
+            self.__transcribe_streaming__(session, phrase_complete)
+            return
         try:
-            audio_data = sr.AudioData(self.last_sample, sample_rate, sample_width)
-            wav_data = io.BytesIO(audio_data.get_wav_data())
-            with sf.SoundFile(wav_data, mode='r') as sound_file:
-                audio = sound_file.read(dtype='float32')
-                start_time = time.time()
-
-                result = self.audio_model.transcribe(audio,
-                                                     fp16=torch.cuda.is_available(),
-                                                     **self.decoding_options)
-                end_time = time.time()
-
-                text = result['text'].strip()
-                if text:
-                    self.generation_callback({"add": phrase_complete,
-                                              "text": text,
-                                              "transcribe_time": end_time - start_time})
-                    if phrase_complete and self.recent_transcription and self.current_client:
-                        print(f"Phrase complete: {self.recent_transcription}")
-                        self.final_callback(self.recent_transcription, self.current_client)
-                    self.recent_transcription = text
+            # int16 PCM -> float32 directly from the session buffer, no WAV round-trip
+            audio = session.audio.as_float32()
+            start_time = time.time()
+
+            result = self.audio_model.transcribe(audio,
+                                                 fp16=torch.cuda.is_available(),
+                                                 **self.decoding_options)
+            end_time = time.time()
+
+            self.__handle_text__(session, result['text'].strip(), phrase_complete, end_time - start_time)
         except Exception as e:
             print(f"Error during transcription: {e}")
 
+    def __transcribe_batch__(self, sessions, phrase_complete):
+        """ Submits the windows of all sessions at once so the scheduler can batch them"""
+        start_time = time.time()
+        futures = [(session, self.batch_scheduler.submit(session.audio.as_float32()))
+                   for session in sessions]
+        for session, future in futures:
+            try:
+                text = future.result().strip()
+            except Exception as e:
+                print(f"Error during transcription: {e}")
+                continue
+            self.__handle_text__(session, text, phrase_complete[session], time.time() - start_time)
+
+    def __handle_text__(self, session, text, phrase_complete, transcribe_time):
+        """ Publishes a new transcription of the session's phrase"""
+        if text:
+            self.generation_callback({"add": phrase_complete,
+                                      "text": text,
+                                      "transcribe_time": transcribe_time,
+                                      "session_id": session.session_id})
+            if phrase_complete and session.recent_transcription:
+                print(f"Phrase complete: {session.recent_transcription}")
+                self.final_callback(session.recent_transcription, session.client_socket)
+            session.recent_transcription = text
+
+    def __transcribe_streaming__(self, session, phrase_complete):
+        """ Decodes the session's sliding window and emits committed + partial text"""
+        try:
+            if phrase_complete and session.recent_transcription:
+                print(f"Phrase complete: {session.recent_transcription}")
+                self.final_callback(session.recent_transcription, session.client_socket)
+                session.recent_transcription = ""
+            self.__decode_window__(session)
+        except Exception as e:
+            print(f"Error during streaming transcription: {e}")
+
+    def __finish_streaming_phrase__(self, session):
+        """ Decodes the audio received since the last decode, however short, and commits
+            the whole hypothesis, so the final text includes the last words of the phrase"""
+        try:
+            if session.asr_state is None and not session.audio.duration:
+                return
+            self.__decode_window__(session, force=True)
+            session.asr_state.commit_all()
+            text = session.asr_state.text()
+            if text and text != session.recent_transcription:
+                self.generation_callback({"add": not session.asr_state.emitted,
+                                          "text": text,
+                                          "committed": text,
+                                          "partial": "",
+                                          "transcribe_time": 0.0,
+                                          "session_id": session.session_id})
+                session.asr_state.emitted = True
+            if text:
+                session.recent_transcription = text
+        except Exception as e:
+            print(f"Error during streaming transcription: {e}")
+
+    def __decode_window__(self, session, force=False):
+        """ Decodes the sliding window once at least min_chunk_seconds of new audio
+            arrived (force: any new audio) and emits committed + partial text"""
+        if session.asr_state is None:
+            session.asr_state = HypothesisBuffer()
+        state : HypothesisBuffer = session.asr_state
+        window_start = session.audio.window_start
+        window_end = window_start + session.audio.duration
+        undecoded = window_end - state.decoded_until
+        if undecoded <= 0 or (not force and undecoded < self.min_chunk_seconds):
+            return
+
+        audio = session.audio.as_float32()
+        start_time = time.time()
+        result = self.audio_model.transcribe(audio,
+                                             fp16=torch.cuda.is_available(),
+                                             word_timestamps=True,
+                                             condition_on_previous_text=False,
+                                             initial_prompt=state.committed_text()[-self.prompt_chars:] or None,
+                                             **self.decoding_options)
+        end_time = time.time()
+        state.decoded_until = window_end
+
+        words = [(window_start + word['start'], window_start + word['end'], word['word'])
+                 for segment in result['segments'] for word in segment.get('words', [])]
+        state.insert(words)
+        # Committed audio never needs decoding again, drop it once the window is long
+        if session.audio.duration > self.window_seconds and state.last_committed_time > window_start:
+            trim = int((state.last_committed_time - window_start) * session.audio.sample_rate)
+            session.audio.consume(trim)
+
+        text = state.text()
+        if text:
+            self.generation_callback({"add": not state.emitted,
+                                      "text": text,
+                                      "committed": state.committed_text(),
+                                      "partial": state.partial_text(),
+                                      "transcribe_time": end_time - start_time,
+                                      "session_id": session.session_id})
+            state.emitted = True
+            session.recent_transcription = text
+
     def __del__(self):
         self.stop()
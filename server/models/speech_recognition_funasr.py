@@ -1,25 +1,22 @@
 """ Speech Recognition using FunASR with real-time processing"""
-import io
 import time
 import threading
-from queue import Queue
+from queue import Queue, Empty
 from datetime import datetime, timedelta
 import torch
-import soundfile as sf
-import speech_recognition as sr
 from funasr import AutoModel
+from models.session_manager import SessionManager
 
 class FunASRSpeechRecognitionModel:
-    """ 使用FunASR进行语音识别的模型类 """
+    """ 使用FunASR进行语音识别的模型类
+        每个客户端socket拥有独立的ClientSession（音频缓冲、短语状态），多个用户可同时识别
+    """
     
     def __init__(self, data_queue,
                  generation_callback=lambda *args: None, 
                  final_callback=lambda *args: None, 
-                 model_name="paraformer-zh"):
-        # The last time a recording was retrieved from the queue.
-        self.phrase_time = datetime.utcnow()
-        # Current raw audio bytes.
-        self.last_sample = bytes()
+                 model_name="paraformer-zh",
+                 session_manager=None):
         # Thread safe Queue for passing data from the threaded recording callback.
         self.data_queue : Queue = data_queue
         # Callback to get real-time transcription results
@@ -54,8 +51,8 @@ class FunASRSpeechRecognitionModel:
 
         self.thread = None
         self._kill_thread = False
-        self.recent_transcription = ""
-        self.current_client = None
+        # 每个客户端一个ClientSession
+        self.sessions = session_manager if session_manager is not None else SessionManager()
 
     def start(self, sample_rate, sample_width):
         """ Starts the worker thread """
@@ -67,79 +64,98 @@ class FunASRSpeechRecognitionModel:
         """ Stops the worker thread """
         self._kill_thread = True
         if self.thread:
+            # Wake the worker up from its blocking get
+            self.data_queue.put(None)
             self.thread.join()
             self.thread = None
 
     def __worker__(self, sample_rate, sample_width):
         """ Worker thread event loop"""
         while not self._kill_thread:
+            # Sleep until audio arrives or the next phrase is due to be flushed
+            timeout = self.sessions.seconds_until_timeout(self.phrase_timeout, datetime.utcnow())
+            try:
+                packet = self.data_queue.get(timeout=timeout)
+            except Empty:
+                packet = None
             now = datetime.utcnow()
             self.__flush_last_phrase__(now)
-            if not self.data_queue.empty():
-                phrase_complete = self.__update_phrase_time__(now)
-                self.__concatenate_new_audio__()
-                self.__transcribe_audio__(sample_rate, sample_width, phrase_complete)
-            time.sleep(0.05)
+            if packet is not None:
+                updated = self.__concatenate_new_audio__(now, packet)
+                # 等待最久的会话优先识别
+                for session in self.sessions.fair_order(list(updated)):
+                    self.__transcribe_audio__(session, sample_rate, sample_width, updated[session])
 
-    def __update_phrase_time__(self, current_time):
+    def __update_phrase_time__(self, session, current_time):
         phrase_complete = False
-        # If enough time has passed between recordings, consider the phrase complete.
-        if self.phrase_time and current_time - self.phrase_time > timedelta(seconds=self.phrase_timeout):
-            self.phrase_time = current_time
-            self.last_sample = bytes()
+        # If no audio arrived for a while (phrase_time is the time of the last audio),
+        #   consider the phrase complete.
+        if session.phrase_time and current_time - session.phrase_time > timedelta(seconds=self.phrase_timeout):
+            session.reset_phrase(current_time)
             phrase_complete = True
         return phrase_complete
 
     def __flush_last_phrase__(self, current_time) -> None:
-        """ Flush the last phrase if no audio has been sent in a while. """
-        if self.phrase_time and current_time - self.phrase_time > timedelta(seconds=self.phrase_timeout):
-            if self.recent_transcription and self.current_client:
-                print(f"Flush {self.recent_transcription}")
-                self.final_callback(self.recent_transcription, self.current_client)
-                self.recent_transcription = ""
-                self.phrase_time = current_time
-                self.last_sample = bytes()
+        """ Flush the last phrase of every client that has not sent audio in a while. """
+        for session in self.sessions.sessions():
+            if session.phrase_time and current_time - session.phrase_time > timedelta(seconds=self.phrase_timeout):
+                if session.recent_transcription:
+                    print(f"Flush {session.recent_transcription}")
+                    self.final_callback(session.recent_transcription, session.client_socket)
+                    session.recent_transcription = ""
+                    session.reset_phrase(current_time)
 
-    def __concatenate_new_audio__(self):
-        while not self.data_queue.empty():
-            client, data = self.data_queue.get()
-            if client != self.current_client:
-                print(f"Flush {self.recent_transcription}")
-                self.final_callback(self.recent_transcription, self.current_client)
-                self.recent_transcription = ""
-                self.phrase_time = datetime.utcnow()
-                self.last_sample = bytes()
-            self.last_sample += data
-            self.current_client = client
+    def __concatenate_new_audio__(self, current_time, packet):
+        """ 把队列中的数据分发到各客户端的会话缓冲，返回 {session: phrase_complete} """
+        updated = {}
+        while packet is not None:
+            client, data = packet
+            packet = self.__next_packet__()
+            session = self.sessions.session_for(client)
+            if session is None or session.closed:
+                continue
+            if session not in updated:
+                updated[session] = self.__update_phrase_time__(session, current_time)
+                # 短语在 phrase_timeout 秒没有新音频 (停顿) 后结束，而不是开始后 phrase_timeout 秒，
+                # 否则连续采集的帧会在句子中间被切开
+                session.phrase_time = current_time
+            session.audio.append(data)
+        return updated
 
-    def __transcribe_audio__(self, sample_rate, sample_width, phrase_complete):
+    def __next_packet__(self):
+        """ Next queued (client, data) without blocking, None when drained"""
         try:
-            audio_data = sr.AudioData(self.last_sample, sample_rate, sample_width)
-            wav_data = io.BytesIO(audio_data.get_wav_data())
-            with sf.SoundFile(wav_data, mode='r') as sound_file:
-                audio = sound_file.read(dtype='float32')
-                start_time = time.time()
+            return self.data_queue.get_nowait()
+        except Empty:
+            return None
 
-                # 使用FunASR进行识别
-                result = self.audio_model.generate(
-                    input=audio,
-                    batch_size_s=60,
-                    hotword='',  # 可以添加热词
-                    use_itn=True  # 使用逆文本标准化
-                )
-                
-                end_time = time.time()
+    def __transcribe_audio__(self, session, sample_rate, sample_width, phrase_complete):
+        try:
+            # 直接从会话缓冲把int16 PCM转换为float32，不再经过WAV编码/解码
+            audio = session.audio.as_float32()
+            start_time = time.time()
+
+            # 使用FunASR进行识别
+            result = self.audio_model.generate(
+                input=audio,
+                batch_size_s=60,
+                hotword='',  # 可以添加热词
+                use_itn=True  # 使用逆文本标准化
+            )
+            
+            end_time = time.time()
 
-                if result and len(result) > 0:
-                    text = result[0]['text'].strip()
-                    if text:
-                        self.generation_callback({"add": phrase_complete,
-                                                  "text": text,
-                                                  "transcribe_time": end_time - start_time})
-                        if phrase_complete and self.recent_transcription and self.current_client:
-                            print(f"Phrase complete: {self.recent_transcription}")
-                            self.final_callback(self.recent_transcription, self.current_client)
-                        self.recent_transcription = text
+            if result and len(result) > 0:
+                text = result[0]['text'].strip()
+                if text:
+                    self.generation_callback({"add": phrase_complete,
+                                              "text": text,
+                                              "transcribe_time": end_time - start_time,
+                                              "session_id": session.session_id})
+                    if phrase_complete and session.recent_transcription:
+                        print(f"Phrase complete: {session.recent_transcription}")
+                        self.final_callback(session.recent_transcription, session.client_socket)
+                    session.recent_transcription = text
         except Exception as e:
             print(f"Error during FunASR transcription: {e}")
 
@@ -0,0 +1,205 @@
+""" Speech Recognition using FunASR's streaming Paraformer with per-session model cache"""
+import time
+import threading
+from queue import Queue, Empty
+from datetime import datetime, timedelta
+import numpy as np
+import torch
+from funasr import AutoModel
+from models.session_manager import SessionManager
+from utils.audio_buffer import pcm16_to_float32
+
+class FunASRStreamingState:
+    """ 单个会话的流式识别状态：模型cache和当前短语已识别的文本 """
+    def __init__(self):
+        # FunASR 在多次 generate 调用之间携带的编码器/解码器缓存
+        self.cache = {}
+        self.text = ""
+        self.fed_chunks = 0
+        self.emitted = False
+
+class FunASRStreamingSpeechRecognitionModel:
+    """ 使用FunASR流式Paraformer进行语音识别，可替代 FunASRSpeechRecognitionModel 作为
+        AudioSocketServerFunASR 的 transcriber。
+
+        每个会话的音频按固定大小的块 (chunk_size[1] * 60ms) 送入模型，模型cache在调用之间保留，
+        所以每块的计算量是常数，与短语长度无关。phrase_timeout 秒内没有新音频视为端点：
+        剩余音频以 is_final=True 送入模型冲刷cache，标点模型补全后通过 final_callback 输出。
+
+        generation_callback 收到的数据包与 FunASRSpeechRecognitionModel 相同，
+        另带 "partial": True 表示短语尚未结束。
+    """
+    # 离线模型名到对应流式模型名的映射
+    STREAMING_MODELS = {"paraformer-zh": "paraformer-zh-streaming"}
+    # 结束短语时缓冲区已空: 送入这么长的静音作为最后一块，冲刷模型cache中向后看的部分
+    FINAL_PADDING_MS = 60
+
+    def __init__(self, data_queue,
+                 generation_callback=lambda *args: None,
+                 final_callback=lambda *args: None,
+                 model_name="paraformer-zh-streaming",
+                 session_manager=None,
+                 chunk_size=(0, 10, 5),
+                 encoder_chunk_look_back=4,
+                 decoder_chunk_look_back=1,
+                 punc_model="ct-punc"):
+        # Thread safe Queue for passing data from the threaded recording callback.
+        self.data_queue : Queue = data_queue
+        # Callback to get real-time transcription results
+        self.generation_callback = generation_callback
+        # Callback for final transcription results
+        self.final_callback = final_callback
+        # How much empty space between recordings before the phrase is finalized
+        self.phrase_timeout = 1
+
+        # [0, 10, 5]: 每块600ms，向后看300ms
+        self.chunk_size = list(chunk_size)
+        self.encoder_chunk_look_back = encoder_chunk_look_back
+        self.decoder_chunk_look_back = decoder_chunk_look_back
+
+        if torch.cuda.is_available():
+            self.device = "cuda:0"
+            print(f"🚀 Using GPU: {torch.cuda.get_device_name(0)}")
+        else:
+            self.device = "cpu"
+            print("⚠️  Using CPU (GPU not available)")
+
+        model_name = self.STREAMING_MODELS.get(model_name, model_name)
+        print(f"Loading FunASR streaming model {model_name} on {self.device}")
+        try:
+            self.audio_model = AutoModel(model=model_name, device=self.device)
+            # 流式模型不带标点，短语结束时单独加标点
+            self.punc_model = AutoModel(model=punc_model, device=self.device) if punc_model else None
+            print("FunASR streaming model loaded successfully")
+        except Exception as e:
+            print(f"Error loading FunASR streaming model: {e}")
+            raise e
+
+        self.thread = None
+        self._kill_thread = False
+        self.chunk_stride = 0
+        # 每个客户端一个ClientSession，会话缓冲只保存尚未送入模型的音频
+        self.sessions = session_manager if session_manager is not None else SessionManager()
+
+    def start(self, sample_rate, sample_width):
+        """ Starts the worker thread """
+        # chunk_size[1] 个 60ms 帧
+        self.chunk_stride = self.chunk_size[1] * sample_rate * 60 // 1000
+        self.final_padding = np.zeros(sample_rate * self.FINAL_PADDING_MS // 1000, dtype=np.float32)
+        self.thread = threading.Thread(target=self.__worker__, args=(sample_rate, sample_width))
+        self._kill_thread = False
+        self.thread.start()
+
+    def stop(self):
+        """ Stops the worker thread """
+        self._kill_thread = True
+        if self.thread:
+            # Wake the worker up from its blocking get
+            self.data_queue.put(None)
+            self.thread.join()
+            self.thread = None
+
+    def __worker__(self, sample_rate, sample_width):
+        """ Worker thread event loop"""
+        while not self._kill_thread:
+            # 阻塞等待新音频，或等到下一个会话到达端点时间
+            timeout = self.sessions.seconds_until_timeout(self.phrase_timeout, datetime.utcnow(),
+                                                          pending=lambda session: session.asr_state is not None)
+            try:
+                packet = self.data_queue.get(timeout=timeout)
+            except Empty:
+                packet = None
+            now = datetime.utcnow()
+            self.__flush_last_phrase__(now)
+            if packet is not None:
+                updated = self.__concatenate_new_audio__(now, packet)
+                for session in self.sessions.fair_order(updated):
+                    self.__transcribe_audio__(session, is_final=False)
+
+    def __flush_last_phrase__(self, current_time) -> None:
+        """ 端点检测：超过 phrase_timeout 没有新音频的会话以 is_final=True 结束当前短语 """
+        for session in self.sessions.sessions():
+            if session.asr_state is not None and \
+                    current_time - session.phrase_time > timedelta(seconds=self.phrase_timeout):
+                if session.audio or session.asr_state.fed_chunks:
+                    self.__transcribe_audio__(session, is_final=True)
+                text = self.__punctuate__(session.asr_state.text)
+                session.reset_phrase(current_time)
+                if text:
+                    print(f"Flush {text}")
+                    self.final_callback(text, session.client_socket)
+
+    def __concatenate_new_audio__(self, current_time, packet):
+        """ 把队列中的数据分发到各客户端的会话缓冲，返回收到音频的会话 """
+        updated = []
+        while packet is not None:
+            client, data = packet
+            packet = self.__next_packet__()
+            session = self.sessions.session_for(client)
+            if session is None or session.closed:
+                continue
+            if session.asr_state is None:
+                session.asr_state = FunASRStreamingState()
+            if session not in updated:
+                updated.append(session)
+            session.phrase_time = current_time
+            session.audio.append(data)
+        return updated
+
+    def __next_packet__(self):
+        """ Next queued (client, data) without blocking, None when drained"""
+        try:
+            return self.data_queue.get_nowait()
+        except Empty:
+            return None
+
+    def __transcribe_audio__(self, session, is_final):
+        """ 把会话缓冲中完整的块送入模型；is_final 时连同不足一块的剩余音频一起冲刷cache。
+            没有剩余音频时用一小段静音作为最后一块，没有送入过任何音频时不调用模型"""
+        state : FunASRStreamingState = session.asr_state
+        try:
+            while len(session.audio) >= self.chunk_stride or is_final:
+                chunk = session.audio.view()[:self.chunk_stride]
+                last = is_final and len(session.audio) <= self.chunk_stride
+                if not len(chunk) and not state.fed_chunks:
+                    break
+                start_time = time.time()
+                result = self.audio_model.generate(
+                    input=pcm16_to_float32(chunk) if len(chunk) else self.final_padding,
+                    cache=state.cache,
+                    is_final=last,
+                    chunk_size=self.chunk_size,
+                    encoder_chunk_look_back=self.encoder_chunk_look_back,
+                    decoder_chunk_look_back=self.decoder_chunk_look_back
+                )
+                end_time = time.time()
+                session.audio.consume(len(chunk))
+                state.fed_chunks += 1
+
+                text = result[0]['text'] if result else ""
+                if text:
+                    state.text += text
+                    self.generation_callback({"add": not state.emitted,
+                                              "text": state.text,
+                                              "partial": not last,
+                                              "transcribe_time": end_time - start_time,
+                                              "session_id": session.session_id})
+                    state.emitted = True
+                if last:
+                    break
+            session.recent_transcription = state.text
+        except Exception as e:
+            print(f"Error during FunASR streaming transcription: {e}")
+
+    def __punctuate__(self, text):
+        if not text or not self.punc_model:
+            return text
+        try:
+            result = self.punc_model.generate(input=text)
+            return result[0]['text'] if result else text
+        except Exception as e:
+            print(f"Error during FunASR punctuation: {e}")
+            return text
+
+    def __del__(self):
+        self.stop()
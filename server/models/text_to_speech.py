@@ -1,16 +1,27 @@
 """ Microsoft T5 Text to Speech with Asynchronous Processing with Threads """
+import hashlib
 import threading
 import time
-from queue import Queue
+from queue import Empty
 import torch
 from datasets import load_dataset
 from transformers import SpeechT5Processor, SpeechT5ForTextToSpeech, SpeechT5HifiGan
+from models.session_manager import FairQueue
+from models.tts_cache import TTSAudioCache
 
 class TextToSpeechModel:
     """ Initalize this class with a callback_function to handle completed requests
         asynchronously. Alternatively use the synthesise_blocking function. 
+
+        max_batch_size: when several phrases are queued, the worker takes up to this
+            many (round-robin across clients) and synthesizes them in one padded batch,
+            spectrograms and HiFi-GAN vocoder included. 1 keeps serial synthesis.
+        audio_cache: TTSAudioCache for repeated phrases, keyed by text and speaker
+            embedding. None uses a default cache, False disables caching.
     """
-    def __init__(self, callback_function):
+    MODEL_NAME = "microsoft/speecht5_tts"
+
+    def __init__(self, callback_function, max_batch_size=1, audio_cache=None):
         # 强制使用GPU加速TTS
         if torch.cuda.is_available():
             self.device = "cuda:0"
@@ -18,18 +29,22 @@ class TextToSpeechModel:
         else:
             self.device = "cpu"
             print("⚠️  TTS using CPU (GPU not available)")
-        self.processor = SpeechT5Processor.from_pretrained("microsoft/speecht5_tts",
+        self.processor = SpeechT5Processor.from_pretrained(self.MODEL_NAME,
                                                            normalize=True)
 
-        self.model = SpeechT5ForTextToSpeech.from_pretrained("microsoft/speecht5_tts")
+        self.model = SpeechT5ForTextToSpeech.from_pretrained(self.MODEL_NAME)
         self.vocoder = SpeechT5HifiGan.from_pretrained("microsoft/speecht5_hifigan")
 
         self.model.to(self.device)
         self.vocoder.to(self.device)
 
-        # List of tuple of (text, callback_function)
-        self.task_queue = Queue()
+        # Tuples of (client_socket, text), served round-robin across clients
+        self.task_queue = FairQueue()
         self.callback_function = callback_function
+        self.max_batch_size = max_batch_size
+        self.speaker_embeddings = None
+        self.audio_cache = TTSAudioCache() if audio_cache is None else audio_cache
+        self._voice_id = None
 
         # Run in daemon so it self exits
         self.__kill_thread = False
@@ -37,7 +52,13 @@ class TextToSpeechModel:
         self.thread.start()
 
     def __del__(self):
+        self.stop()
+
+    def stop(self):
+        """ Stops the worker thread once the current task is done"""
         self.__kill_thread = True
+        # Wake the worker up from its blocking get
+        self.task_queue.put(None)
         self.thread.join()
 
     def load_speaker_embeddings(self):
@@ -46,6 +67,7 @@ class TextToSpeechModel:
         # self.speaker_embeddings = self.speaker_embeddings.squeeze(1)
         embeddings_dataset = load_dataset("Matthijs/cmu-arctic-xvectors", split="validation")
         self.speaker_embeddings = torch.tensor(embeddings_dataset[7306]["xvector"]).unsqueeze(0)
+        self._voice_id = None
 
 
     def synthesise(self, text, client_socket) -> None:
@@ -57,6 +79,10 @@ class TextToSpeechModel:
 
     def synthesise_blocking(self, text):
         """Synthesize speech and return it, this is a blocking function"""
+        cached = self.__cached__(text)
+        if cached is not None:
+            print(f"synthesize (cached) : {text}")
+            return cached
         inputs = self.processor(text=text, return_tensors="pt")
         start_time = time.time()
         speech = self.model.generate_speech(
@@ -66,16 +92,93 @@ class TextToSpeechModel:
                 )
         end_time = time.time()
         print(f"synthesize : {text}. Time: {end_time - start_time}")
-        return speech.cpu()
+        speech = speech.cpu()
+        self.__store__(text, speech)
+        return speech
+
+    def synthesise_batch(self, texts):
+        """Synthesize several texts in one padded batch, returns one tensor per text.
+           This is a blocking function"""
+        results = [self.__cached__(text) for text in texts]
+        missing = [i for i, result in enumerate(results) if result is None]
+        if not missing:
+            print(f"synthesize batch of {len(texts)} (cached)")
+            return results
+        texts = [texts[i] for i in missing]
+        inputs = self.processor(text=texts, return_tensors="pt", padding=True)
+        start_time = time.time()
+        speech, lengths = self.model.generate_speech(
+                    inputs["input_ids"].to(self.device),
+                    self.speaker_embeddings.to(self.device),
+                    attention_mask=inputs["attention_mask"].to(self.device),
+                    vocoder=self.vocoder,
+                    return_output_lengths=True
+                )
+        end_time = time.time()
+        print(f"synthesize batch of {len(texts)}. Time: {end_time - start_time}")
+        speech = speech.cpu()
+        for row, (i, length) in enumerate(zip(missing, lengths.tolist())):
+            results[i] = speech[row, :length]
+            self.__store__(texts[row], results[i])
+        return results
+
+    def __cache_key__(self, text):
+        if self._voice_id is None:
+            # The speaker embedding is the voice, identify it by content
+            embedding = self.speaker_embeddings.detach().cpu().float().contiguous().numpy()
+            self._voice_id = hashlib.sha1(embedding.tobytes()).hexdigest()
+        return TTSAudioCache.make_key(text, backend=self.MODEL_NAME, language="en", voice=self._voice_id)
+
+    def __cached__(self, text):
+        """ Cached waveform of a phrase or None"""
+        if not self.audio_cache:
+            return None
+        audio = self.audio_cache.get(self.__cache_key__(text))
+        if audio is None:
+            return None
+        return torch.frombuffer(bytearray(audio), dtype=torch.float32)
+
+    def __store__(self, text, speech):
+        if self.audio_cache:
+            self.audio_cache.put(self.__cache_key__(text), speech.float().contiguous().numpy().tobytes())
+
+    def __next_batch__(self):
+        """ Blocks for one task, then adds whatever else is already queued up to
+            max_batch_size. Returns an empty list when woken up by stop()"""
+        task = self.task_queue.get()
+        if task is None:
+            return []
+        batch = [task]
+        while len(batch) < self.max_batch_size:
+            try:
+                task = self.task_queue.get_nowait()
+            except Empty:
+                break
+            if task is None:
+                break
+            batch.append(task)
+        return batch
 
     # Don't call this code directly!
     def worker(self):
         """ Worker thread event loop"""
         while not self.__kill_thread:
-            if not self.task_queue.empty():
-                client, text = self.task_queue.get()
-                audio = self.synthesise_blocking(text)
-                self.callback_function(audio, client)
-                self.task_queue.task_done()
-            time.sleep(0.05)
+            # Blocks until a task (or the stop sentinel) is queued
+            batch = self.__next_batch__()
+            if len(batch) > 1:
+                try:
+                    audios = self.synthesise_batch([text for _, text in batch])
+                except Exception as e:
+                    # One bad phrase fails the whole batch, retry them one by one
+                    print(f"Error during TTS batch of {len(batch)}: {e}")
+                    audios = [None] * len(batch)
+            else:
+                audios = [None] * len(batch)
+            for (client, text), audio in zip(batch, audios):
+                try:
+                    if audio is None:
+                        audio = self.synthesise_blocking(text)
+                    self.callback_function(audio, client)
+                except Exception as e:
+                    print(f"Error during TTS of '{text}': {e}")
         
\ No newline at end of file
@@ -0,0 +1,115 @@
+""" Two-tier (in-memory LRU + sqlite) cache for translated phrases"""
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+DEFAULT_CACHE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                  "server_outputs", "translation_cache.sqlite3")
+
+def normalize_text(text: str) -> str:
+    """ Cache key form of a phrase: NFKC, case folded, whitespace collapsed"""
+    return re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip().casefold()
+
+class TranslationCache:
+    """ Bounded LRU of translations backed by a sqlite file, so stock phrases survive
+        restarts. Entries are keyed by (normalized text, source, target, service) and
+        expire ttl seconds after they were stored, in both tiers.
+
+        db_path=None keeps the cache in memory only. Thread safe.
+    """
+    def __init__(self, max_entries=2048, ttl=7 * 24 * 3600, db_path=DEFAULT_CACHE_PATH):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory : OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        # Statistics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expired = 0
+        if db_path:
+            os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute("""CREATE TABLE IF NOT EXISTS translations (
+                                    text TEXT NOT NULL, source TEXT NOT NULL,
+                                    target TEXT NOT NULL, service TEXT NOT NULL,
+                                    translation TEXT NOT NULL, created REAL NOT NULL,
+                                    PRIMARY KEY (text, source, target, service))""")
+            self.purge_expired()
+
+    def get(self, text: str, source: str, target: str, service: str) -> Optional[str]:
+        """ Returns the cached translation or None"""
+        key = (normalize_text(text), source, target, service)
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                translation, created = entry
+                if now - created <= self.ttl:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return translation
+                del self._memory[key]
+                self.expired += 1
+            if self._db is not None:
+                row = self._db.execute("SELECT translation, created FROM translations WHERE text=? AND "
+                                       "source=? AND target=? AND service=?", key).fetchone()
+                if row and now - row[1] <= self.ttl:
+                    self.__remember__(key, row[0], row[1])
+                    self.disk_hits += 1
+                    return row[0]
+                if row:
+                    self._db.execute("DELETE FROM translations WHERE text=? AND source=? AND "
+                                     "target=? AND service=?", key)
+                    self._db.commit()
+                    self.expired += 1
+            self.misses += 1
+            return None
+
+    def put(self, text: str, source: str, target: str, service: str, translation: str) -> None:
+        """ Stores a translation in both tiers"""
+        key = (normalize_text(text), source, target, service)
+        created = time.time()
+        with self._lock:
+            self.__remember__(key, translation, created)
+            if self._db is not None:
+                self._db.execute("INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?)",
+                                 (*key, translation, created))
+                self._db.commit()
+
+    def purge_expired(self) -> int:
+        """ Deletes expired entries from both tiers, returns how many were on disk"""
+        cutoff = time.time() - self.ttl
+        with self._lock:
+            for key in [key for key, (_, created) in self._memory.items() if created < cutoff]:
+                del self._memory[key]
+            if self._db is None:
+                return 0
+            deleted = self._db.execute("DELETE FROM translations WHERE created < ?", (cutoff,)).rowcount
+            self._db.commit()
+            return deleted
+
+    def stats(self) -> dict:
+        """ Hit/miss counters and current size"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "expired": self.expired, "entries": len(self._memory),
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __remember__(self, key, translation, created):
+        self._memory[key] = (translation, created)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
@@ -4,12 +4,26 @@ import json
 from typing import Optional
 # from googletrans import Translator as GoogleTranslator # 旧的导入
 from deep_translator import GoogleTranslator as DeepGoogleTranslator # 新的导入
+from models.translation_cache import TranslationCache
 
 class Translator:
-    """翻译器类，支持多种翻译服务"""
+    """翻译器类，支持多种翻译服务
+
+    service: "google" (deep-translator), "local" (本地 seq2seq 模型，离线可用，
+             多个会话的句子合并批处理)，"baidu" 或其他 (本地简单映射)。
+    local_model / quantize / local_options: service="local" 时传给 LocalTranslationModel。
+    cache: 翻译缓存 (内存LRU + sqlite)。None 使用默认的 TranslationCache，
+           False 关闭缓存，也可以传入自定义的 TranslationCache 实例。
+           重复的短语直接从缓存返回，不再发起网络请求。缓存键包含实际的源/目标语言，
+           本地模型还包含模型名称和是否量化，换模型后不会返回旧模型的译文。
+    """
     
-    def __init__(self, service="google"):
+    def __init__(self, service="google", cache=None,
+                 local_model="Helsinki-NLP/opus-mt-zh-en", quantize=False, **local_options):
         self.service = service
+        # 缓存键中的服务名和语言对
+        self.cache_service = service
+        self.source_lang, self.target_lang = "auto", "en"
         if service == "google":
             try:
                 # 初始化 deep-translator 的 GoogleTranslator
@@ -18,25 +32,58 @@ class Translator:
             except Exception as e:
                 print(f"❌ Deep Translator (Google) 初始化失败: {e}")
                 self.google_translator = None
+        elif service == "local":
+            # 仅在使用本地模型时才加载 transformers
+            from models.local_translator import LocalTranslationModel
+            self.local_translator = LocalTranslationModel(local_model, quantize=quantize, **local_options)
+            self.cache_service = f"local:{local_model}" + (":quantized" if quantize else "")
+            self.source_lang = local_options.get("src_lang") or "auto"
+            self.target_lang = local_options.get("tgt_lang") or "en"
+            print(f"✅ 本地翻译模型 {local_model} 初始化成功")
+        if cache is None:
+            try:
+                cache = TranslationCache()
+            except Exception as e:
+                print(f"⚠️ 翻译缓存初始化失败，将不使用缓存: {e}")
+                cache = False
+        self.cache = cache or None
         
     def translate_to_english(self, text: str) -> str:
         """将文本翻译为英文"""
         if not text or not text.strip():
             return ""
+
+        if self.cache:
+            cached = self.cache.get(text, self.source_lang, self.target_lang, self.cache_service)
+            if cached is not None:
+                return cached
             
         try:
-            if self.service == "google" and self.google_translator:
-                # 使用 deep-translator进行翻译
-                translated_text = self.google_translator.translate(text)
-                return translated_text if translated_text else ""
-            elif self.service == "baidu":
-                return self._baidu_translate(text, "zh", "en")
-            else:
-                # 简单的本地翻译映射（作为备选）
-                return self._simple_translate(text)
+            translated_text, from_backend = self._translate(text)
         except Exception as e:
             print(f"Translation error with service '{self.service}': {e}")
-            return text  # 翻译失败时返回原文
+            return text  # 翻译失败时返回原文，不写入缓存
+
+        # 只缓存真实翻译服务的结果；备选映射和未实现的服务返回的占位结果不写入缓存，
+        # 否则服务恢复后 (以及重启后) 仍会从缓存返回错误的译文
+        if self.cache and translated_text and from_backend:
+            self.cache.put(text, self.source_lang, self.target_lang, self.cache_service, translated_text)
+        return translated_text
+
+    def _translate(self, text: str) -> tuple:
+        """按当前服务翻译为英文，返回 (译文, 是否来自真实翻译服务)，失败时抛出异常"""
+        if self.service == "google" and self.google_translator:
+            # 使用 deep-translator进行翻译
+            translated_text = self.google_translator.translate(text)
+            return (translated_text if translated_text else ""), True
+        elif self.service == "local":
+            return self.local_translator.translate(text), True
+        elif self.service == "baidu":
+            # 尚未接入百度API，返回的是原文
+            return self._baidu_translate(text, "zh", "en"), False
+        else:
+            # 简单的本地翻译映射（作为备选）
+            return self._simple_translate(text), False
     
     def _google_translate(self, text: str, source: str, target: str) -> str:
         """使用Google翻译API (旧的requests方法，保留作为参考或备用)"""
@@ -0,0 +1,158 @@
+""" Two-tier (in-memory LRU + content-addressed disk store) cache for synthesized phrases"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+DEFAULT_TTS_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                                     "server_outputs", "tts_cache")
+
+def file_fingerprint(path: str) -> str:
+    """ Cheap identity of a reference file for cache keys: path, size and mtime"""
+    try:
+        stat = os.stat(path)
+        return f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}"
+    except OSError:
+        return os.path.abspath(path)
+
+class TTSAudioCache:
+    """ Caches synthesized audio per phrase so frequent sentences are served in
+        milliseconds instead of being synthesized again.
+
+        Keys come from make_key(): the normalized text plus every parameter that changes
+        the output (language, voice / reference audio, sampling settings, seed). Only
+        cache deterministic synthesis; callers skip the cache when the output is random.
+
+        The memory tier is an LRU bounded by max_bytes of audio. The disk tier stores
+        each audio blob once under the sha256 of its content (identical audio for
+        several keys is shared) and keeps a sqlite index of key -> blob, evicting the
+        least recently used entries above max_disk_bytes. cache_dir=None keeps the
+        cache in memory only. Thread safe.
+    """
+    def __init__(self, max_bytes=64 << 20, max_disk_bytes=512 << 20, cache_dir=DEFAULT_TTS_CACHE_DIR):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes
+        self.cache_dir = cache_dir
+        self._memory : OrderedDict = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._db = None
+        # Statistics
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+            self._db = sqlite3.connect(os.path.join(cache_dir, "index.sqlite3"), check_same_thread=False)
+            self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+                                    key TEXT PRIMARY KEY, digest TEXT NOT NULL,
+                                    size INTEGER NOT NULL, accessed REAL NOT NULL)""")
+            self._db.commit()
+
+    @staticmethod
+    def make_key(text: str, **params) -> str:
+        """ Cache key of a phrase synthesized with the given parameters"""
+        text = re.sub(r"\s+", " ", unicodedata.normalize("NFKC", text)).strip()
+        fields = json.dumps({"text": text, **params}, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(fields.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """ Returns the cached audio or None"""
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return audio
+            if self._db is not None:
+                row = self._db.execute("SELECT digest FROM entries WHERE key=?", (key,)).fetchone()
+                if row:
+                    try:
+                        with open(self.__blob_path__(row[0]), "rb") as f:
+                            audio = f.read()
+                    except OSError:
+                        self._db.execute("DELETE FROM entries WHERE key=?", (key,))
+                        self._db.commit()
+                    else:
+                        self._db.execute("UPDATE entries SET accessed=? WHERE key=?", (time.time(), key))
+                        self._db.commit()
+                        self.__remember__(key, audio)
+                        self.disk_hits += 1
+                        return audio
+            self.misses += 1
+            return None
+
+    def put(self, key: str, audio: bytes) -> None:
+        """ Stores audio in both tiers"""
+        audio = bytes(audio)
+        with self._lock:
+            self.__remember__(key, audio)
+            if self._db is None:
+                return
+            digest = hashlib.sha256(audio).hexdigest()
+            path = self.__blob_path__(digest)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                # Write then rename, a reader never sees a partial blob
+                temporary_path = f"{path}.{threading.get_ident()}.tmp"
+                with open(temporary_path, "wb") as f:
+                    f.write(audio)
+                os.replace(temporary_path, path)
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?)",
+                             (key, digest, len(audio), time.time()))
+            self.__evict_disk__()
+            self._db.commit()
+
+    def stats(self) -> dict:
+        """ Hit/miss counters and current size"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                "entries": len(self._memory), "memory_bytes": self._memory_bytes,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0}
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def __blob_path__(self, digest):
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}.bin")
+
+    def __remember__(self, key, audio):
+        if len(audio) > self.max_bytes:
+            return
+        previous = self._memory.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._memory[key] = audio
+        self._memory_bytes += len(audio)
+        while self._memory_bytes > self.max_bytes:
+            _, evicted = self._memory.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+
+    def __evict_disk__(self):
+        """ Drops least recently used index entries above max_disk_bytes, and their blobs
+            once no other key references them"""
+        # Blobs are shared, so count each digest once
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM "
+                                 "(SELECT DISTINCT digest, size FROM entries)").fetchone()[0]
+        if total <= self.max_disk_bytes:
+            return
+        for key, digest, size in self._db.execute("SELECT key, digest, size FROM entries "
+                                                  "ORDER BY accessed").fetchall():
+            if total <= self.max_disk_bytes:
+                break
+            self._db.execute("DELETE FROM entries WHERE key=?", (key,))
+            if not self._db.execute("SELECT 1 FROM entries WHERE digest=?", (digest,)).fetchone():
+                try:
+                    os.remove(self.__blob_path__(digest))
+                except OSError:
+                    pass
+                total -= size
@@ -0,0 +1,230 @@
+""" Routing of TTS requests over several GPT-SoVITS replicas"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import numpy as np
+
+class TTSReplica:
+    """ One backend client of a TTSBackendPool with its routing state and latency window"""
+    def __init__(self, client, name=None, latency_window=200):
+        self.client = client
+        self.name = name or getattr(client, "api_url", repr(client))
+        self.healthy = True
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.failed_pings = 0
+        self.latencies = deque(maxlen=latency_window)
+        # Statistics
+        self.requests = 0
+        self.failures = 0
+        self.hedges_won = 0
+
+    def percentile(self, q):
+        """ q-th percentile of the recent successful latencies in seconds, None without samples"""
+        return float(np.percentile(self.latencies, q)) if self.latencies else None
+
+    def stats(self) -> dict:
+        stats = {"healthy": self.healthy, "outstanding": self.outstanding, "requests": self.requests,
+                 "failures": self.failures, "hedges_won": self.hedges_won,
+                 "mean_ms": None, "p50_ms": None, "p95_ms": None, "p99_ms": None}
+        if self.latencies:
+            latencies = np.array(self.latencies) * 1000
+            stats["mean_ms"] = round(float(latencies.mean()), 1)
+            for q in (50, 95, 99):
+                stats[f"p{q}_ms"] = round(float(np.percentile(latencies, q)), 1)
+        return stats
+
+class TTSBackendPool:
+    """ Spreads synthesis over several GPT-SoVITS clients (GPTSoVITSGradioClient or
+        GPTSoVITSHTTPClient, one per replica) behind the same synthesize() / stream()
+        interface as a single client.
+
+        - Routing: each request goes to the healthy replica with the fewest requests in
+          flight, ties broken by the lower mean latency.
+        - Health: max_failures consecutive failed requests or max_failures
+          consecutive failed pings take a replica out of rotation, a single slow or
+          lost ping does not. A background thread pings every replica each
+          health_interval seconds and puts it back once it answers. With every
+          replica out, all of them are tried.
+        - Failover: a failed request is retried once on another replica.
+        - Hedging: with hedge_after set, a synthesize() still running after that many
+          seconds (or, with "auto", after the primary replica's p95 latency) is sent
+          to a second replica as well and the first result wins. The other request is
+          not cancelled, its result is dropped. stream() is never hedged (audio already
+          forwarded cannot be taken back), it only fails over before the first samples.
+    """
+    AUTO_HEDGE_MIN_SAMPLES = 20
+    AUTO_HEDGE_DEFAULT = 2.0
+
+    def __init__(self, clients, hedge_after=None, max_failures=2, health_interval=5.0, health_timeout=2.0,
+                 min_hedge_delay=0.05):
+        if not clients:
+            raise ValueError("TTSBackendPool needs at least one client")
+        self.replicas = [client if isinstance(client, TTSReplica) else TTSReplica(client) for client in clients]
+        self.hedge_after = hedge_after
+        self.max_failures = max_failures
+        self.health_interval = health_interval
+        self.health_timeout = health_timeout
+        self.min_hedge_delay = min_hedge_delay
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(max_workers=4 * len(self.replicas), thread_name_prefix="tts-pool")
+        # Statistics
+        self.requests = 0
+        self.hedged = 0
+        self.failovers = 0
+        self._stop = threading.Event()
+        self._health_thread = threading.Thread(target=self.__health_worker__, daemon=True)
+        self._health_thread.start()
+
+    def reference_text(self, path) -> str:
+        return self.replicas[0].client.reference_text(path)
+
+    @property
+    def last_timings(self) -> dict:
+        """ Timings of the calling thread's last request, as reported by the replica that answered"""
+        return getattr(self._local, "timings", {})
+
+    def __acquire__(self, exclude=()):
+        """ Least-outstanding healthy replica not in exclude, counted as busy until __release__"""
+        with self._lock:
+            candidates = [replica for replica in self.replicas if replica not in exclude]
+            healthy = [replica for replica in candidates if replica.healthy]
+            if not candidates:
+                return None
+            replica = min(healthy or candidates,
+                          key=lambda r: (r.outstanding, np.mean(r.latencies) if r.latencies else 0.0))
+            replica.outstanding += 1
+            replica.requests += 1
+            return replica
+
+    def __release__(self, replica, latency=None):
+        """ latency None records a failure"""
+        with self._lock:
+            replica.outstanding -= 1
+            if latency is not None:
+                replica.latencies.append(latency)
+                replica.consecutive_failures = 0
+                return
+            replica.failures += 1
+            replica.consecutive_failures += 1
+            if replica.healthy and replica.consecutive_failures >= self.max_failures:
+                replica.healthy = False
+                print(f"⚠️ [TTS Pool] {replica.name} failed {replica.consecutive_failures} times, taken out of rotation")
+
+    def __run__(self, replica, ref_audio_path, params):
+        start = time.perf_counter()
+        try:
+            result = replica.client.synthesize(ref_audio_path, **params)
+        except Exception:
+            self.__release__(replica)
+            raise
+        self.__release__(replica, time.perf_counter() - start)
+        # The client's timings are thread-local, hand them to the caller's thread
+        return result, replica.client.last_timings
+
+    def __hedge_delay__(self, replica) -> float:
+        if self.hedge_after != "auto":
+            return float(self.hedge_after)
+        if len(replica.latencies) >= self.AUTO_HEDGE_MIN_SAMPLES:
+            return max(replica.percentile(95), self.min_hedge_delay)
+        return self.AUTO_HEDGE_DEFAULT
+
+    def synthesize(self, ref_audio_path, **params) -> tuple:
+        """ (WAV bytes, seed) from the first replica to answer"""
+        with self._lock:
+            self.requests += 1
+        primary = self.__acquire__()
+        futures = {self._executor.submit(self.__run__, primary, ref_audio_path, params): primary}
+        pending = set(futures)
+        if self.hedge_after is not None and len(self.replicas) > 1:
+            done, pending = wait(pending, timeout=self.__hedge_delay__(primary))
+            if not done:
+                backup = self.__acquire__(exclude=futures.values())
+                if backup is not None:
+                    with self._lock:
+                        self.hedged += 1
+                    future = self._executor.submit(self.__run__, backup, ref_audio_path, params)
+                    futures[future] = backup
+                    pending.add(future)
+            pending |= done
+        error, failed_over = None, False
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    replica = futures[future]
+                    if replica is not primary and not failed_over:
+                        with self._lock:
+                            replica.hedges_won += 1
+                    result, self._local.timings = future.result()
+                    return result
+                error = future.exception()
+            if not pending and not failed_over:
+                backup = self.__acquire__(exclude=futures.values())
+                if backup is not None:
+                    failed_over = True
+                    with self._lock:
+                        self.failovers += 1
+                    future = self._executor.submit(self.__run__, backup, ref_audio_path, params)
+                    futures[future] = backup
+                    pending.add(future)
+        raise error
+
+    def stream(self, ref_audio_path, **params):
+        """ Yields (int16 samples, sample rate) from one replica's streamed response"""
+        with self._lock:
+            self.requests += 1
+        tried = []
+        while True:
+            replica = self.__acquire__(exclude=tried)
+            tried.append(replica)
+            start = time.perf_counter()
+            started = False
+            latency = None
+            try:
+                for item in replica.client.stream(ref_audio_path, **params):
+                    started = True
+                    yield item
+                latency = time.perf_counter() - start
+                self._local.timings = replica.client.last_timings
+                return
+            except GeneratorExit:
+                # The consumer stopped reading, not a replica failure
+                latency = time.perf_counter() - start
+                raise
+            except Exception:
+                if started or len(tried) > 1 or len(self.replicas) == 1:
+                    raise
+                with self._lock:
+                    self.failovers += 1
+            finally:
+                self.__release__(replica, latency)
+
+    def __health_worker__(self):
+        while not self._stop.wait(self.health_interval):
+            for replica in self.replicas:
+                alive = replica.client.ping(self.health_timeout)
+                with self._lock:
+                    if alive:
+                        replica.failed_pings = 0
+                        if not replica.healthy:
+                            replica.healthy = True
+                            replica.consecutive_failures = 0
+                            print(f"✅ [TTS Pool] {replica.name} is answering again, back in rotation")
+                        continue
+                    replica.failed_pings += 1
+                    if replica.healthy and replica.failed_pings >= self.max_failures:
+                        replica.healthy = False
+                        print(f"⚠️ [TTS Pool] {replica.name} missed {replica.failed_pings} health checks in a row, "
+                              f"taken out of rotation")
+
+    def close(self):
+        self._stop.set()
+        self._executor.shutdown(wait=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "hedged": self.hedged, "failovers": self.failovers,
+                    "replicas": {replica.name: replica.stats() for replica in self.replicas}}
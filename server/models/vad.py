@@ -0,0 +1,178 @@
+""" Voice activity detection stage between the socket read loop and the recognizer queue"""
+import threading
+import numpy as np
+from utils.audio_buffer import INT16_SCALE
+
+class EnergyVAD:
+    """ Frame classifier on RMS energy and zero-crossing rate, vectorized over all
+        frames of a chunk. A frame is speech when it is loud enough and its
+        zero-crossing rate is below that of broadband noise.
+    """
+    def __init__(self, sample_rate=16000, frame_ms=30, energy_threshold=0.015, zcr_threshold=0.35):
+        self.frame_samples = sample_rate * frame_ms // 1000
+        # RMS of float audio in [-1, 1), 0.015 is roughly -36 dBFS
+        self.energy_threshold = energy_threshold
+        self.zcr_threshold = zcr_threshold
+
+    @classmethod
+    def load_model(cls):
+        """ Nothing to load"""
+
+    def is_speech(self, frames: np.ndarray) -> np.ndarray:
+        """ frames: int16 array of shape (n_frames, frame_samples), returns a bool mask"""
+        audio = frames.astype(np.float32) * INT16_SCALE
+        rms = np.sqrt(np.mean(audio * audio, axis=1))
+        signs = np.signbit(frames)
+        zcr = np.mean(signs[:, 1:] != signs[:, :-1], axis=1)
+        return (rms > self.energy_threshold) & (zcr < self.zcr_threshold)
+
+class SileroVAD:
+    """ Model-based frame classifier using Silero VAD (downloaded through torch.hub).
+
+        The model is loaded once per process by load_model() and shared by all
+        sessions. It is recurrent, so every instance keeps its own copy of the
+        model's recurrent state and swaps it in around each chunk.
+    """
+    # Recurrent state of the Silero JIT model (v5: _state/_context, v4: _h/_c)
+    STATE_ATTRIBUTES = ("_state", "_context", "_h", "_c", "_last_sr", "_last_batch_size")
+    _model = None
+    _model_lock = threading.Lock()
+
+    def __init__(self, sample_rate=16000, threshold=0.5):
+        import torch
+        self.torch = torch
+        self.sample_rate = sample_rate
+        # Silero expects 512 sample windows at 16 kHz and 256 at 8 kHz
+        self.frame_samples = 512 if sample_rate == 16000 else 256
+        self.threshold = threshold
+        self.model = self.load_model()
+        # This session's recurrent state, None until its first chunk
+        self.state = None
+
+    @classmethod
+    def load_model(cls):
+        """ The shared Silero model, loaded on the first call"""
+        with cls._model_lock:
+            if cls._model is None:
+                import torch
+                cls._model, _ = torch.hub.load("snakers4/silero-vad", "silero_vad", trust_repo=True)
+            return cls._model
+
+    @staticmethod
+    def __snapshot__(value):
+        return value.clone() if hasattr(value, "clone") else value
+
+    def is_speech(self, frames: np.ndarray) -> np.ndarray:
+        audio = self.torch.from_numpy(frames.astype(np.float32) * INT16_SCALE)
+        with self._model_lock, self.torch.no_grad():
+            if self.state is None:
+                self.model.reset_states()
+            else:
+                for name, value in self.state.items():
+                    setattr(self.model, name, value)
+            probs = [self.model(frame, self.sample_rate).item() for frame in audio]
+            self.state = {name: self.__snapshot__(getattr(self.model, name)) for name in self.STATE_ATTRIBUTES
+                          if hasattr(self.model, name)}
+        return np.asarray(probs) > self.threshold
+
+VAD_BACKENDS = {"energy": EnergyVAD, "silero": SileroVAD}
+
+class VADState:
+    """ Per-session state that carries across recv() chunks"""
+    def __init__(self, detector):
+        self.detector = detector
+        # Bytes that did not fill a whole frame yet
+        self.leftover = b""
+        # Frames since the last speech frame, large when the session starts in silence
+        self.silent_frames = 1 << 30
+        # Most recent dropped frames, prepended when speech starts (pre-roll)
+        self.preroll = np.zeros((0, detector.frame_samples), dtype=np.int16)
+        self.in_speech = False
+
+class VoiceActivityStage:
+    """ Filters client audio before it reaches the recognizer's data_queue.
+
+        Every chunk is cut into frames, classified by the backend ("energy" by default,
+        or "silero"), and only speech frames plus hangover_ms after and preroll_ms
+        before each speech run are forwarded, compacted into one packet per chunk.
+        Silence is not queued at all, which keeps phrase windows short and lets the
+        recognizers' phrase timeout detect the end of speech.
+
+        boundary_callback(client_socket, event) is called with "start" / "end" when a
+        session's speech starts or stops; ClientSession.in_speech mirrors the state.
+    """
+    def __init__(self, data_queue, session_manager, backend="energy",
+                 hangover_ms=300, preroll_ms=150, boundary_callback=lambda *args: None,
+                 **detector_options):
+        self.data_queue = data_queue
+        self.sessions = session_manager
+        self.backend = VAD_BACKENDS[backend]
+        # Load a model backend now, not on the socket thread when the first session opens
+        self.backend.load_model()
+        self.detector_options = detector_options
+        self.boundary_callback = boundary_callback
+        self.hangover_ms = hangover_ms
+        self.preroll_ms = preroll_ms
+        # Statistics
+        self.frames_in = 0
+        self.frames_forwarded = 0
+
+    def process(self, client_socket, data) -> None:
+        """ Classifies a received chunk and queues its speech part"""
+        session = self.sessions.session_for(client_socket)
+        if session is None:
+            return
+        if session.vad_state is None:
+            session.vad_state = VADState(self.backend(self.sessions.sample_rate, **self.detector_options))
+        state : VADState = session.vad_state
+        frame_samples = state.detector.frame_samples
+        frame_ms = 1000 * frame_samples / self.sessions.sample_rate
+        hangover = int(self.hangover_ms / frame_ms)
+        preroll = int(self.preroll_ms / frame_ms)
+
+        data = state.leftover + data
+        usable = len(data) // (frame_samples * 2) * frame_samples * 2
+        state.leftover = data[usable:]
+        if not usable:
+            return
+        frames = np.frombuffer(data[:usable], dtype=np.int16).reshape(-1, frame_samples)
+        speech = state.detector.is_speech(frames)
+
+        # Hangover: keep frames up to `hangover` frames after the last speech frame,
+        #   counting speech from the previous chunk too
+        index = np.arange(len(frames))
+        last_speech = np.maximum.accumulate(np.where(speech, index, -1 - state.silent_frames))
+        keep = index - last_speech <= hangover
+        state.silent_frames = int(index[-1] - last_speech[-1])
+
+        # Pre-roll: keep frames up to `preroll` frames before the next speech frame
+        next_speech = np.minimum.accumulate(np.where(speech, index, 1 << 30)[::-1])[::-1]
+        keep |= next_speech - index <= preroll
+
+        previous = np.concatenate(([state.in_speech], keep[:-1]))
+        onsets = np.flatnonzero(keep & ~previous)
+        offsets = np.flatnonzero(~keep & previous)
+
+        kept = frames[keep]
+        if len(onsets) and onsets[0] == 0 and next_speech[0] < preroll and len(state.preroll):
+            # Speech starts right after the chunk start: add the tail of the previous chunk
+            kept = np.concatenate((state.preroll[-(preroll - next_speech[0]):], kept))
+        if keep.any():
+            tail = frames[np.flatnonzero(keep)[-1] + 1:]
+        else:
+            tail = np.concatenate((state.preroll, frames))
+        state.preroll = tail[-preroll:] if preroll else tail[:0]
+
+        self.frames_in += len(frames)
+        self.frames_forwarded += len(kept)
+        for _, event in sorted([(i, "start") for i in onsets] + [(i, "end") for i in offsets]):
+            self.boundary_callback(client_socket, event)
+        state.in_speech = bool(keep[-1])
+        session.in_speech = state.in_speech
+        if len(kept):
+            self.data_queue.put((client_socket, kept.tobytes()))
+
+    @property
+    def forwarded_ratio(self):
+        """ Share of received frames that was forwarded to the recognizer"""
+        return self.frames_forwarded / self.frames_in if self.frames_in else 1.0
@@ -0,0 +1,47 @@
+""" Dynamic micro-batching of Whisper inference across client sessions"""
+import numpy as np
+import torch
+import whisper
+from models.batch_scheduler import MicroBatchScheduler
+
+class WhisperBatchScheduler(MicroBatchScheduler):
+    """ Sits in front of a Whisper model and runs the windows submitted by several
+        sessions (or several recognizer threads) as one batched encoder + decoder pass.
+
+        The first request of a batch waits at most max_wait seconds for others, a batch
+        holds at most max_batch_size windows. Every window is padded to Whisper's 30 s
+        input, so all mel spectrograms share the same length. submit() takes a float32
+        16 kHz window and returns a Future resolving to the decoded text ("" for silence).
+    """
+    name = "Whisper"
+    # Same no-speech rule as whisper.transcribe
+    NO_SPEECH_THRESHOLD = 0.6
+    LOGPROB_THRESHOLD = -1.0
+
+    def __init__(self, audio_model, decoding_options=None, max_batch_size=8, max_wait=0.02):
+        super().__init__(max_batch_size, max_wait)
+        self.audio_model = audio_model
+        self.options = whisper.DecodingOptions(fp16=torch.cuda.is_available(),
+                                               without_timestamps=True,
+                                               **(decoding_options or {}))
+
+    def transcribe(self, audio: np.ndarray) -> str:
+        """ Blocking helper: submit a window and wait for its text"""
+        return self.submit(audio).result()
+
+    @staticmethod
+    def batch_mel(items, n_mels=80, device=None) -> torch.Tensor:
+        """ Stacked log-mel spectrograms of the windows, computed one window at a time:
+            log_mel_spectrogram clamps to 8 dB below the loudest value of its whole input,
+            so one call over the batch would change a quiet window's mel (and its text)
+            depending on the louder windows it happens to be batched with."""
+        return torch.stack([whisper.log_mel_spectrogram(torch.from_numpy(whisper.pad_or_trim(window)),
+                                                        n_mels=n_mels, device=device)
+                            for window in items])
+
+    def run_batch(self, items):
+        mel = self.batch_mel(items, self.audio_model.dims.n_mels, self.audio_model.device)
+        results = whisper.decode(self.audio_model, mel, self.options)
+        return ["" if result.no_speech_prob > self.NO_SPEECH_THRESHOLD and
+                result.avg_logprob < self.LOGPROB_THRESHOLD else result.text
+                for result in results]
@@ -1,12 +1,23 @@
 """ Server for real-time translation and voice synthesization """
 from typing import Dict
 from queue import Queue
+import json
+import os
 import select
 import socket
+import sys
 import pyaudio
 import torch
+# Modules shared with the client live in shared/ at the repository root
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models.speech_recognition import SpeechRecognitionModel
 from models.text_to_speech import TextToSpeechModel
+from models.gpt_sovits_tts import GPTSoVITSTTSModel
+from models.circuit_breaker import CircuitBreaker
+from models.session_manager import SessionManager
+from models.vad import VoiceActivityStage
+from utils.audio_buffer import float32_to_pcm16
+from shared.protocol import MessageType, ProtocolError, VERSION as PROTOCOL_VERSION
 class AudioSocketServer:
     """ Class that handles real-time translation and voice synthesization
         Socket input -> SpeechRecognition -> text -> TextToSpeech -> Socket output
@@ -19,23 +30,50 @@ class AudioSocketServer:
     # Number of unaccepted connections before server refuses new connections.
     #   For socket.listen()
     BACKLOG = 5
-    def __init__(self, whisper_model):
+    # SpeechT5 output rate, also the rate of the fallback while GPT-SoVITS is down
+    TTS_SAMPLE_RATE = 16000
+    # A GPT-SoVITS call slower than this counts as failed for the circuit breaker,
+    #   one that takes longer than the timeout is given up and the fallback speaks instead
+    GPT_SOVITS_SLOW_CALL = 5.0
+    GPT_SOVITS_TIMEOUT = 10.0
+    def __init__(self, whisper_model, streaming=False, batching=False, tts_batch_size=1,
+                 vad_backend=None, gpt_sovits_url=None):
         self.audio = pyaudio.PyAudio()
         self.serversocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # Let kernel know we want to reuse the same port for restarting the server
         #   in quick succession
         self.serversocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR,1)
-        # TODO: For multiple concurrent users we will need more queues
-        #   for now we only want one user to work first
+        # Audio of every client goes through one queue as (client_socket, data),
+        #   the transcriber keeps a separate buffer and phrase state per session
         self.data_queue : Queue = Queue()
+        self.sessions = SessionManager(auto_open=False)
+        # Optional voice activity detection ("energy" or "silero") that drops silence
+        #   before it reaches the data queue
+        self.vad = VoiceActivityStage(self.data_queue, self.sessions, backend=vad_backend) \
+            if vad_backend else None
 
         # Initialize the transcriber model
         self.transcriber = SpeechRecognitionModel(model_name=whisper_model,
                                                   data_queue=self.data_queue,
                                                   generation_callback=self.handle_generation,
-                                                  final_callback=self.handle_transcription)
-        self.text_to_speech = TextToSpeechModel(callback_function=self.handle_synthesize)
-        self.text_to_speech.load_speaker_embeddings()
+                                                  final_callback=self.handle_transcription,
+                                                  session_manager=self.sessions,
+                                                  streaming=streaming,
+                                                  batching=batching)
+        if gpt_sovits_url:
+            # GPT-SoVITS voice with SpeechT5 as fallback while the API fails or stalls
+            fallback = TextToSpeechModel(callback_function=None)
+            fallback.load_speaker_embeddings()
+            self.text_to_speech = GPTSoVITSTTSModel(api_url=gpt_sovits_url,
+                                                    callback_function=self.handle_synthesize,
+                                                    circuit_breaker=CircuitBreaker(
+                                                        "GPT-SoVITS", slow_call_threshold=self.GPT_SOVITS_SLOW_CALL),
+                                                    fallback_model=fallback,
+                                                    timeout=self.GPT_SOVITS_TIMEOUT)
+        else:
+            self.text_to_speech = TextToSpeechModel(callback_function=self.handle_synthesize,
+                                                    max_batch_size=tts_batch_size)
+            self.text_to_speech.load_speaker_embeddings()
         self.read_list = []
 
     def __del__(self):
@@ -44,14 +82,19 @@ class AudioSocketServer:
         self.serversocket.shutdown()
         self.serversocket.close()
     def handle_generation(self, packet: Dict):
-        """ Placeholder function for transcription"""
+        """ Forwards in-progress transcriptions to clients that speak the framed protocol"""
+        session = self.sessions.by_id(packet.get("session_id"))
+        if session and session.framed and packet.get("text"):
+            self.send_message(session.client_socket, MessageType.PARTIAL,
+                              {"text": packet["text"], "committed": packet.get("committed")})
     def handle_transcription(self, packet: str, client_socket):
         """ Callback function to put finalized transcriptions into TTS"""
         print(f"Added {packet} to synthesize task queue")
+        self.send_message(client_socket, MessageType.TRANSCRIPT, {"text": packet})
         self.text_to_speech.synthesise(packet, client_socket)
-    def handle_synthesize(self, audio: torch.Tensor, client_socket):
+    def handle_synthesize(self, audio: torch.Tensor, client_socket, sample_rate=TTS_SAMPLE_RATE):
         """ Callback function to stream audio back to the client"""
-        self.stream_numpy_array_audio(audio, client_socket)
+        self.stream_numpy_array_audio(audio, client_socket, sample_rate)
 
     def start(self):
         """ Starts the server"""
@@ -70,19 +113,19 @@ class AudioSocketServer:
                     if s is self.serversocket:
                         (clientsocket, address) = self.serversocket.accept()
                         self.read_list.append(clientsocket)
-                        print("Connection from", address)
+                        session = self.sessions.open(clientsocket, address)
+                        print("Connection from", address, f"(session {session.session_id}, "
+                              f"{len(self.sessions)} active)")
                     else:
                         try:
                             data = s.recv(4096)
 
                             if data:
-                                self.data_queue.put((s, data))
+                                self.handle_client_data(s, data)
                             else:
-                                self.read_list.remove(s)
-                                print("Disconnection from", address)
+                                self.close_client(s, "Disconnection from")
                         except ConnectionResetError:
-                            self.read_list.remove(s)
-                            print("Client crashed from", address)
+                            self.close_client(s, "Client crashed from")
         except KeyboardInterrupt:
             pass
         print("Performing server cleanup")
@@ -91,16 +134,77 @@ class AudioSocketServer:
         self.serversocket.shutdown(socket.SHUT_RDWR)
         self.serversocket.close()
         print("Sockets cleaned up")
-    def stream_numpy_array_audio(self, audio, client_socket):
+    def handle_client_data(self, client_socket, data):
+        """ Routes received bytes: the first packet decides between the framed protocol
+            and legacy raw PCM, audio goes on to the VAD / recognizer queue"""
+        session = self.sessions.get(client_socket)
+        if session is None:
+            return
+        try:
+            for frame in session.receive(data):
+                if frame.type == MessageType.AUDIO:
+                    if self.vad:
+                        self.vad.process(client_socket, session.decode_audio(frame.payload))
+                    else:
+                        self.data_queue.put((client_socket, session.decode_audio(frame.payload)))
+                elif frame.type == MessageType.HELLO:
+                    hello = frame.json()
+                    codecs = session.negotiate_codecs(hello.get("codecs", {}))
+                    print(f"Session {session.session_id} speaks protocol v2: {hello}, codecs {codecs}")
+                    self.send_message(client_socket, MessageType.WELCOME,
+                                      {"version": PROTOCOL_VERSION, "session_id": session.session_id,
+                                       "sample_rate": 16000, "server": "whisper", "codecs": codecs})
+                elif frame.type == MessageType.BYE:
+                    self.close_client(client_socket, "Session ended by")
+                    return
+                else:
+                    print(f"Session {session.session_id} sent {frame.type.name}: {frame.payload[:200]!r}")
+        except ProtocolError as e:
+            print(f"Protocol error: {e}")
+            self.close_client(client_socket, "Dropped misbehaving client")
+
+    def send_message(self, client_socket, msg_type, message: Dict):
+        """ Sends a JSON message to a framed protocol client, legacy clients only get audio"""
+        session = self.sessions.get(client_socket)
+        if session is None or not session.framed:
+            return
+        try:
+            session.send_frame(msg_type, json.dumps(message).encode("utf-8"))
+        except (ConnectionResetError, BrokenPipeError) as e:
+            print(f"Error sending message to client: {e}")
+            self.close_client(client_socket, "Client lost from")
+
+    def close_client(self, client_socket, reason):
+        """ Stops listening to a client and drops its session and pending work"""
+        if client_socket in self.read_list:
+            self.read_list.remove(client_socket)
+        session = self.sessions.close(client_socket)
+        self.text_to_speech.task_queue.discard(client_socket)
+        try:
+            client_socket.close()
+        except OSError:
+            pass
+        print(reason, session.address if session else client_socket)
+
+    def stream_numpy_array_audio(self, audio, client_socket, sample_rate=TTS_SAMPLE_RATE):
         """ Streams audio back to the client"""
+        session = self.sessions.get(client_socket)
+        if session is None:
+            # Client disconnected while its audio was being synthesized
+            return
         try:
-            client_socket.sendall(audio.numpy().tobytes())
-        except ConnectionResetError as e:
+            if session.framed:
+                # The payload carries the rate: 16 kHz from SpeechT5, the model's rate from GPT-SoVITS
+                session.send_frame(MessageType.AUDIO, session.encode_audio(float32_to_pcm16(audio.numpy()), sample_rate))
+            else:
+                session.sendall(audio.numpy().tobytes())
+        except (ConnectionResetError, BrokenPipeError) as e:
             print(f"Error sending audio to client: {e}")
-            if client_socket in self.read_list:
-                self.read_list.remove(client_socket)
+            self.close_client(client_socket, "Client lost from")
 
 if __name__ == "__main__":
-    server = AudioSocketServer(whisper_model="base")
+    # --gpt-sovits=<api url>: synthesize with GPT-SoVITS (api.py) instead of SpeechT5
+    gpt_sovits_url = next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--gpt-sovits=")), None)
+    server = AudioSocketServer(whisper_model="base", gpt_sovits_url=gpt_sovits_url)
     server.start()
     
\ No newline at end of file
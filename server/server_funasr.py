@@ -9,16 +9,32 @@ import requests
 import numpy as np
 import urllib.parse
 import os
-import struct
-from gradio_client import Client, file
+import sys
+import json
+import threading
+# 客户端和服务端共用的模块 (仓库根目录下的 shared/)
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from models.speech_recognition_funasr import FunASRSpeechRecognitionModel
+from models.speech_recognition_funasr_streaming import FunASRStreamingSpeechRecognitionModel
 from models.translator import Translator
+from models.session_manager import SessionManager
+from models.vad import VoiceActivityStage
+from models.pipeline import StagePipeline
+from models.tts_cache import TTSAudioCache, file_fingerprint
+from models.audio_archive import AudioArchive
+from models.gpt_sovits_client import GPTSoVITSGradioClient, GPTSoVITSHTTPClient
+from models.tts_pool import TTSBackendPool
+from models.circuit_breaker import CircuitBreaker, CircuitOpenError
+from utils.text_split import split_text
+from shared.codecs import wav_to_pcm16, pcm16_to_wav
+from utils.audio_buffer import QuietChunker
+from shared.protocol import MessageType, ProtocolError, LEGACY_HEADER, HEADER as FRAME_HEADER, VERSION as PROTOCOL_VERSION
 from gpt_sovits_config import GPTSoVITSConfig
 import time
 
 class AudioSocketServerFunASR:
     """ Class that handles real-time translation and voice synthesization using FunASR
-        Socket input -> FunASR -> text -> TextToSpeech -> Socket output
+        Socket input -> FunASR -> text -> [MT -> TextToSpeech -> Socket output] pipeline
     """
     FORMAT = pyaudio.paInt16
     CHANNELS = 1
@@ -27,27 +43,52 @@ class AudioSocketServerFunASR:
     PORT = 4444
     # Number of unaccepted connections before server refuses new connections.
     BACKLOG = 5
+    # 流水线每个阶段的工作线程数和队列长度
+    # 发送队列按客户端互斥，不同客户端由不同的发送线程并行处理，一个卡住的客户端只占用一个线程
+    MT_WORKERS = 2
+    TTS_WORKERS = 2
+    SEND_WORKERS = 4
+    STAGE_QUEUE_SIZE = 16
+    # 向客户端发送的超时秒数，超时 (客户端不再接收) 时断开该客户端
+    SEND_TIMEOUT = 5.0
+    # GPT-SoVITS熔断: 单次调用最长等待秒数，超过 TTS_SLOW_CALL 秒的调用也计为失败
+    TTS_CALL_TIMEOUT = 10.0
+    TTS_SLOW_CALL = 5.0
+    FALLBACK_SAMPLE_RATE = 16000  # SpeechT5输出采样率
     
-    def __init__(self, funasr_model="paraformer-zh", gpt_sovits_api="http://localhost:9872"):
+    def __init__(self, funasr_model="paraformer-zh", gpt_sovits_api="http://localhost:9872",
+                 streaming_asr=False, vad_backend=None, translation_service="google", tts_seed=None,
+                 streaming_tts=False, archive_sampling=1.0, archive_storage="flac", tts_backend="gradio",
+                 tts_hedge=None, tts_fallback=True):
         self.audio = pyaudio.PyAudio()
         self.serversocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         # Let kernel know we want to reuse the same port for restarting the server
         self.serversocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        # TODO: For multiple concurrent users we will need more queues
+        # 所有客户端的音频都以 (client_socket, data) 进入同一个队列，识别器为每个会话维护独立的缓冲和短语状态
         self.data_queue : Queue = Queue()
+        self.sessions = SessionManager(auto_open=False)
+        # 可选的语音活动检测 ("energy" 或 "silero")，在进入识别队列之前丢弃静音帧
+        self.vad = VoiceActivityStage(self.data_queue, self.sessions, backend=vad_backend,
+                                      boundary_callback=self.handle_speech_boundary) if vad_backend else None
 
         # Initialize the FunASR transcriber model
-        self.transcriber = FunASRSpeechRecognitionModel(
+        # streaming_asr=True 时使用流式Paraformer，按固定块识别并在调用之间保留模型cache
+        transcriber_class = FunASRStreamingSpeechRecognitionModel if streaming_asr else FunASRSpeechRecognitionModel
+        self.transcriber = transcriber_class(
             model_name=funasr_model,
             data_queue=self.data_queue,
             generation_callback=self.handle_generation,
-            final_callback=self.handle_transcription
+            final_callback=self.handle_transcription,
+            session_manager=self.sessions
         )
         
         # 初始化GPT-SoVITS配置
         self.gpt_config = GPTSoVITSConfig()
-        self.gpt_config.api_url = gpt_sovits_api.rstrip('/')
-        print(f"🚀 连接到GPT-SoVITS API: {self.gpt_config.api_url}")
+        # 多个副本用逗号分隔 (或传入列表)
+        api_urls = gpt_sovits_api.split(",") if isinstance(gpt_sovits_api, str) else list(gpt_sovits_api)
+        self.gpt_config.api_urls = [url.strip().rstrip('/') for url in api_urls if url.strip()]
+        self.gpt_config.api_url = self.gpt_config.api_urls[0]
+        print(f"🚀 连接到GPT-SoVITS API: {', '.join(self.gpt_config.api_urls)}")
 
         # 应用来自 test_gradio_client.py 的参数
         self.gpt_config.top_k = 20
@@ -66,18 +107,52 @@ class AudioSocketServerFunASR:
         self.gpt_config.parallel_infer = True # test_gradio_client.py 中为 True
         self.gpt_config.repetition_penalty = 1.35 # test_gradio_client.py 中为 1.35
         self.gpt_config.super_sampling = False # test_gradio_client.py 中为 False
+        if tts_seed is not None:
+            # 固定种子使合成结果可复现，常用短语可以直接从音频缓存返回
+            self.gpt_config.seed = float(tts_seed)
+            self.gpt_config.keep_random = False
         
         print("ℹ️ GPT-SoVITS 配置已更新为来自 test_gradio_client.py 的参数。")
+        self.tts_cache = TTSAudioCache()
+        # 调试音频 (SoVITS原始输出、发送给客户端的音频) 由后台线程写入 server_outputs/，不占用请求路径
+        self.archive = AudioArchive(storage=archive_storage, sampling=archive_sampling)
+        if not self.gpt_config.is_deterministic():
+            print("ℹ️ keep_random=True 或 seed=-1，合成结果不确定，TTS音频缓存不生效 (可用 --tts-seed=N 固定种子)")
         
-        # 初始化Gradio客户端
-        try:
-            self.gpt_sovits_client = Client(self.gpt_config.api_url, ssl_verify=False)
-            print("✅ Gradio Client 初始化成功 (SSL验证已禁用)")
-        except Exception as e:
-            print(f"❌ Gradio Client 初始化失败: {e}")
-            print("   请检查Gradio服务是否正在运行，以及SSL_CERT_FILE环境变量是否正确设置（如果未使用ssl_verify=False）。")
+        # 初始化GPT-SoVITS客户端:
+        # "gradio": WebUI的 /inference 接口 (参考音频只上传一次，结果直接下载到内存)
+        # "http": api_v2.py 的 /tts 接口，连接池复用keep-alive连接，流式响应边接收边解析
+        # 多个副本时由 TTSBackendPool 按在途请求数最少的健康副本分配，tts_hedge 秒 (或 "auto" = p95) 后对冲到第二个副本
+        self.tts_backend = tts_backend
+        clients = []
+        for api_url in self.gpt_config.api_urls:
+            try:
+                if tts_backend == "http":
+                    # 读超时同熔断超时，流式响应中途停顿也不会长时间阻塞
+                    clients.append(GPTSoVITSHTTPClient(api_url, timeout=self.TTS_CALL_TIMEOUT))
+                    print(f"✅ GPT-SoVITS HTTP Client 初始化成功: {api_url}")
+                else:
+                    clients.append(GPTSoVITSGradioClient(api_url, verify=False))
+                    print(f"✅ Gradio Client 初始化成功 (SSL验证已禁用): {api_url}")
+            except Exception as e:
+                print(f"❌ GPT-SoVITS Client ({tts_backend}) 初始化失败: {api_url}: {e}")
+                print("   请检查GPT-SoVITS服务是否正在运行。")
+        if len(clients) > 1:
+            self.gpt_sovits_client = TTSBackendPool(clients, hedge_after=tts_hedge)
+            print(f"✅ TTS副本池: {len(clients)} 个副本, 对冲: {tts_hedge or '关闭'}")
+        else:
             # 可以选择在这里抛出异常或允许服务器继续运行但TTS功能受限
-            self.gpt_sovits_client = None # 标记客户端不可用
+            self.gpt_sovits_client = clients[0] if clients else None # None 标记客户端不可用
+
+        # 熔断器: GPT-SoVITS连续失败、失败率过高或响应过慢时打开，打开期间直接使用本地SpeechT5降级合成，
+        # 之后放行探测请求，成功则恢复GPT-SoVITS
+        self.tts_breaker = CircuitBreaker("GPT-SoVITS", slow_call_threshold=self.TTS_SLOW_CALL)
+        self.fallback_tts = None
+        self.fallback_count = 0
+        self._fallback_lock = threading.Lock()
+        if tts_fallback:
+            # SpeechT5在后台加载，不推迟服务器启动
+            threading.Thread(target=self.__load_fallback_tts__, daemon=True).start()
         
         # 参考音频配置
         self.ref_wav_path = os.path.abspath(self.gpt_config.ref_wav_path)
@@ -93,7 +168,23 @@ class AudioSocketServerFunASR:
             self.ref_text = "可以可以可以。那我先上去。你等下就到那个办公室里去哈"
         
         # 初始化翻译器
-        self.translator = Translator(service="google")  # 使用Google翻译
+        self.translator = Translator(service=translation_service)  # 默认使用Google翻译，"local" 为本地离线模型
+
+        # 识别之后的处理流水线: 翻译 -> 合成 -> 发送，每个阶段有独立的有界队列和工作线程
+        # 同一客户端的短语按顺序经过每个阶段，不同客户端的短语并行处理
+        # streaming_tts=True 时按片段合成并逐段发送，缩短首音延迟
+        # HTTP后端则直接使用GPT-SoVITS的流式响应，边合成边转发
+        if not streaming_tts:
+            tts_stage = self.synthesize_stage
+        elif tts_backend == "http":
+            tts_stage = self.synthesize_http_stream_stage
+        else:
+            tts_stage = self.synthesize_stream_stage
+        self.pipeline = StagePipeline([
+            ("MT", self.translate_stage, self.MT_WORKERS),
+            ("TTS", tts_stage, self.TTS_WORKERS),
+            ("send", self.send_stage, self.SEND_WORKERS),
+        ], max_queue=self.STAGE_QUEUE_SIZE)
         
         self.read_list = []
 
@@ -104,86 +195,299 @@ class AudioSocketServerFunASR:
         self.serversocket.close()
         
     def handle_generation(self, packet: Dict):
-        """ Placeholder function for transcription"""
-        pass
-        
+        """ 识别中间结果，发送给使用v2协议的客户端"""
+        session = self.sessions.by_id(packet.get("session_id"))
+        if session and session.framed and packet.get("text"):
+            self.send_message(session.client_socket, MessageType.PARTIAL,
+                              {"text": packet["text"], "final": not packet.get("partial", False)})
+
+    def send_message(self, client_socket, msg_type, message: Dict):
+        """ 向v2客户端发送JSON消息 (旧协议的客户端只接收音频，直接忽略)"""
+        session = self.sessions.get(client_socket)
+        if not session or session.closed or not session.framed:
+            return
+        try:
+            session.send_frame(msg_type, json.dumps(message, ensure_ascii=False).encode("utf-8"))
+        except (ConnectionResetError, BrokenPipeError, OSError) as e:
+            print(f"❌ 发送消息失败: {e}")
+            self.close_client(client_socket, "ℹ️  移除故障客户端")
+
+    def handle_client_data(self, client_socket, data: bytes):
+        """ 处理收到的数据: 首个数据包决定协议 (v2 帧或旧版裸PCM)，音频进入识别队列"""
+        session = self.sessions.get(client_socket)
+        if session is None:
+            return
+        try:
+            for frame in session.receive(data):
+                if frame.type == MessageType.AUDIO:
+                    if self.vad:
+                        self.vad.process(client_socket, session.decode_audio(frame.payload))
+                    else:
+                        self.data_queue.put((client_socket, session.decode_audio(frame.payload)))
+                elif frame.type == MessageType.HELLO:
+                    hello = frame.json()
+                    # 按客户端的偏好列表为上行/下行分别选择音频编码
+                    codecs = session.negotiate_codecs(hello.get("codecs", {}))
+                    print(f"🤝 会话 {session.session_id} 使用v2协议: {hello}, 编码: {codecs}")
+                    self.send_message(client_socket, MessageType.WELCOME,
+                                      {"version": PROTOCOL_VERSION, "session_id": session.session_id,
+                                       "sample_rate": 16000, "server": "funasr", "codecs": codecs})
+                elif frame.type == MessageType.BYE:
+                    self.close_client(client_socket, "ℹ️  客户端结束会话")
+                    return
+                else:
+                    print(f"ℹ️ 会话 {session.session_id} 收到 {frame.type.name}: {frame.payload[:200]!r}")
+        except ProtocolError as e:
+            print(f"❌ 协议错误: {e}")
+            self.close_client(client_socket, "ℹ️  移除协议错误的客户端")
+
+    def handle_speech_boundary(self, client_socket, event):
+        """ VAD检测到语音开始/结束"""
+        session = self.sessions.get(client_socket)
+        print(f"🗣️ 会话 {session.session_id if session else '?'} 语音{'开始' if event == 'start' else '结束'}")
+
     def handle_transcription(self, packet: str, client_socket):
-        """ Callback function to put finalized transcriptions into TTS"""
+        """ Callback function to put finalized transcriptions into the MT -> TTS -> send pipeline.
+            Runs on the recognizer thread and only queues, so the next phrase is recognized
+            while this one is translated and synthesized"""
         asr_end_time = time.time()
         print(f"🎤 [{asr_end_time:.3f}] 识别结果: '{packet}'")
         
         if not packet or not packet.strip():
             print("⚠️  识别结果为空，跳过翻译")
             return
-        
-        # 翻译为英文
+        # 不阻塞识别线程: MT队列已满时丢弃这句话 (pipeline中计数并记录)
+        self.pipeline.submit(client_socket, packet, block=False)
+
+    def translate_stage(self, packet: str, client_socket):
+        """ 流水线MT阶段: 识别文本 -> 英文"""
         translation_start_time = time.time()
         print(f"🔄 [{translation_start_time:.3f}] 开始翻译...")
         translated_text = self.translator.translate_to_english(packet)
         translation_end_time = time.time()
         print(f"🌍 [{translation_end_time:.3f}] 翻译结果: '{translated_text}' (耗时: {translation_end_time - translation_start_time:.3f}s)")
+        if self.translator.cache:
+            cache_stats = self.translator.cache.stats()
+            print(f"   [翻译缓存] 命中率: {cache_stats['hit_rate']:.1%} (内存 {cache_stats['hits']}, 磁盘 {cache_stats['disk_hits']}, 未命中 {cache_stats['misses']})")
         
         if translated_text and translated_text.strip():
-            tts_start_time = time.time()
-            print(f"🔊 [{tts_start_time:.3f}] 开始GPT-SoVITS语音合成...")
-            # 使用GPT-SoVITS合成英文语音
-            audio_data, original_text_for_filename = self.gpt_sovits_synthesize(translated_text, "en")
-            tts_end_time = time.time()
+            self.send_message(client_socket, MessageType.TRANSCRIPT, {"text": packet, "translation": translated_text})
+            return translated_text
+        print("⚠️  翻译结果为空，跳过语音合成")
+        return None
+
+    def synthesize_stage(self, translated_text: str, client_socket):
+        """ 流水线TTS阶段: 英文 -> WAV"""
+        tts_start_time = time.time()
+        print(f"🔊 [{tts_start_time:.3f}] 开始GPT-SoVITS语音合成...")
+        # 使用GPT-SoVITS合成英文语音
+        audio_data, original_text_for_filename = self.gpt_sovits_synthesize(translated_text, "en")
+        tts_end_time = time.time()
+        if audio_data:
+            print(f"合成完成，准备发送 (TTS总耗时: {tts_end_time - tts_start_time:.3f}s)")
+            return audio_data, original_text_for_filename
+        print(f"⚠️ [{tts_end_time:.3f}] 语音合成失败或未返回数据 (TTS尝试耗时: {tts_end_time - tts_start_time:.3f}s)")
+        return None
+
+    def synthesize_stream_stage(self, translated_text: str, client_socket):
+        """ 流式TTS阶段: 按 text_split_method 把译文切成片段并依次合成，
+            每个片段合成完成后立即交给发送阶段，客户端收到第一段即可开始播放"""
+        fragments = split_text(translated_text, self.gpt_config.text_split_method)
+        tts_start_time = time.time()
+        print(f"🔊 [{tts_start_time:.3f}] 开始流式GPT-SoVITS语音合成 ({len(fragments)} 个片段)...")
+        for index, fragment in enumerate(fragments):
+            # 片段已经切好，服务端不再切分
+            audio_data, original_text_for_filename = self.gpt_sovits_synthesize(fragment, "en", text_split_method="不切")
+            if not audio_data:
+                print(f"⚠️ 片段 {index + 1}/{len(fragments)} 合成失败，跳过: '{fragment}'")
+                continue
+            if index == 0:
+                print(f"   [流式TTS] 首个片段就绪 (首音延迟: {time.time() - tts_start_time:.3f}s)")
+            yield audio_data, original_text_for_filename
+        print(f"合成完成 (TTS总耗时: {time.time() - tts_start_time:.3f}s)")
+
+    def synthesize_http_stream_stage(self, translated_text: str, client_socket):
+        """ HTTP后端的流式TTS阶段: 整段译文一次请求，GPT-SoVITS按 text_split_method 切分并流式返回，
+            收到的样本在静音处切成片段 (至少 QuietChunker.min_seconds) 逐段交给发送阶段"""
+        tts_start_time = time.time()
+        if not self.gpt_sovits_client:
+            audio_data, _ = self.fallback_synthesize(translated_text, "客户端未初始化")
             if audio_data:
-                print(f"合成完成，准备发送 (TTS总耗时: {tts_end_time - tts_start_time:.3f}s)")
-                self.stream_audio_to_client(audio_data, client_socket, original_text_for_filename)
+                yield audio_data, translated_text
+            return
+        params_to_api, cache_key = self.gpt_sovits_request(translated_text, "en")
+        if cache_key:
+            cached_audio = self.tts_cache.get(cache_key)
+            if cached_audio is not None:
+                print(f"   [TTS缓存] 命中 ({time.time() - tts_start_time:.3f}s), 命中率: {self.tts_cache.stats()['hit_rate']:.1%}")
+                yield cached_audio, translated_text
+                return
+        # 熔断器打开时直接降级；流式请求按首音延迟判断是否过慢
+        ticket = self.tts_breaker.allow()
+        if not ticket:
+            audio_data, _ = self.fallback_synthesize(translated_text, "熔断器打开")
+            if audio_data:
+                yield audio_data, translated_text
+            return
+        print(f"🔊 [{tts_start_time:.3f}] 开始流式GPT-SoVITS语音合成 (HTTP): '{translated_text}'")
+        chunker, pieces, sample_rate, first_audio = None, [], None, None
+        try:
+            for pcm, sample_rate in self.gpt_sovits_client.stream(**params_to_api):
+                if chunker is None:
+                    chunker = QuietChunker(sample_rate)
+                    first_audio = time.time() - tts_start_time
+                for piece in chunker.push(pcm):
+                    if not pieces:
+                        print(f"   [流式TTS] 首个片段就绪 (首音延迟: {time.time() - tts_start_time:.3f}s)")
+                    pieces.append(piece)
+                    yield pcm16_to_wav(piece, sample_rate), translated_text
+        except GeneratorExit:
+            # 流水线提前关闭了生成器 (如客户端断开)。收到首音之前关闭不说明GPT-SoVITS的好坏，
+            # 只释放半开状态的探测名额，不记录结果
+            if chunker is not None:
+                self.tts_breaker.record(True, first_audio, ticket=ticket)
             else:
-                print(f"⚠️ [{tts_end_time:.3f}] 语音合成失败或未返回数据 (TTS尝试耗时: {tts_end_time - tts_start_time:.3f}s)")
-        else:
-            print("⚠️  翻译结果为空，跳过语音合成")
+                self.tts_breaker.release(ticket)
+            raise
+        except Exception as e:
+            self.tts_breaker.record(False, time.time() - tts_start_time, ticket=ticket)
+            print(f"❌ 调用GPT-SoVITS API失败: {e}")
+            if not pieces:
+                # 还没有发送任何音频，整句改用降级TTS
+                audio_data, _ = self.fallback_synthesize(translated_text, type(e).__name__)
+                if audio_data:
+                    yield audio_data, translated_text
+            return
+        self.tts_breaker.record(chunker is not None, first_audio, ticket=ticket)
+        if chunker is not None:
+            rest = chunker.flush()
+            if len(rest):
+                pieces.append(rest)
+                yield pcm16_to_wav(rest, sample_rate), translated_text
+        if not pieces:
+            print("❌ SoVITS API未返回音频数据。")
+            audio_data, _ = self.fallback_synthesize(translated_text, "未返回音频数据")
+            if audio_data:
+                yield audio_data, translated_text
+            return
+        print(f"   [GPT-SoVITS API Call] {self.__format_timings__()}")
+        full_audio = pcm16_to_wav(np.concatenate(pieces), sample_rate)
+        safe_text_suffix = "".join(filter(str.isalnum, translated_text[:20]))
+        self.archive.submit("sovits_raw_outputs", f"stream_{safe_text_suffix}", full_audio)
+        if cache_key:
+            self.tts_cache.put(cache_key, full_audio)
+        print(f"合成完成 (TTS总耗时: {time.time() - tts_start_time:.3f}s)")
 
-    def gpt_sovits_synthesize(self, text: str, text_language: str = "en"):
-        """调用GPT-SoVITS /inference API进行语音合成"""
-        if not self.gpt_sovits_client:
-            print("❌ GPT-SoVITS客户端未初始化，无法进行语音合成。")
+    def send_stage(self, synthesized, client_socket):
+        """ 流水线发送阶段"""
+        audio_data, original_text = synthesized
+        self.stream_audio_to_client(audio_data, client_socket, original_text)
+        stats = self.pipeline.stats()
+        print("   [流水线] " + ", ".join(f"{name}: 排队 {stage['queued']}, 平均 {stage['mean_time']:.3f}s, 丢弃 {stage['dropped']}"
+                                        for name, stage in stats.items()))
+
+    def __load_fallback_tts__(self):
+        """ 加载降级用的SpeechT5 (TextToSpeechModel)"""
+        try:
+            from models.text_to_speech import TextToSpeechModel
+            fallback_tts = TextToSpeechModel(callback_function=None)
+            fallback_tts.load_speaker_embeddings()
+            self.fallback_tts = fallback_tts
+            print("✅ 降级TTS (SpeechT5) 已就绪")
+        except Exception as e:
+            print(f"⚠️ 降级TTS (SpeechT5) 加载失败，GPT-SoVITS不可用时将不合成语音: {e}")
+
+    def fallback_synthesize(self, text: str, reason: str):
+        """ GPT-SoVITS不可用时用本地SpeechT5合成 (音质下降，但不用等待超时)，返回 (WAV, text) 或 (None, None)"""
+        if self.fallback_tts is None:
+            print(f"❌ GPT-SoVITS不可用 ({reason})，降级TTS未就绪，跳过语音合成")
             return None, None
+        start = time.time()
+        try:
+            # 两个TTS工作线程共用一个模型，依次合成
+            with self._fallback_lock:
+                speech = self.fallback_tts.synthesise_blocking(text)
+        except Exception as e:
+            print(f"❌ 降级TTS合成失败: {e}")
+            return None, None
+        self.fallback_count += 1
+        pcm = (np.clip(speech.numpy(), -1.0, 1.0) * 32767).astype(np.int16)
+        print(f"🛟 [降级TTS] GPT-SoVITS不可用 ({reason})，SpeechT5合成耗时 {time.time() - start:.3f}s")
+        return pcm16_to_wav(pcm, self.FALLBACK_SAMPLE_RATE), text
+
+    def __gpt_sovits_call__(self, params_to_api):
+        """ 在熔断器的工作线程中调用，连同该线程的耗时一起返回"""
+        return self.gpt_sovits_client.synthesize(**params_to_api), self.gpt_sovits_client.last_timings
+
+    def gpt_sovits_request(self, text: str, text_language: str = "en", text_split_method=None):
+        """ GPT-SoVITS调用参数和音频缓存键 (输出不确定时为 None)，text_split_method 默认取配置中的值"""
+        prompt_language_literal = self.gpt_config.get_language("zh")
+        text_language_literal = self.gpt_config.get_language(text_language)
+        text_split_method = text_split_method or self.gpt_config.text_split_method
+
+        # 参考文本只在文件变化时重新读取
+        prompt_text_to_use = ""
+        try:
+            prompt_text_to_use = self.gpt_sovits_client.reference_text(self.ref_text_path)
+        except OSError:
+            print(f"⚠️ 参考文本文件未找到: {self.ref_text_path}, 使用空字符串。")
+
+        # 音频缓存: 只有输出确定 (固定种子、keep_random=False) 时才查询/写入
+        cache_key = None
+        if self.tts_cache and self.gpt_config.is_deterministic():
+            cache_key = self.tts_cache.make_key(text, backend="gpt-sovits", text_lang=text_language_literal,
+                                                ref_audio=file_fingerprint(self.ref_wav_path),
+                                                prompt_text=prompt_text_to_use,
+                                                prompt_lang=prompt_language_literal,
+                                                **{**self.gpt_config.cache_params(),
+                                                   "text_split_method": text_split_method})
+
+        params_to_api = {
+            "text": text,
+            "text_lang": text_language_literal,
+            "ref_audio_path": self.ref_wav_path, # gradio: 本地路径，只在文件变化时上传; http: API所在机器上的路径
+            "aux_ref_audio_paths": [], # 根据API定义，如果不需要则为空列表
+            "prompt_text": prompt_text_to_use,
+            "prompt_lang": prompt_language_literal,
+            "top_k": self.gpt_config.top_k,
+            "top_p": self.gpt_config.top_p,
+            "temperature": self.gpt_config.temperature,
+            "text_split_method": text_split_method,
+            "batch_size": self.gpt_config.batch_size,
+            "speed_factor": self.gpt_config.speed_factor,
+            "ref_text_free": self.gpt_config.ref_text_free,
+            "split_bucket": self.gpt_config.split_bucket,
+            "fragment_interval": self.gpt_config.fragment_interval,
+            "seed": self.gpt_config.seed,
+            "keep_random": self.gpt_config.keep_random,
+            "parallel_infer": self.gpt_config.parallel_infer,
+            "repetition_penalty": self.gpt_config.repetition_penalty,
+            "sample_steps": self.gpt_config.sample_steps,
+            "super_sampling": self.gpt_config.super_sampling,
+        }
+        return params_to_api, cache_key
+
+    def __format_timings__(self, timings=None) -> str:
+        """ GPT-SoVITS调用的各阶段耗时，默认取当前线程的上一次调用"""
+        timings = self.gpt_sovits_client.last_timings if timings is None else timings
+        return ", ".join(f"{name} {value * 1000:.1f}ms" for name, value in timings.items())
+
+    def gpt_sovits_synthesize(self, text: str, text_language: str = "en", text_split_method=None):
+        """调用GPT-SoVITS (gradio /inference 或 HTTP /tts) 进行语音合成，text_split_method 默认取配置中的值"""
+        if not self.gpt_sovits_client:
+            return self.fallback_synthesize(text, "客户端未初始化")
         try:
             synthesis_api_call_start_time = time.time()
-            print(f"🔊 [{synthesis_api_call_start_time:.3f}] 开始GPT-SoVITS合成 (API: /inference): '{text}'")
-            
-            prompt_language_literal = self.gpt_config.get_language("zh")
-            text_language_literal = self.gpt_config.get_language(text_language)
-            
-            ref_audio_path_to_use = self.ref_wav_path
-            
-            # 从 ref_text_path 读取参考文本
-            prompt_text_to_use = ""
-            if os.path.exists(self.ref_text_path):
-                with open(self.ref_text_path, 'r', encoding='utf-8') as f:
-                    prompt_text_to_use = f.read().strip()
-            else:
-                print(f"⚠️ 参考文本文件未找到: {self.ref_text_path}, 使用空字符串。")
-
-            params_to_api = {
-                "text": text,
-                "text_lang": text_language_literal,
-                "ref_audio_path": file(ref_audio_path_to_use),
-                "aux_ref_audio_paths": [], # 根据API定义，如果不需要则为空列表
-                "prompt_text": prompt_text_to_use,
-                "prompt_lang": prompt_language_literal,
-                "top_k": self.gpt_config.top_k,
-                "top_p": self.gpt_config.top_p,
-                "temperature": self.gpt_config.temperature,
-                "text_split_method": self.gpt_config.text_split_method,
-                "batch_size": self.gpt_config.batch_size,
-                "speed_factor": self.gpt_config.speed_factor,
-                "ref_text_free": self.gpt_config.ref_text_free,
-                "split_bucket": self.gpt_config.split_bucket,
-                "fragment_interval": self.gpt_config.fragment_interval,
-                "seed": self.gpt_config.seed,
-                "keep_random": self.gpt_config.keep_random,
-                "parallel_infer": self.gpt_config.parallel_infer,
-                "repetition_penalty": self.gpt_config.repetition_penalty,
-                "sample_steps": self.gpt_config.sample_steps,
-                "super_sampling": self.gpt_config.super_sampling,
-                "api_name": "/inference"
-            }
+            print(f"🔊 [{synthesis_api_call_start_time:.3f}] 开始GPT-SoVITS合成 (后端: {self.tts_backend}): '{text}'")
             
+            params_to_api, cache_key = self.gpt_sovits_request(text, text_language, text_split_method)
+            if cache_key:
+                cached_audio = self.tts_cache.get(cache_key)
+                if cached_audio is not None:
+                    cache_stats = self.tts_cache.stats()
+                    print(f"   [TTS缓存] 命中 ({time.time() - synthesis_api_call_start_time:.3f}s), 命中率: {cache_stats['hit_rate']:.1%}")
+                    return cached_audio, text
+
             print("   [GPT-SoVITS Params] Preparing to call predict with:")
             # for k, v in params_to_api.items():
             #     if k == "ref_audio_path":
@@ -192,96 +496,74 @@ class AudioSocketServerFunASR:
             #         print(f"     {k}: {v}")
             # 打印关键参数
             print(f"     Text: '{params_to_api['text']}' ({params_to_api['text_lang']})")
-            print(f"     Ref Audio: {ref_audio_path_to_use}")
+            print(f"     Ref Audio: {params_to_api['ref_audio_path']}")
             print(f"     Prompt Text: '{params_to_api['prompt_text']}' ({params_to_api['prompt_lang']})")
             print(f"     Seed: {params_to_api['seed']}, Keep Random: {params_to_api['keep_random']}")
             print(f"     Sample Steps: {params_to_api['sample_steps']}, Temperature: {params_to_api['temperature']}")
 
 
             predict_call_start_time = time.time()
-            result_tuple = self.gpt_sovits_client.predict(**params_to_api)
+            try:
+                (audio_data_for_client, returned_seed), timings = self.tts_breaker.call(
+                    self.__gpt_sovits_call__, params_to_api, timeout=self.TTS_CALL_TIMEOUT)
+            except CircuitOpenError:
+                return self.fallback_synthesize(text, "熔断器打开")
             predict_call_end_time = time.time()
-            print(f"   [GPT-SoVITS API Call] predict耗时: {predict_call_end_time - predict_call_start_time:.3f}s")
-
-            if isinstance(result_tuple, tuple) and len(result_tuple) == 2:
-                output_audio_path, returned_seed = result_tuple
-                print(f"   [GPT-SoVITS API] Returned audio path: {output_audio_path}, Returned seed: {returned_seed}")
-                if output_audio_path and os.path.exists(output_audio_path):
-                    try:
-                        save_dir = os.path.join(os.path.dirname(__file__), "server_outputs", "sovits_raw_outputs")
-                        os.makedirs(save_dir, exist_ok=True)
-                        timestamp = time.strftime("%Y%m%d-%H%M%S")
-                        safe_text_suffix = "".join(filter(str.isalnum, text[:20]))
-                        filename = f"{timestamp}_{str(returned_seed).replace('.', '')}_{safe_text_suffix}.wav"
-                        raw_output_filepath = os.path.join(save_dir, filename)
-                        
-                        import shutil
-                        shutil.copy2(output_audio_path, raw_output_filepath)
-                        print(f"   [GPT-SoVITS API] Raw output saved to: {raw_output_filepath}")
-                        
-                        # 读取保存的或原始的API输出音频文件内容以供发送
-                        with open(raw_output_filepath, 'rb') as f_audio:
-                            audio_data_for_client = f_audio.read()
-                        synthesis_api_call_end_time = time.time()
-                        print(f"   [GPT-SoVITS API] 整个合成函数耗时: {synthesis_api_call_end_time - synthesis_api_call_start_time:.3f}s")
-                        return audio_data_for_client, text # 返回读取到的音频数据和原始文本
-                    except Exception as e_save:
-                        print(f"❌ 保存或读取SoVITS原始输出音频失败: {e_save}")
-                        return None, None
-                else:
-                    print("❌ SoVITS API未返回有效音频路径或文件不存在。")
-                    return None, None
-            else:
-                print(f"❌ SoVITS API返回结果格式不符合预期: {result_tuple}")
-                return None, None
+            print(f"   [GPT-SoVITS API Call] 耗时: {predict_call_end_time - predict_call_start_time:.3f}s "
+                  f"({self.__format_timings__(timings)}), 返回种子: {returned_seed}")
+
+            if not audio_data_for_client:
+                print("❌ SoVITS API未返回音频数据。")
+                return self.fallback_synthesize(text, "未返回音频数据")
+            # 存档副本交给后台线程写入
+            safe_text_suffix = "".join(filter(str.isalnum, text[:20]))
+            self.archive.submit("sovits_raw_outputs", f"{str(returned_seed).replace('.', '')}_{safe_text_suffix}",
+                                audio_data_for_client)
+            if cache_key:
+                self.tts_cache.put(cache_key, audio_data_for_client)
+            synthesis_api_call_end_time = time.time()
+            print(f"   [GPT-SoVITS API] 整个合成函数耗时: {synthesis_api_call_end_time - synthesis_api_call_start_time:.3f}s")
+            return audio_data_for_client, text # 返回音频数据和原始文本
         except Exception as e:
             print(f"❌ 调用GPT-SoVITS API失败: {e}")
             import traceback
             traceback.print_exc()
             synthesis_api_call_failed_time = time.time()
             print(f"   [GPT-SoVITS API] 合成函数失败耗时: {synthesis_api_call_failed_time - synthesis_api_call_start_time:.3f}s")
-            return None, None # 返回 None, None 表示失败
+            return self.fallback_synthesize(text, type(e).__name__) # 降级也失败时返回 None, None
 
     def stream_audio_to_client(self, audio_data: bytes, client_socket, original_text="unknown"):
-        """将音频数据(前缀长度头)发送到客户端，并在发送前保存一份以供调试"""
+        """将音频数据(前缀长度头)发送到客户端，并在后台存档一份以供调试"""
+        session = self.sessions.get(client_socket)
         try:
-            if client_socket and hasattr(client_socket, 'sendall'):
+            if session and not session.closed:
                 send_start_time = time.time()
                 audio_bytes_to_send = audio_data
 
-                # 调试：在发送前保存一份完整的WAV文件
-                try:
-                    save_dir = os.path.join(os.path.dirname(__file__), "server_outputs", "funasr_sent_audio")
-                    os.makedirs(save_dir, exist_ok=True)
-                    timestamp = time.strftime("%Y%m%d-%H%M%S")
-                    safe_text_suffix = "".join(filter(str.isalnum, original_text[:20])) if original_text else "audio"
-                    debug_filename = f"{timestamp}_{safe_text_suffix}_sent_to_client.wav"
-                    debug_filepath = os.path.join(save_dir, debug_filename)
-                    with open(debug_filepath, 'wb') as f_debug:
-                        f_debug.write(audio_bytes_to_send)
-                    print(f"🔍 [调试] 即将发送的音频已保存到: {debug_filepath}, 大小: {len(audio_bytes_to_send)} bytes")
-                except Exception as e_save:
-                    print(f"⚠️ [调试] 保存发送前音频失败: {e_save}")
-
-                # 1. 准备长度头 (8字节，网络字节序，无符号长整型)
-                data_len = len(audio_bytes_to_send)
-                header = struct.pack("!Q", data_len) # Q is for unsigned long long (8 bytes)
-
-                # 2. 发送长度头
-                send_header_start_time = time.time()
-                client_socket.sendall(header)
-                send_header_end_time = time.time()
-                print(f"✉️  [{send_header_end_time:.3f}] 已发送数据长度头部: {data_len} bytes (头部本身 {len(header)} bytes, 发送耗时: {send_header_end_time - send_header_start_time:.3f}s)")
+                # 调试：发送前的完整WAV交给后台存档线程 (队列满时丢弃，不阻塞发送)
+                safe_text_suffix = "".join(filter(str.isalnum, original_text[:20])) if original_text else "audio"
+                self.archive.submit("funasr_sent_audio", f"{safe_text_suffix}_sent_to_client", audio_bytes_to_send)
 
-                # 3. 发送实际音频数据
+                data_len = len(audio_bytes_to_send)
                 send_data_start_time = time.time()
-                client_socket.sendall(audio_bytes_to_send)
+                if session.framed:
+                    # v2协议: 一个AUDIO帧 (帧头24字节，包含会话、序号和时间戳)
+                    header_size = FRAME_HEADER.size
+                    if session.downstream_codec != "pcm16":
+                        # 压缩编码: 解出WAV中的PCM再按协商的编码发送
+                        audio_bytes_to_send = session.encode_audio(*wav_to_pcm16(audio_bytes_to_send))
+                        print(f"   [编码] {session.downstream_codec}: {data_len} -> {len(audio_bytes_to_send)} bytes")
+                        data_len = len(audio_bytes_to_send)
+                    session.send_frame(MessageType.AUDIO, audio_bytes_to_send)
+                else:
+                    # 旧协议: 1. 准备长度头 (8字节，网络字节序，无符号长整型)
+                    header = LEGACY_HEADER.pack(data_len) # Q is for unsigned long long (8 bytes)
+                    header_size = len(header)
+                    # 2. 发送长度头和实际音频数据 (持有会话发送锁，避免多个线程的数据在同一socket上交错)
+                    session.sendall(header, audio_bytes_to_send)
                 send_data_end_time = time.time()
-                print(f"✅ [{send_data_end_time:.3f}] 音频数据已发送到客户端 (实际大小: {data_len} bytes, 发送耗时: {send_data_end_time - send_data_start_time:.3f}s)")
+                print(f"✅ [{send_data_end_time:.3f}] 音频数据已发送到客户端 (实际大小: {data_len} bytes + 头部 {header_size} bytes, 发送耗时: {send_data_end_time - send_data_start_time:.3f}s)")
                 print(f"   [Total Send Time] 总发送耗时: {send_data_end_time - send_start_time:.3f}s")
-                
-                # 移除 client_socket.shutdown(socket.SHUT_WR)
-                # print("ℹ️  保持连接开放，以便发送更多音频。") # 可选的日志
 
             else:
                 print("⚠️  客户端连接已断开或无效，无法发送音频")
@@ -289,18 +571,25 @@ class AudioSocketServerFunASR:
             # BrokenPipeError (errno 32) 可能会在客户端已关闭连接时发生
             # ConnectionResetError (errno 104) 也表示连接问题
             print(f"❌ 发送音频数据失败 (连接可能已由客户端关闭): {e}")
-            # 如果发送失败，可能需要从 read_list 中移除此socket，避免select错误
-            if client_socket in self.read_list:
-                print(f"ℹ️  从监听列表中移除故障socket: {client_socket.getpeername() if hasattr(client_socket, 'getpeername') else client_socket}")
-                self.read_list.remove(client_socket)
-                try:
-                    client_socket.close() # 彻底关闭这个出错的socket
-                except Exception as e_close:
-                    print(f"⚠️ 关闭故障socket时发生错误: {e_close}")
-            # 不再向上抛出，允许服务器继续为其他客户端服务
+            # 从 read_list 和会话中移除此socket，避免select错误；不再向上抛出，允许服务器继续为其他客户端服务
+            self.close_client(client_socket, "ℹ️  移除故障客户端")
+
+    def close_client(self, client_socket, reason):
+        """停止监听客户端，关闭其会话和socket"""
+        if client_socket in self.read_list:
+            self.read_list.remove(client_socket)
+        session = self.sessions.close(client_socket)
+        # 丢弃该客户端尚未处理的翻译/合成任务
+        self.pipeline.discard(client_socket)
+        try:
+            client_socket.close()
+        except OSError as e_close:
+            print(f"⚠️ 关闭socket时发生错误: {e_close}")
+        print(f"{reason}: {session.address if session else client_socket} (剩余会话: {len(self.sessions)})")
 
     def start(self):
         """ Starts the server"""
+        self.pipeline.start()
         self.transcriber.start(16000, 2)
         print(f"🚀 GPT-SoVITS Translation Server listening on port {self.PORT}")
         print(f"📡 Connected to GPT-SoVITS API: {self.gpt_config.api_url}")
@@ -315,26 +604,35 @@ class AudioSocketServerFunASR:
                 for s in readable:
                     if s is self.serversocket:
                         (clientsocket, address) = self.serversocket.accept()
+                        # select之后recv立即返回；sendall最多等待SEND_TIMEOUT秒
+                        clientsocket.settimeout(self.SEND_TIMEOUT)
                         self.read_list.append(clientsocket)
-                        print("Connection from", address)
+                        session = self.sessions.open(clientsocket, address)
+                        print("Connection from", address, f"(会话 {session.session_id}, 当前 {len(self.sessions)} 个会话)")
                     else:
                         try:
                             data = s.recv(4096)
                             if data:
-                                self.data_queue.put((s, data))
+                                self.handle_client_data(s, data)
                             else:
-                                print(f"ℹ️  客户端 {address} 断开连接 (recv返回空数据)") # 增加地址信息
-                                self.read_list.remove(s)
-                                # print("Disconnection from", address) # 此行重复
+                                self.close_client(s, "ℹ️  客户端断开连接 (recv返回空数据)")
                         except ConnectionResetError:
-                            print(f"❌ 客户端 {address} 连接被重置") # 增加地址信息
-                            self.read_list.remove(s)
-                            # print("Client crashed from", address) # 此行重复
+                            self.close_client(s, "❌ 客户端连接被重置")
         except KeyboardInterrupt:
             pass
         print("Performing server cleanup")
         self.audio.terminate()
         self.transcriber.stop()
+        self.pipeline.stop()
+        self.archive.close()
+        print(f"📊 调试音频存档: {self.archive.stats()}")
+        print(f"📊 GPT-SoVITS熔断器: {self.tts_breaker.stats()}, 降级合成 {self.fallback_count} 次")
+        if isinstance(self.gpt_sovits_client, TTSBackendPool):
+            self.gpt_sovits_client.close()
+            pool_stats = self.gpt_sovits_client.stats()
+            print(f"📊 TTS副本池: 请求 {pool_stats['requests']}, 对冲 {pool_stats['hedged']}, 故障转移 {pool_stats['failovers']}")
+            for name, replica in pool_stats["replicas"].items():
+                print(f"   {name}: {replica}")
         self.serversocket.shutdown(socket.SHUT_RDWR)
         self.serversocket.close()
         print("Sockets cleaned up")
@@ -377,12 +675,30 @@ class AudioSocketServerFunASR:
 if __name__ == "__main__":
     import sys
     
-    gpt_sovits_api = "http://localhost:9872"
-    if len(sys.argv) > 1:
-        gpt_sovits_api = sys.argv[1]
+    tts_seed = next((arg.split("=", 1)[1] for arg in sys.argv[1:] if arg.startswith("--tts-seed=")), None)
+    # --archive-sampling=0.1: 只存档10%的调试音频 (0 关闭)；--archive-format=flac|int16|wav
+    # --tts-backend=http: 使用GPT-SoVITS的 api_v2.py (默认端口9880) 而不是gradio WebUI (默认端口9872)
+    # --no-tts-fallback: GPT-SoVITS不可用时不加载/使用SpeechT5降级合成
+    # 多个副本: python server_funasr.py http://gpu1:9880,http://gpu2:9880 --tts-hedge=auto (或秒数，如 1.5)
+    options = dict(arg[2:].split("=", 1) for arg in sys.argv[1:] if arg.startswith("--") and "=" in arg)
+    tts_backend = options.get("tts-backend", "gradio")
+    gpt_sovits_api = "http://localhost:9880" if tts_backend == "http" else "http://localhost:9872"
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if args:
+        gpt_sovits_api = args[0]
     
     server = AudioSocketServerFunASR(
         funasr_model="paraformer-zh",
-        gpt_sovits_api=gpt_sovits_api
+        gpt_sovits_api=gpt_sovits_api,
+        streaming_asr="--streaming" in sys.argv,
+        vad_backend="energy" if "--vad" in sys.argv else None,
+        translation_service="local" if "--local-mt" in sys.argv else "google",
+        tts_seed=tts_seed,
+        streaming_tts="--streaming-tts" in sys.argv,
+        archive_sampling=float(options.get("archive-sampling", 1.0)),
+        archive_storage=options.get("archive-format", "flac"),
+        tts_backend=tts_backend,
+        tts_hedge=options.get("tts-hedge"),
+        tts_fallback="--no-tts-fallback" not in sys.argv
     )
     server.start() 
\ No newline at end of file
@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""测试熔断器 (models/circuit_breaker.py): 打开、半开探测、过期结果和 call() 超时
+
+不需要任何后端，open_duration 用很短的时间。
+用法: python test_circuit_breaker.py  (或 python -m pytest test_circuit_breaker.py)
+"""
+import time
+from models.circuit_breaker import CircuitBreaker, CircuitOpenError
+
+def _fail(breaker, count):
+    for _ in range(count):
+        breaker.record(False, 0.1, ticket=breaker.allow())
+
+def _wait_half_open(breaker):
+    time.sleep(breaker._open_duration + 0.02)
+
+def test_opens_on_consecutive_failures():
+    """连续 consecutive_failures 次失败后打开，打开期间 allow() 返回0"""
+    breaker = CircuitBreaker("test", consecutive_failures=3, min_calls=100, open_duration=0.1)
+    _fail(breaker, 2)
+    assert breaker.state == CircuitBreaker.CLOSED
+    _fail(breaker, 1)
+    assert breaker.state == CircuitBreaker.OPEN and not breaker.allow()
+    assert breaker.stats()["rejected"] == 1 and breaker.stats()["trips"] == 1
+    print("✅ 连续失败后打开")
+
+def test_opens_on_failure_rate():
+    """窗口内失败率达到 failure_rate (至少 min_calls 次调用) 时打开，成功和慢调用的判断"""
+    breaker = CircuitBreaker("test", window=10, min_calls=4, failure_rate=0.5, consecutive_failures=100,
+                             slow_call_threshold=1.0, open_duration=0.1)
+    for success, latency in [(True, 0.1), (False, 0.1), (True, 0.1)]:
+        breaker.record(success, latency, ticket=breaker.allow())
+    assert breaker.state == CircuitBreaker.CLOSED
+    # 成功但过慢的调用算作失败: 2/4 失败
+    breaker.record(True, 2.0, ticket=breaker.allow())
+    assert breaker.state == CircuitBreaker.OPEN, breaker.stats()
+    assert breaker.stats()["slow_calls"] == 1
+    print("✅ 失败率达到阈值后打开")
+
+def test_half_open_probe_success_closes():
+    """open_duration 之后半开，只放行 half_open_probes 个探测，探测成功后关闭"""
+    breaker = CircuitBreaker("test", consecutive_failures=1, open_duration=0.1)
+    _fail(breaker, 1)
+    assert not breaker.allow()
+    _wait_half_open(breaker)
+    probe = breaker.allow()
+    assert probe and breaker.state == CircuitBreaker.HALF_OPEN
+    assert not breaker.allow(), "second probe admitted"
+    breaker.record(True, 0.1, ticket=probe)
+    assert breaker.state == CircuitBreaker.CLOSED and breaker.allow()
+    print("✅ 半开探测成功后关闭")
+
+def test_half_open_probe_failure_reopens_longer():
+    """探测失败后重新打开，打开时间加倍 (不超过 max_open_duration)"""
+    breaker = CircuitBreaker("test", consecutive_failures=1, open_duration=0.1, max_open_duration=0.15)
+    _fail(breaker, 1)
+    _wait_half_open(breaker)
+    breaker.record(False, 0.1, ticket=breaker.allow())
+    assert breaker.state == CircuitBreaker.OPEN and breaker._open_duration == 0.15
+    assert not breaker.allow()
+    _wait_half_open(breaker)
+    assert breaker.allow() and breaker.state == CircuitBreaker.HALF_OPEN
+    print("✅ 探测失败后重新打开，时间加倍")
+
+def test_stale_results_are_ignored():
+    """打开之前放行的调用晚到的结果不能关闭半开的熔断器，也不能让它重新打开"""
+    breaker = CircuitBreaker("test", consecutive_failures=2, open_duration=0.1)
+    early_success = breaker.allow()
+    early_failure = breaker.allow()
+    _fail(breaker, 2)
+    _wait_half_open(breaker)
+    probe = breaker.allow()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record(True, 0.1, ticket=early_success)
+    assert breaker.state == CircuitBreaker.HALF_OPEN, "stale success closed the circuit"
+    breaker.record(False, 0.1, timed_out=True, ticket=early_failure)
+    assert breaker.state == CircuitBreaker.HALF_OPEN, "stale timeout re-opened the circuit"
+    assert breaker.stats()["stale"] == 2
+    breaker.record(True, 0.1, ticket=probe)
+    assert breaker.state == CircuitBreaker.CLOSED
+    print("✅ 过期的结果被忽略")
+
+def test_release_frees_probe():
+    """release() 释放探测名额而不记录结果"""
+    breaker = CircuitBreaker("test", consecutive_failures=1, open_duration=0.1)
+    _fail(breaker, 1)
+    _wait_half_open(breaker)
+    calls = breaker.stats()["calls"]
+    breaker.release(breaker.allow())
+    assert breaker.state == CircuitBreaker.HALF_OPEN and breaker.stats()["calls"] == calls
+    assert breaker.allow(), "probe slot was not released"
+    print("✅ release() 释放探测名额")
+
+def test_call_timeout():
+    """call() 超过 timeout 时抛出 TimeoutError 并记为失败，打开后抛出 CircuitOpenError"""
+    breaker = CircuitBreaker("test", consecutive_failures=2, open_duration=1.0)
+    assert breaker.call(lambda x: x * 2, 21, timeout=1.0) == 42
+    for _ in range(2):
+        start = time.perf_counter()
+        try:
+            breaker.call(time.sleep, 0.5, timeout=0.05)
+            assert False, "no timeout"
+        except TimeoutError:
+            pass
+        assert time.perf_counter() - start < 0.3
+    stats = breaker.stats()
+    assert stats["timeouts"] == 2 and stats["state"] == CircuitBreaker.OPEN, stats
+    try:
+        breaker.call(lambda: None)
+        assert False, "call admitted while open"
+    except CircuitOpenError:
+        pass
+    print(f"✅ call() 超时: {stats}")
+
+if __name__ == "__main__":
+    print("🧪 测试熔断器")
+    test_opens_on_consecutive_failures()
+    test_opens_on_failure_rate()
+    test_half_open_probe_success_closes()
+    test_half_open_probe_failure_reopens_longer()
+    test_stale_results_are_ignored()
+    test_release_frees_probe()
+    test_call_timeout()
+    print("🎉 全部通过")
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""测试Whisper识别器 (models/speech_recognition.py) 何时结束一句话
+
+- 流式: "yes"/"no" 这样不到 min_chunk_seconds 的话还没有解码过，没有 recent_transcription。
+  工作线程仍要在 phrase_timeout 后醒来，解码剩下的音频并输出这句话，而不是等下一个音频包。
+- 非流式: 客户端连续采集 (每40毫秒一帧) 时，一句话在停顿后结束，而不是开始后 phrase_timeout 秒就被切开。
+不需要Whisper模型: whisper.load_model 换成一个固定返回 " yes" 的替身模型 (仍需安装 torch 和 whisper)。
+用法: python test_speech_recognition_phrases.py  (或 python -m pytest test_speech_recognition_phrases.py)
+"""
+import time
+import threading
+from queue import Queue
+import numpy as np
+import whisper
+from models.speech_recognition import SpeechRecognitionModel
+
+SAMPLE_RATE = 16000
+
+class _StandInWhisper:
+    """只实现 transcribe 的返回格式 (text，以及 word_timestamps=True 时的 segments)"""
+    def __init__(self):
+        self.calls = 0
+
+    def transcribe(self, audio, **options):
+        self.calls += 1
+        return {"text": " yes", "segments": [{"words": [{"start": 0.1, "end": 0.4, "word": " yes"}]}]}
+
+def _recognizer(streaming, finals, finalized):
+    stand_in = _StandInWhisper()
+    load_model = whisper.load_model
+    whisper.load_model = lambda *args, **kwargs: stand_in
+    try:
+        recognizer = SpeechRecognitionModel(Queue(), model_name="tiny", streaming=streaming,
+                                            final_callback=lambda text, client: (finals.append(text), finalized.set()))
+    finally:
+        whisper.load_model = load_model
+    recognizer.start(SAMPLE_RATE, 2)
+    return recognizer, recognizer.data_queue, stand_in
+
+def _tone(seconds):
+    return (np.sin(np.arange(int(seconds * SAMPLE_RATE)) * 0.1) * 8000).astype(np.int16)
+
+def test_short_phrase_is_finalized():
+    """流式: 0.6秒的一句话在停顿后输出，之后没有再收到任何音频"""
+    finals, finalized = [], threading.Event()
+    recognizer, data_queue, stand_in = _recognizer(True, finals, finalized)
+    try:
+        data_queue.put(("client", _tone(0.6).tobytes()))
+        assert finalized.wait(recognizer.phrase_timeout + 2.0), "short phrase was never finalized"
+        assert finals == ["yes"], finals
+        assert stand_in.calls == 1, stand_in.calls
+        print(f"✅ 短句: '{finals[0]}' 在停顿后输出 (解码 {stand_in.calls} 次)")
+    finally:
+        recognizer.stop()
+
+def test_continuous_frames_end_on_pause():
+    """非流式: 连续2.5秒每40毫秒一帧，说话期间不结束这句话，停顿后只输出一次"""
+    finals, finalized = [], threading.Event()
+    recognizer, data_queue, _ = _recognizer(False, finals, finalized)
+    try:
+        frame = _tone(0.04).tobytes()
+        for _ in range(int(2.5 / 0.04)):
+            data_queue.put(("client", frame))
+            time.sleep(0.04)
+        assert not finals, f"phrase cut while frames kept arriving: {finals}"
+        assert finalized.wait(recognizer.phrase_timeout + 2.0), "phrase was never finalized"
+        time.sleep(0.2)
+        assert finals == ["yes"], finals
+        print(f"✅ 连续帧: 停顿后输出一次 '{finals[0]}'")
+    finally:
+        recognizer.stop()
+
+if __name__ == "__main__":
+    print("🧪 测试识别器何时结束一句话")
+    test_short_phrase_is_finalized()
+    test_continuous_frames_end_on_pause()
+    print("🎉 全部通过")
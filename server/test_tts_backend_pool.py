@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""测试TTS副本池 (models/tts_pool.py): 路由、故障转移、健康检查和对冲请求
+
+不需要GPT-SoVITS: 在本机启动几个模拟 api_v2.py /tts 接口的HTTP服务器，可以设置延迟和故障。
+用法: python test_tts_backend_pool.py  (或 python -m pytest test_tts_backend_pool.py)
+"""
+import json
+import os
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # shared/
+from models.gpt_sovits_client import GPTSoVITSHTTPClient
+from models.tts_pool import TTSBackendPool
+from shared.codecs import wav_to_pcm16
+
+SAMPLE_RATE = 32000
+PARAMS = {"text": "hello", "text_lang": "英文", "prompt_text": "", "prompt_lang": "中文",
+          "text_split_method": "不切", "seed": 1.0, "keep_random": False}
+
+class StandInTTSServer:
+    """模拟GPT-SoVITS api_v2.py: POST /tts 以分块传输返回0.1秒的WAV (头中数据长度为占位值)
+       delay: 响应前等待的秒数, fail: 返回500, down: 健康检查也返回503,
+       failed_pings: 接下来这么多次健康检查返回503"""
+    def __init__(self):
+        self.delay = 0.0
+        self.fail = False
+        self.down = False
+        self.failed_pings = 0
+        self.pings = 0
+        self.requests = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                stand_in.pings += 1
+                flaky = stand_in.failed_pings > 0
+                stand_in.failed_pings -= flaky
+                self.send_response(503 if stand_in.down or flaky else 404)
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+
+            def do_POST(self):
+                json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                stand_in.requests += 1
+                time.sleep(stand_in.delay)
+                if stand_in.fail or stand_in.down:
+                    body = b'{"message": "tts failed"}'
+                    self.send_response(500)
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                pcm = (np.sin(np.arange(SAMPLE_RATE // 10) * 0.1) * 8000).astype("<i2").tobytes()
+                data = (b"RIFF" + struct.pack("<I", 0xFFFFFFFF) + b"WAVE" + b"fmt " +
+                        struct.pack("<IHHIIHH", 16, 1, 1, SAMPLE_RATE, SAMPLE_RATE * 2, 2, 16) +
+                        b"data" + struct.pack("<I", 0xFFFFFFFF) + pcm)
+                self.send_response(200)
+                self.send_header("Content-Type", "audio/wav")
+                self.send_header("Transfer-Encoding", "chunked")
+                self.end_headers()
+                for i in range(0, len(data), 1000):
+                    chunk = data[i:i + 1000]
+                    self.wfile.write(b"%x\r\n" % len(chunk) + chunk + b"\r\n")
+                self.wfile.write(b"0\r\n\r\n")
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+def _pool(count, **options):
+    servers = [StandInTTSServer() for _ in range(count)]
+    pool = TTSBackendPool([GPTSoVITSHTTPClient(server.url, timeout=5) for server in servers], **options)
+    return servers, pool
+
+def _close(servers, pool):
+    pool.close()
+    for server in servers:
+        server.close()
+
+def test_least_outstanding_routing():
+    """并发请求分散到所有副本，返回完整音频"""
+    servers, pool = _pool(3)
+    try:
+        for server in servers:
+            server.delay = 0.1
+        with ThreadPoolExecutor(max_workers=6) as executor:
+            results = list(executor.map(lambda _: pool.synthesize("/ref.wav", **PARAMS), range(6)))
+        for wav, seed in results:
+            pcm, sample_rate = wav_to_pcm16(wav)
+            assert sample_rate == SAMPLE_RATE and len(pcm) == SAMPLE_RATE // 10
+        assert [server.requests for server in servers] == [2, 2, 2], [server.requests for server in servers]
+        print(f"✅ 路由: 每个副本 {[server.requests for server in servers]} 个请求")
+    finally:
+        _close(servers, pool)
+
+def test_failover_and_health():
+    """故障副本的请求转移到其他副本，连续失败后移出，健康检查通过后恢复"""
+    servers, pool = _pool(2, max_failures=2, health_interval=0.2)
+    try:
+        servers[0].fail = True
+        servers[0].down = True
+        for _ in range(4):
+            wav, _ = pool.synthesize("/ref.wav", **PARAMS)
+            assert wav
+        stats = pool.stats()
+        broken = stats["replicas"][servers[0].url]
+        assert not broken["healthy"] and broken["failures"] == 2, broken
+        assert stats["failovers"] == 2, stats
+        served = servers[0].requests
+        pool.synthesize("/ref.wav", **PARAMS)
+        assert servers[0].requests == served, "unhealthy replica still receives requests"
+
+        servers[0].fail = False
+        servers[0].down = False
+        deadline = time.time() + 2.0
+        while not pool.stats()["replicas"][servers[0].url]["healthy"] and time.time() < deadline:
+            time.sleep(0.05)
+        assert pool.stats()["replicas"][servers[0].url]["healthy"], "replica did not come back"
+        print(f"✅ 故障转移和健康检查: {pool.stats()['failovers']} 次故障转移，副本已恢复")
+    finally:
+        _close(servers, pool)
+
+def test_health_check_tolerates_single_miss():
+    """一次失败的健康检查不移出副本，连续 max_failures 次失败才移出"""
+    servers, pool = _pool(2, max_failures=2, health_interval=0.1)
+    try:
+        def wait_pings(count):
+            target = servers[0].pings + count
+            deadline = time.time() + 2.0
+            while servers[0].pings < target and time.time() < deadline:
+                time.sleep(0.02)
+            time.sleep(0.05)
+
+        servers[0].failed_pings = 1
+        wait_pings(3)
+        assert pool.stats()["replicas"][servers[0].url]["healthy"], "replica ejected after a single missed ping"
+
+        servers[0].down = True
+        wait_pings(2)
+        assert not pool.stats()["replicas"][servers[0].url]["healthy"], "replica kept after missed pings in a row"
+        print(f"✅ 健康检查: 单次失败不移出，连续 {pool.max_failures} 次失败后移出")
+    finally:
+        _close(servers, pool)
+
+def test_streaming_failover():
+    """流式请求在收到音频之前失败时转移到其他副本"""
+    servers, pool = _pool(2)
+    try:
+        servers[0].fail = True
+        for _ in range(2):
+            samples = sum(len(pcm) for pcm, _ in pool.stream("/ref.wav", **PARAMS))
+            assert samples == SAMPLE_RATE // 10, samples
+        assert "first_audio" in pool.last_timings
+        print(f"✅ 流式故障转移: {pool.stats()['failovers']} 次")
+    finally:
+        _close(servers, pool)
+
+def test_hedged_requests():
+    """慢副本上的请求在 hedge_after 后对冲到另一个副本，先返回的结果胜出"""
+    servers, pool = _pool(2, hedge_after=0.1)
+    try:
+        servers[0].delay = 1.0
+        # 让第二个副本的平均延迟更高，首选请求先发给慢的第一个副本
+        pool.replicas[1].latencies.append(5.0)
+        start = time.perf_counter()
+        wav, _ = pool.synthesize("/ref.wav", **PARAMS)
+        elapsed = time.perf_counter() - start
+        stats = pool.stats()
+        assert wav and elapsed < 0.6, elapsed
+        assert stats["hedged"] == 1 and stats["replicas"][servers[1].url]["hedges_won"] == 1, stats
+        print(f"✅ 对冲请求: {elapsed * 1000:.0f}ms (慢副本 1000ms)")
+        for name, replica in stats["replicas"].items():
+            print(f"   {name}: {replica}")
+    finally:
+        _close(servers, pool)
+
+if __name__ == "__main__":
+    print("🧪 测试TTS副本池")
+    test_least_outstanding_routing()
+    test_failover_and_health()
+    test_health_check_tolerates_single_miss()
+    test_streaming_failover()
+    test_hedged_requests()
+    print("🎉 全部通过")
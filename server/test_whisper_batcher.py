@@ -0,0 +1,34 @@
+#!/usr/bin/env python3
+"""测试Whisper批处理 (models/whisper_batcher.py): 批处理的梅尔频谱与单独计算的相同
+
+不需要加载Whisper模型，只用 whisper.log_mel_spectrogram。安静的窗口和响亮的窗口放在同一批里，
+安静窗口的频谱不能被响亮窗口改变 (log_mel_spectrogram 按整个输入的最大值截断)。
+用法: python test_whisper_batcher.py  (或 python -m pytest test_whisper_batcher.py)
+"""
+import numpy as np
+import torch
+import whisper
+from models.whisper_batcher import WhisperBatchScheduler
+
+SAMPLE_RATE = 16000
+
+def _tone(seconds, amplitude, frequency=220):
+    t = np.arange(int(seconds * SAMPLE_RATE)) / SAMPLE_RATE
+    return (amplitude * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+
+def test_batched_mel_equals_single():
+    """批处理中每个窗口的梅尔频谱等于它单独计算的结果"""
+    windows = [_tone(1.0, 0.001), _tone(2.5, 0.8, 440), _tone(0.4, 0.05, 330)]
+    batched = WhisperBatchScheduler.batch_mel(windows)
+    for i, window in enumerate(windows):
+        single = whisper.log_mel_spectrogram(torch.from_numpy(whisper.pad_or_trim(window)))
+        assert torch.allclose(batched[i], single), f"window {i} differs when batched"
+    # 对比: 整批一次计算时安静窗口的频谱会变
+    stacked = whisper.log_mel_spectrogram(torch.from_numpy(np.stack([whisper.pad_or_trim(w) for w in windows])))
+    assert not torch.allclose(stacked[0], batched[0])
+    print(f"✅ 批处理频谱: {len(windows)} 个窗口与单独计算一致")
+
+if __name__ == "__main__":
+    print("🧪 测试Whisper批处理")
+    test_batched_mel_equals_single()
+    print("🎉 全部通过")
@@ -0,0 +1,168 @@
+""" Bounded PCM buffers for incoming client audio"""
+import io
+import wave
+import numpy as np
+
+INT16_SCALE = 1.0 / 32768.0
+
+def pcm16_to_float32(pcm, out=None) -> np.ndarray:
+    """ Converts int16 PCM (bytes or an int16 array) to float32 in [-1.0, 1.0).
+
+        Reads the bytes through an int16 view and applies one scale, writing straight
+        into out when a preallocated float32 array is given (a view of its first
+        len(pcm) samples is returned). Produces the same samples as decoding a WAV
+        with soundfile.read(dtype='float32'), without building or parsing the WAV.
+    """
+    samples = pcm if isinstance(pcm, np.ndarray) else np.frombuffer(pcm, dtype=np.int16)
+    if out is None:
+        out = np.empty(len(samples), dtype=np.float32)
+    elif len(out) < len(samples):
+        raise ValueError(f"Output buffer holds {len(out)} samples, {len(samples)} needed")
+    else:
+        out = out[:len(samples)]
+    np.multiply(samples, INT16_SCALE, out=out, casting="unsafe")
+    return out
+
+def float32_to_pcm16(audio) -> np.ndarray:
+    """ Converts float32 samples in [-1.0, 1.0] to int16, clipping overshoots"""
+    return (np.clip(np.asarray(audio, dtype=np.float32), -1.0, 1.0) * 32767).astype(np.int16)
+
+def float32_to_wav(audio, sample_rate=16000) -> bytes:
+    """ Encodes float32 samples in [-1.0, 1.0] as a mono 16-bit PCM WAV file"""
+    pcm = float32_to_pcm16(audio)
+    with io.BytesIO() as wav_bytes:
+        with wave.open(wav_bytes, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(sample_rate)
+            wf.writeframes(pcm.tobytes())
+        return wav_bytes.getvalue()
+
+class PCMRingBuffer:
+    """ Pre-allocated int16 buffer holding the most recent max_seconds of a phrase.
+
+        Samples are written into an arena twice the size of the window. When the write
+        position reaches the end of the arena, the live window is moved back to the
+        start once, so every append costs O(chunk) amortized and view() can always
+        return one contiguous numpy view without copying. Audio older than
+        max_seconds is dropped from the front (counted in dropped_samples).
+
+        Views returned by view() alias the arena: use them before the next append.
+    """
+    def __init__(self, sample_rate=16000, max_seconds=30.0):
+        self.sample_rate = sample_rate
+        self.capacity = int(sample_rate * max_seconds)
+        self._arena = np.zeros(self.capacity * 2, dtype=np.int16)
+        # Scratch space for as_float32(), reused on every transcription
+        self._float_out = np.empty(self.capacity, dtype=np.float32)
+        self._start = 0
+        self._end = 0
+        # Odd trailing byte of the last append, recv() does not respect sample boundaries
+        self._pending_byte = b""
+        self.dropped_samples = 0
+        # Samples removed from the front since the last clear(), so that
+        #   window_start maps view()[0] to a position in the phrase
+        self._trimmed = 0
+
+    def append(self, data) -> None:
+        """ Appends raw little-endian int16 PCM bytes"""
+        if self._pending_byte:
+            data = self._pending_byte + bytes(data)
+            self._pending_byte = b""
+        if len(data) % 2:
+            self._pending_byte = bytes(data[-1:])
+            data = data[:-1]
+        self.append_samples(np.frombuffer(data, dtype=np.int16))
+
+    def append_samples(self, samples: np.ndarray) -> None:
+        """ Appends an int16 sample array"""
+        count = len(samples)
+        if count >= self.capacity:
+            # The chunk alone fills the window, keep only its tail
+            dropped = len(self) + count - self.capacity
+            self.dropped_samples += dropped
+            self._trimmed += dropped
+            self._arena[:self.capacity] = samples[-self.capacity:]
+            self._start, self._end = 0, self.capacity
+            return
+        overflow = len(self) + count - self.capacity
+        if overflow > 0:
+            self._start += overflow
+            self.dropped_samples += overflow
+            self._trimmed += overflow
+        if self._end + count > len(self._arena):
+            live = self._end - self._start
+            self._arena[:live] = self._arena[self._start:self._end]
+            self._start, self._end = 0, live
+        self._arena[self._end:self._end + count] = samples
+        self._end += count
+
+    def view(self) -> np.ndarray:
+        """ Zero-copy int16 view of the buffered window"""
+        return self._arena[self._start:self._end]
+
+    def as_float32(self) -> np.ndarray:
+        """ The buffered window as float32 model input, written into a reused scratch
+            array. Valid until the next call.
+        """
+        return pcm16_to_float32(self.view(), out=self._float_out)
+
+    def consume(self, num_samples: int) -> None:
+        """ Drops the oldest num_samples from the window"""
+        num_samples = min(max(num_samples, 0), len(self))
+        self._start += num_samples
+        self._trimmed += num_samples
+
+    def clear(self) -> None:
+        """ Empties the window without releasing the arena"""
+        self._start = self._end = 0
+        self._trimmed = 0
+        self._pending_byte = b""
+
+    def tobytes(self) -> bytes:
+        """ Copy of the buffered window as raw PCM bytes"""
+        return self.view().tobytes()
+
+    @property
+    def window_start(self) -> float:
+        """ Phrase time in seconds of the first buffered sample"""
+        return self._trimmed / self.sample_rate
+
+    @property
+    def duration(self) -> float:
+        """ Buffered audio in seconds"""
+        return len(self) / self.sample_rate
+
+    def __len__(self):
+        return self._end - self._start
+
+    def __bool__(self):
+        return self._end > self._start
+
+class QuietChunker:
+    """ Cuts a stream of int16 PCM into pieces of at least min_seconds, each ending at
+        the quietest frame_ms frame available, so a receiver that crossfades or pauses
+        between pieces does it in a pause rather than in the middle of a word.
+        push() returns the pieces that are complete, flush() the remainder.
+    """
+    def __init__(self, sample_rate, min_seconds=0.4, frame_ms=10):
+        self.min_samples = int(sample_rate * min_seconds)
+        self.frame = max(1, sample_rate * frame_ms // 1000)
+        self._pending = np.zeros(0, dtype=np.int16)
+
+    def push(self, pcm) -> list:
+        self._pending = np.concatenate((self._pending, np.asarray(pcm, dtype=np.int16)))
+        pieces = []
+        # Search the quietest frame after min_samples once there is at least as much to search
+        while len(self._pending) >= 2 * self.min_samples and len(self._pending) - self.min_samples >= self.frame:
+            frames = (len(self._pending) - self.min_samples) // self.frame
+            window = self._pending[self.min_samples:self.min_samples + frames * self.frame].astype(np.float32)
+            energy = np.mean(np.square(window).reshape(frames, self.frame), axis=1)
+            cut = self.min_samples + int(np.argmin(energy)) * self.frame + self.frame // 2
+            pieces.append(self._pending[:cut])
+            self._pending = self._pending[cut:]
+        return pieces
+
+    def flush(self) -> np.ndarray:
+        pending, self._pending = self._pending, np.zeros(0, dtype=np.int16)
+        return pending
@@ -0,0 +1,49 @@
+""" Sentence fragmenting that follows GPT-SoVITS's text_split_method options"""
+import re
+
+# Punctuation GPT-SoVITS cuts on
+PUNCTUATION = ",.;?!、，。？！;：…:"
+_SENTENCE_END = re.compile(r"(?<=[。？！?!…])|(?<=[.;；](?!\d))")
+_PUNCTUATION = re.compile(r"(?<=[" + re.escape(PUNCTUATION) + r"])(?![\d])")
+
+def _sentences(text):
+    return [part.strip() for part in _SENTENCE_END.split(text) if part.strip()]
+
+def _clauses(text):
+    return [part.strip() for part in _PUNCTUATION.split(text) if part.strip()]
+
+def _join(parts):
+    # Full-width punctuation (Chinese) is not followed by a space
+    text = ""
+    for part in parts:
+        text += part if not text or text[-1] in "、，。？！；：…" else " " + part
+    return text
+
+def _group(parts, size):
+    return [_join(parts[i:i + size]) for i in range(0, len(parts), size)]
+
+def _by_length(parts, max_chars):
+    fragments, current = [], ""
+    for part in parts:
+        current = _join((current, part)) if current else part
+        if len(current) >= max_chars:
+            fragments.append(current)
+            current = ""
+    if current:
+        fragments.append(current)
+    return fragments
+
+SPLIT_METHODS = {
+    "不切": lambda text: [text.strip()],
+    "凑四句一切": lambda text: _group(_clauses(text), 4),
+    "凑50字一切": lambda text: _by_length(_clauses(text), 50),
+    "按中文句号。切": lambda text: [part.strip() for part in re.split(r"(?<=。)", text) if part.strip()],
+    "按英文句号.切": lambda text: [part.strip() for part in re.split(r"(?<=\.)(?!\d)", text) if part.strip()],
+    "按标点符号切": _clauses,
+}
+
+def split_text(text: str, method: str = "凑四句一切") -> list:
+    """ Cuts text into the fragments GPT-SoVITS would synthesize one by one with the
+        given text_split_method. Unknown methods fall back to whole sentences."""
+    fragments = SPLIT_METHODS.get(method, _sentences)(text)
+    return [fragment for fragment in fragments if fragment.strip(PUNCTUATION + " ")] or [text.strip()]
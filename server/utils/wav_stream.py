@@ -0,0 +1,55 @@
+""" Incremental parsing of WAV audio streamed by the TTS backends (server only)"""
+import struct
+import numpy as np
+
+_RIFF_HEADER = struct.Struct("<4sI4s")
+_CHUNK_HEADER = struct.Struct("<4sI")
+_FMT = struct.Struct("<HHIIHH")
+
+class WavStreamParser:
+    """ Incremental parser for a 16-bit WAV byte stream arriving in arbitrary pieces
+        (e.g. a chunked HTTP body): feed() returns the int16 samples completed by each
+        piece once the header has been read. Streamed WAV headers carry a placeholder
+        data size, so the data chunk runs to the end of the stream.
+        raw_sample_rate: the stream is headerless PCM at this rate."""
+    def __init__(self, raw_sample_rate=None):
+        self._buffer = bytearray()
+        self.sample_rate = raw_sample_rate
+        self.channels = 1
+        self.header_done = raw_sample_rate is not None
+
+    def __parse_header__(self) -> bool:
+        if len(self._buffer) < _RIFF_HEADER.size:
+            return False
+        riff, _, wave_id = _RIFF_HEADER.unpack_from(self._buffer)
+        if riff != b"RIFF" or wave_id != b"WAVE":
+            raise ValueError("Not a RIFF/WAVE stream")
+        offset = _RIFF_HEADER.size
+        while len(self._buffer) >= offset + _CHUNK_HEADER.size:
+            chunk_id, size = _CHUNK_HEADER.unpack_from(self._buffer, offset)
+            offset += _CHUNK_HEADER.size
+            if chunk_id == b"data":
+                if self.sample_rate is None:
+                    raise ValueError("WAV data chunk before its fmt chunk")
+                del self._buffer[:offset]
+                self.header_done = True
+                return True
+            if len(self._buffer) < offset + size:
+                return False
+            if chunk_id == b"fmt ":
+                audio_format, self.channels, self.sample_rate, _, _, bits = _FMT.unpack_from(self._buffer, offset)
+                if audio_format not in (1, 0xFFFE) or bits != 16 or not self.channels:
+                    raise ValueError(f"Only 16-bit PCM WAV streams are supported (format {audio_format}, {bits} bits)")
+            offset += size + (size & 1)
+        return False
+
+    def feed(self, data) -> np.ndarray:
+        """ Adds received bytes, returns the whole frames (int16, channels interleaved)
+            they complete"""
+        self._buffer += data
+        if not self.header_done and not self.__parse_header__():
+            return np.zeros(0, dtype=np.int16)
+        usable = len(self._buffer) - len(self._buffer) % (2 * self.channels)
+        pcm = np.frombuffer(self._buffer, dtype="<i2", count=usable // 2).astype(np.int16)
+        del self._buffer[:usable]
+        return pcm
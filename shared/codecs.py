@@ -0,0 +1,264 @@
+""" Audio codecs for the client <-> server transport.
+
+    pcm16   uncompressed 16-bit PCM (the default, no container)
+    mulaw   G.711 mu-law, 8 bits per sample, table driven
+    adpcm   IMA-ADPCM, 4 bits per sample, in independent 505 sample blocks
+            (the mono block layout of IMA-ADPCM WAV files) coded in parallel
+    opus    optional, only when the opuslib package and libopus are installed
+
+    A negotiated codec other than pcm16 wraps every audio payload in a small
+    container (codec id, sample rate) so the receiver can always decode it, also
+    when the sender had to fall back to another codec (e.g. Opus at 32 kHz).
+
+    Shared by client and server, imported as shared.codecs.
+"""
+import io
+import struct
+import wave
+import numpy as np
+
+AUDIO_HEADER = struct.Struct("!BI")  # codec id, sample rate
+
+# ---------------------------------------------------------------------------- mu-law
+_MULAW_BIAS = 0x84
+_MULAW_CLIP = 32635
+
+def _build_mulaw_tables():
+    samples = np.arange(-32768, 32768, dtype=np.int32)
+    sign = np.where(samples < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(samples), _MULAW_CLIP) + _MULAW_BIAS
+    exponent = np.frexp(magnitude.astype(np.float64))[1] - 8
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    encode = (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+    # Index by the uint16 view of the sample
+    encode = np.roll(encode, -32768)
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    decoded = (((codes & 0x0F) << 3) + _MULAW_BIAS << exponent) - _MULAW_BIAS
+    decode = np.where(codes & 0x80, -decoded, decoded).astype(np.int16)
+    return encode, decode
+
+_MULAW_ENCODE, _MULAW_DECODE = _build_mulaw_tables()
+
+class MuLawCodec:
+    name = "mulaw"
+    codec_id = 1
+
+    def supports(self, sample_rate) -> bool:
+        return True
+
+    def encode(self, pcm: np.ndarray, sample_rate) -> bytes:
+        return _MULAW_ENCODE[pcm.view(np.uint16)].tobytes()
+
+    def decode(self, data, sample_rate) -> np.ndarray:
+        return _MULAW_DECODE[np.frombuffer(data, dtype=np.uint8)]
+
+# ---------------------------------------------------------------------------- IMA-ADPCM
+_IMA_STEPS = np.array([
+    7, 8, 9, 10, 11, 12, 13, 14, 16, 17, 19, 21, 23, 25, 28, 31, 34, 37, 41, 45,
+    50, 55, 60, 66, 73, 80, 88, 97, 107, 118, 130, 143, 157, 173, 190, 209, 230,
+    253, 279, 307, 337, 371, 408, 449, 494, 544, 598, 658, 724, 796, 876, 963,
+    1060, 1166, 1282, 1411, 1552, 1707, 1878, 2066, 2272, 2499, 2749, 3024, 3327,
+    3660, 4026, 4428, 4871, 5358, 5894, 6484, 7132, 7845, 8630, 9493, 10442, 11487,
+    12635, 13899, 15289, 16818, 18500, 20350, 22385, 24623, 27086, 29794, 32767], dtype=np.int32)
+_IMA_INDEX_SHIFT = np.array([-1, -1, -1, -1, 2, 4, 6, 8], dtype=np.int32)
+
+class IMAADPCMCodec:
+    """ Blocks are independent (each header holds the first sample and the step
+        index), so all blocks of a payload are coded at once and the per-sample loop
+        only runs over the length of one block."""
+    name = "adpcm"
+    codec_id = 2
+    BLOCK_ALIGN = 256
+    BLOCK_SAMPLES = (BLOCK_ALIGN - 4) * 2 + 1
+    COUNT = struct.Struct("!I")
+
+    def supports(self, sample_rate) -> bool:
+        return True
+
+    def encode(self, pcm: np.ndarray, sample_rate) -> bytes:
+        count = len(pcm)
+        n_blocks = max(1, -(-count // self.BLOCK_SAMPLES))
+        blocks = np.zeros((n_blocks, self.BLOCK_SAMPLES), dtype=np.int32)
+        blocks.reshape(-1)[:count] = pcm
+        predictor = blocks[:, 0].copy()
+        # Start each block with a step that can follow its first sample differences,
+        #   one code covers up to 1.75 steps
+        onset = np.abs(np.diff(blocks[:, :17], axis=1)).max(axis=1) / 1.5
+        index = np.clip(np.searchsorted(_IMA_STEPS, onset), 0, 88).astype(np.int32)
+        header = np.zeros((n_blocks, 4), dtype=np.uint8)
+        header[:, :2] = predictor.astype("<i2").view(np.uint8).reshape(-1, 2)
+        header[:, 2] = index
+        codes = np.empty((n_blocks, self.BLOCK_SAMPLES - 1), dtype=np.uint8)
+        for i in range(1, self.BLOCK_SAMPLES):
+            step = _IMA_STEPS[index]
+            diff = blocks[:, i] - predictor
+            code = np.where(diff < 0, 8, 0)
+            diff = np.abs(diff)
+            delta = step >> 3
+            for bit, part in ((4, step), (2, step >> 1), (1, step >> 2)):
+                hit = diff >= part
+                code |= np.where(hit, bit, 0)
+                diff -= np.where(hit, part, 0)
+                delta += np.where(hit, part, 0)
+            predictor = np.clip(np.where(code & 8, predictor - delta, predictor + delta), -32768, 32767)
+            index = np.clip(index + _IMA_INDEX_SHIFT[code & 7], 0, 88)
+            codes[:, i - 1] = code
+        packed = codes[:, 0::2] | (codes[:, 1::2] << 4)
+        return self.COUNT.pack(count) + np.concatenate((header, packed), axis=1).tobytes()
+
+    def decode(self, data, sample_rate) -> np.ndarray:
+        count = self.COUNT.unpack_from(data)[0]
+        blocks = np.frombuffer(data, dtype=np.uint8, offset=self.COUNT.size).reshape(-1, self.BLOCK_ALIGN)
+        predictor = blocks[:, :2].copy().view("<i2")[:, 0].astype(np.int32)
+        index = blocks[:, 2].astype(np.int32)
+        codes = np.empty((len(blocks), self.BLOCK_SAMPLES - 1), dtype=np.int32)
+        codes[:, 0::2] = blocks[:, 4:] & 0x0F
+        codes[:, 1::2] = blocks[:, 4:] >> 4
+        out = np.empty((len(blocks), self.BLOCK_SAMPLES), dtype=np.int16)
+        out[:, 0] = predictor
+        for i in range(1, self.BLOCK_SAMPLES):
+            step = _IMA_STEPS[index]
+            code = codes[:, i - 1]
+            delta = (step >> 3) + np.where(code & 4, step, 0) + np.where(code & 2, step >> 1, 0) \
+                + np.where(code & 1, step >> 2, 0)
+            predictor = np.clip(np.where(code & 8, predictor - delta, predictor + delta), -32768, 32767)
+            index = np.clip(index + _IMA_INDEX_SHIFT[code & 7], 0, 88)
+            out[:, i] = predictor
+        return out.reshape(-1)[:count]
+
+# ---------------------------------------------------------------------------- Opus
+class OpusCodec:
+    """ Opus through opuslib, in 20 ms frames each prefixed with its length"""
+    name = "opus"
+    codec_id = 3
+    RATES = (8000, 12000, 16000, 24000, 48000)
+    FRAME_LENGTH = struct.Struct("!H")
+
+    def __init__(self):
+        import opuslib
+        self.opuslib = opuslib
+
+    def supports(self, sample_rate) -> bool:
+        return sample_rate in self.RATES
+
+    def encode(self, pcm: np.ndarray, sample_rate) -> bytes:
+        encoder = self.opuslib.Encoder(sample_rate, 1, self.opuslib.APPLICATION_VOIP)
+        frame = sample_rate // 50
+        padded = np.zeros(-(-len(pcm) // frame) * frame, dtype=np.int16)
+        padded[:len(pcm)] = pcm
+        chunks = [IMAADPCMCodec.COUNT.pack(len(pcm))]
+        for start in range(0, len(padded), frame):
+            packet = encoder.encode(padded[start:start + frame].tobytes(), frame)
+            chunks.append(self.FRAME_LENGTH.pack(len(packet)) + packet)
+        return b"".join(chunks)
+
+    def decode(self, data, sample_rate) -> np.ndarray:
+        decoder = self.opuslib.Decoder(sample_rate, 1)
+        frame = sample_rate // 50
+        count = IMAADPCMCodec.COUNT.unpack_from(data)[0]
+        offset = IMAADPCMCodec.COUNT.size
+        pcm = []
+        while offset < len(data):
+            length = self.FRAME_LENGTH.unpack_from(data, offset)[0]
+            offset += self.FRAME_LENGTH.size
+            pcm.append(decoder.decode(bytes(data[offset:offset + length]), frame))
+            offset += length
+        return np.frombuffer(b"".join(pcm), dtype=np.int16)[:count]
+
+class PCM16Codec:
+    name = "pcm16"
+    codec_id = 0
+
+    def supports(self, sample_rate) -> bool:
+        return True
+
+    def encode(self, pcm: np.ndarray, sample_rate) -> bytes:
+        return pcm.astype("<i2", copy=False).tobytes()
+
+    def decode(self, data, sample_rate) -> np.ndarray:
+        return np.frombuffer(data, dtype="<i2").astype(np.int16, copy=False)
+
+# ---------------------------------------------------------------------------- registry
+CODECS = {codec.name: codec for codec in (PCM16Codec(), MuLawCodec(), IMAADPCMCodec())}
+try:
+    CODECS["opus"] = OpusCodec()
+except Exception:
+    # opuslib missing or libopus not found
+    pass
+_CODECS_BY_ID = {codec.codec_id: codec for codec in CODECS.values()}
+# Fallback order when the negotiated codec cannot handle a sample rate
+_FALLBACK = ("adpcm", "mulaw", "pcm16")
+
+def available_codecs() -> list:
+    """ Codec names usable in this process, best compression first"""
+    return [name for name in ("opus", "adpcm", "mulaw", "pcm16") if name in CODECS]
+
+def negotiate(offered) -> str:
+    """ First codec of the peer's preference list that is available here"""
+    return next((name for name in offered if name in CODECS), "pcm16")
+
+def pack_audio(codec_name: str, pcm: np.ndarray, sample_rate: int) -> bytes:
+    """ Encodes int16 samples into a self-describing payload"""
+    codec = CODECS[codec_name]
+    if not codec.supports(sample_rate):
+        codec = next(CODECS[name] for name in _FALLBACK if CODECS[name].supports(sample_rate))
+    return AUDIO_HEADER.pack(codec.codec_id, sample_rate) + codec.encode(np.asarray(pcm, dtype=np.int16), sample_rate)
+
+def unpack_audio(payload) -> tuple:
+    """ (int16 samples, sample rate) of a pack_audio payload"""
+    codec_id, sample_rate = AUDIO_HEADER.unpack_from(payload)
+    codec = _CODECS_BY_ID.get(codec_id)
+    if codec is None:
+        raise ValueError(f"Unknown or unavailable codec id {codec_id}")
+    return codec.decode(memoryview(payload)[AUDIO_HEADER.size:], sample_rate), sample_rate
+
+_RIFF_HEADER = struct.Struct("<4sI4s")
+_CHUNK_HEADER = struct.Struct("<4sI")
+_FMT = struct.Struct("<HHIIHH")
+
+def wav_info(data) -> tuple:
+    """ (sample rate, channels, sample width, data offset, data length) of a PCM WAV
+        file, read from the header in place so data can be any bytes-like object
+        (e.g. a memoryview of a receive buffer). Raises ValueError when it is not WAV."""
+    if len(data) < _RIFF_HEADER.size:
+        raise ValueError("Too short for a WAV file")
+    riff, _, wave_id = _RIFF_HEADER.unpack_from(data)
+    if riff != b"RIFF" or wave_id != b"WAVE":
+        raise ValueError("Not a RIFF/WAVE file")
+    offset = _RIFF_HEADER.size
+    fmt = None
+    while offset + _CHUNK_HEADER.size <= len(data):
+        chunk_id, size = _CHUNK_HEADER.unpack_from(data, offset)
+        offset += _CHUNK_HEADER.size
+        if chunk_id == b"fmt ":
+            fmt = _FMT.unpack_from(data, offset)
+        elif chunk_id == b"data":
+            if fmt is None:
+                raise ValueError("WAV data chunk before its fmt chunk")
+            audio_format, channels, sample_rate, _, _, bits = fmt
+            if audio_format not in (1, 0xFFFE) or not channels or bits < 8:
+                raise ValueError(f"Unsupported WAV format {audio_format} ({channels} channels, {bits} bits)")
+            # Streamed WAV files may carry a placeholder size, trust the bytes received
+            length = min(size, len(data) - offset)
+            return sample_rate, channels, bits // 8, offset, length - length % (channels * bits // 8)
+        offset += size + (size & 1)
+    raise ValueError("WAV file without a data chunk")
+
+def wav_to_pcm16(wav_bytes) -> tuple:
+    """ (int16 samples, sample rate) of a mono 16-bit WAV file. The samples are a
+        read-only view of wav_bytes, not a copy."""
+    sample_rate, channels, sample_width, offset, length = wav_info(wav_bytes)
+    if sample_width != 2 or channels != 1:
+        raise ValueError("Only mono 16-bit WAV can be re-encoded")
+    return np.frombuffer(wav_bytes, dtype="<i2", count=length // 2, offset=offset), sample_rate
+
+def pcm16_to_wav(pcm: np.ndarray, sample_rate: int) -> bytes:
+    """ Mono 16-bit WAV file of int16 samples"""
+    with io.BytesIO() as wav_bytes:
+        with wave.open(wav_bytes, "wb") as wf:
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(sample_rate)
+            wf.writeframes(np.asarray(pcm, dtype="<i2").tobytes())
+        return wav_bytes.getvalue()
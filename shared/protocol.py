@@ -0,0 +1,116 @@
+""" Framed binary wire protocol (v2) between AudioSocketClient and the servers.
+
+    Every message is a fixed 24 byte header followed by the payload:
+
+        magic    2s   b"S2"
+        version  B    2
+        type     B    MessageType
+        session  I    session id assigned by the server (0 before WELCOME)
+        seq      I    per-direction sequence number
+        time     d    sender's time.time() when the frame was built
+        length   I    payload length in bytes
+
+    The client opens with HELLO (JSON capabilities), the server answers WELCOME (JSON
+    with the session id). A connection whose first bytes are not a v2 header is
+    served in the legacy format: raw int16 PCM upstream, length prefixed (!Q) audio
+    downstream.
+
+    Shared by client and server: both entry points put the repository root on
+    sys.path and import it as shared.protocol.
+"""
+import json
+import struct
+import time
+from enum import IntEnum
+from typing import NamedTuple
+
+MAGIC = b"S2"
+VERSION = 2
+HEADER = struct.Struct("!2sBBIIdI")
+# Downstream header of the legacy format
+LEGACY_HEADER = struct.Struct("!Q")
+MAX_PAYLOAD = 64 << 20
+
+class MessageType(IntEnum):
+    HELLO = 1       # client -> server, JSON capabilities
+    WELCOME = 2     # server -> client, JSON with the session id
+    AUDIO = 3       # int16 PCM up / WAV down, or a codecs.py container when negotiated
+    PARTIAL = 4     # server -> client, JSON partial transcript
+    TRANSCRIPT = 5  # server -> client, JSON final transcript and translation
+    CONTROL = 6     # JSON control / timing message, either direction
+    ERROR = 7       # JSON {"message": ...}
+    BYE = 8         # either direction, closes the session
+
+class ProtocolError(Exception):
+    """ Raised on malformed frames"""
+
+class Frame(NamedTuple):
+    type: MessageType
+    session_id: int
+    seq: int
+    timestamp: float
+    payload: bytes
+
+    def json(self):
+        """ Decoded JSON payload, raises ProtocolError when it is not JSON"""
+        try:
+            return json.loads(self.payload.decode("utf-8")) if self.payload else {}
+        except ValueError as e:
+            raise ProtocolError(f"Bad JSON payload in {self.type.name}: {e}") from e
+
+def encode_frame(msg_type, payload=b"", session_id=0, seq=0, timestamp=None) -> bytes:
+    """ Header + payload of one frame"""
+    if len(payload) > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload of {len(payload)} bytes exceeds {MAX_PAYLOAD}")
+    header = HEADER.pack(MAGIC, VERSION, int(msg_type), session_id, seq & 0xFFFFFFFF,
+                         time.time() if timestamp is None else timestamp, len(payload))
+    return header + bytes(payload)
+
+def encode_json(msg_type, message: dict, **frame_fields) -> bytes:
+    return encode_frame(msg_type, json.dumps(message, ensure_ascii=False).encode("utf-8"), **frame_fields)
+
+def is_v2_preamble(data) -> bool:
+    """ True when data starts like a v2 frame, used to tell v2 from legacy connections"""
+    return bytes(data[:3]) == MAGIC + bytes((VERSION,))
+
+def decode_header(header) -> tuple:
+    """ (type, session_id, seq, timestamp, length) of a HEADER.size byte header"""
+    magic, version, msg_type, session_id, seq, timestamp, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ProtocolError(f"Bad magic {magic!r}")
+    if version != VERSION:
+        raise ProtocolError(f"Unsupported protocol version {version}")
+    if length > MAX_PAYLOAD:
+        raise ProtocolError(f"Payload of {length} bytes exceeds {MAX_PAYLOAD}")
+    try:
+        msg_type = MessageType(msg_type)
+    except ValueError as e:
+        raise ProtocolError(f"Unknown message type {msg_type}") from e
+    return msg_type, session_id, seq, timestamp, length
+
+class FrameDecoder:
+    """ Incremental decoder for a byte stream cut at arbitrary points by recv()"""
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data) -> list:
+        """ Adds received bytes, returns the frames completed by them"""
+        self._buffer += data
+        frames = []
+        offset = 0
+        while len(self._buffer) - offset >= HEADER.size:
+            msg_type, session_id, seq, timestamp, length = \
+                decode_header(self._buffer[offset:offset + HEADER.size])
+            end = offset + HEADER.size + length
+            if len(self._buffer) < end:
+                break
+            frames.append(Frame(msg_type, session_id, seq, timestamp,
+                                bytes(self._buffer[offset + HEADER.size:end])))
+            offset = end
+        del self._buffer[:offset]
+        return frames
+
+    @property
+    def pending(self) -> int:
+        """ Bytes of an incomplete frame waiting for more data"""
+        return len(self._buffer)